@@ -0,0 +1 @@
+"""Benchmarks of pycrunch, run against the in-process pycrunch.fakeapi."""
@@ -0,0 +1,176 @@
+"""End-to-end load benchmarks of pycrunch workflows against a fake API.
+
+Each workflow (connecting, appending rows, fetching a dataframe, a cube,
+or an export) is timed against a pycrunch.fakeapi.FakeServer holding
+a dataset of each of the given sizes, from each of the given numbers of
+concurrent threads sharing one session:
+
+    $ python -m benchmarks.load --sizes 1000 100000 --concurrency 1 8
+    $ python -m benchmarks.load --workflows cube export --latency 0.02 --json out.json
+
+The fake API can add latency to, and fail a fraction of, its responses
+(the session then retries them with a lemonpy.RetryPolicy; by default
+they fail with 429, which is retried whatever the method). For each
+combination, the number of operations, their throughput (per second)
+and their latency percentiles (in milliseconds) are printed, and
+written to the --json file if given.
+"""
+
+from __future__ import division, print_function
+
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pycrunch
+from pycrunch import cubes, exporting, fakeapi, importing
+from pycrunch.lemonpy import RetryPolicy
+from pycrunch.progress import DefaultProgressTracking
+
+EMAIL, PASSWORD = "bench@example.com", "secret"
+APPEND_ROWS = 100
+
+
+class Context(object):
+    """The server, and the site and dataset (via one session), of a run."""
+
+    def __init__(self, server, session_kwargs):
+        self.server = server
+        self.session_kwargs = session_kwargs
+        self.site = pycrunch.connect(EMAIL, PASSWORD, server.url, **session_kwargs)
+        self.ds = self.site.datasets.by("name")["bench"].entity
+
+
+def connect(ctx):
+    return pycrunch.connect(EMAIL, PASSWORD, ctx.server.url, **ctx.session_kwargs)
+
+
+def append_rows(ctx):
+    rows = [[i, 1 + i % 2, i / 10, "appended %d" % i] for i in range(APPEND_ROWS)]
+    return importing.Importer(frequency=0).append_rows(ctx.ds, rows)
+
+
+def dataframe(ctx):
+    from pycrunch import pandaslib
+    return pandaslib.dataframe(ctx.ds)
+
+
+def cube(ctx):
+    answer = ctx.ds.variables.by("alias")["answer"].entity_url.absolute
+    return cubes.fetch_cube(ctx.ds, [answer], count=cubes.count())
+
+
+def export(ctx):
+    return exporting.export_dataset(ctx.ds, {}, format="csv")
+
+
+WORKFLOWS = {
+    "connect": connect,
+    "append_rows": append_rows,
+    "dataframe": dataframe,
+    "cube": cube,
+    "export": export,
+}
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+def run(workflow, ctx, concurrency, iterations):
+    """Run the workflow 'iterations' times on each of 'concurrency' threads."""
+    func = WORKFLOWS[workflow]
+
+    def worker(n):
+        timings = []
+        for i in range(iterations):
+            start = time.time()
+            func(ctx)
+            timings.append(time.time() - start)
+        return timings
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        timings = sum(executor.map(worker, range(concurrency)), [])
+    elapsed = time.time() - start
+    return {
+        "operations": len(timings),
+        "seconds": elapsed,
+        "throughput": len(timings) / elapsed,
+        "p50_ms": percentile(timings, 0.5) * 1000,
+        "p95_ms": percentile(timings, 0.95) * 1000,
+        "max_ms": max(timings) * 1000,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--workflows", nargs="+", default=sorted(WORKFLOWS),
+                        choices=sorted(WORKFLOWS))
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 10000],
+                        help="rows in the dataset")
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 16],
+                        help="threads sharing the session")
+    parser.add_argument("--iterations", type=int, default=5,
+                        help="operations per thread")
+    parser.add_argument("--latency", type=float, default=0,
+                        help="seconds the fake API waits before each response")
+    parser.add_argument("--error-rate", type=float, default=0,
+                        help="fraction of responses which fail")
+    parser.add_argument("--error-status", type=int, default=429,
+                        help="the status of failed responses")
+    parser.add_argument("--transport", default=None,
+                        help="one of pycrunch.transports.TRANSPORTS")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args(argv)
+
+    if "dataframe" in args.workflows:
+        try:
+            import pandas  # noqa: F401
+        except ImportError:
+            print("pandas is not installed; skipping the dataframe workflow")
+            args.workflows.remove("dataframe")
+
+    session_kwargs = {
+        "thread_safe": True,
+        "pool_maxsize": max(args.concurrency),
+        "transport": args.transport,
+        "progress_tracking": DefaultProgressTracking(interval=0),
+    }
+    if args.error_rate:
+        session_kwargs["retry_policy"] = RetryPolicy(
+            max_retries=10, backoff_factor=0.01, breaker_threshold=None)
+
+    results = []
+    print("%-12s %8s %5s %6s %10s %9s %9s" % (
+        "workflow", "rows", "conc", "ops", "ops/s", "p50 ms", "p95 ms"))
+    for size in args.sizes:
+        app = fakeapi.FakeCrunchAPI(latency=args.latency, error_rate=args.error_rate,
+                                    error_status=args.error_status)
+        with fakeapi.FakeServer(app) as server:
+            for workflow in args.workflows:
+                for concurrency in args.concurrency:
+                    # A fresh dataset for each run, so appends don't accumulate.
+                    app.add_dataset("bench", rows=size)
+                    ctx = Context(server, session_kwargs)
+                    result = run(workflow, ctx, concurrency, args.iterations)
+                    result.update(workflow=workflow, rows=size, concurrency=concurrency)
+                    results.append(result)
+                    print("%-12s %8d %5d %6d %10.1f %9.1f %9.1f" % (
+                        workflow, size, concurrency, result["operations"],
+                        result["throughput"], result["p50_ms"], result["p95_ms"]))
+                    sys.stdout.flush()
+                    for ds_id in list(app.datasets):
+                        del app.datasets[ds_id]
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
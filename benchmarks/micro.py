@@ -0,0 +1,494 @@
+"""Microbenchmarks of the CPU hot paths of pycrunch.
+
+Each benchmark times one operation on synthetic fixtures of a given
+scale, entirely offline, and measures the memory it allocates:
+
+    $ python -m benchmarks.micro
+    $ python -m benchmarks.micro --scale medium --only parse_catalog index --json after.json
+    $ python -m benchmarks.micro --json after.json --compare before.json
+
+For each benchmark the best and median time per operation (over a number
+of repeats), the peak memory traced by tracemalloc during one operation,
+and the memory still held once it returned, are printed, and written to
+the --json file if given. With --compare, each time is also shown as
+a ratio to that of the same benchmark in an earlier JSON file.
+
+The scales set the number of variables and of table cells:
+
+    small    100 variables,     10,000 cells
+    medium   10,000 variables,  1,000,000 cells
+    large    100,000 variables, 10,000,000 cells
+"""
+
+from __future__ import division, print_function
+
+import argparse
+import copy
+import json
+import platform
+import random
+import sys
+import time
+
+try:
+    import tracemalloc
+except ImportError:  # pragma: no cover
+    tracemalloc = None
+
+import pycrunch
+from pycrunch import csvlib, elements, expressions, jsonlib, shoji
+from pycrunch.lemonpy import URL
+from pycrunch.tests.stubs import StubAdapter
+
+timer = getattr(time, "perf_counter", time.time)
+
+SCALES = {
+    "small": {"variables": 100, "cells": 10 ** 4},
+    "medium": {"variables": 10 ** 4, "cells": 10 ** 6},
+    "large": {"variables": 10 ** 5, "cells": 10 ** 7},
+}
+
+API = "http://api.test/api/"
+DATASET = API + "datasets/abc/"
+CATEGORIES = [
+    {"id": 1, "name": "Yes", "numeric_value": 1, "missing": False},
+    {"id": 2, "name": "No", "numeric_value": 0, "missing": False},
+    {"id": -1, "name": "No Data", "numeric_value": None, "missing": True},
+]
+EXPRESSION = (
+    "(age > 30 and gender in [1, 2]) or "
+    "(not score == 5 and age <= 60) or "
+    "rating.has_any([1, 2]) and region != 'north'"
+)
+
+
+# -------------------------------- Fixtures -------------------------------- #
+
+def variable_defs(n):
+    """Return n variable definitions, in Crunch's table metadata shape."""
+    defs = {}
+    for i in range(n):
+        var_id = "%06x" % i
+        kind = ("categorical", "numeric", "text")[i % 3]
+        var = {
+            "id": var_id, "alias": "var_%d" % i, "name": "Variable %d" % i,
+            "type": kind, "description": "The %dth variable" % i,
+            "discarded": False, "notes": "",
+        }
+        if kind == "categorical":
+            var["categories"] = CATEGORIES
+        defs[var_id] = var
+    for alias, kind in (("age", "numeric"), ("gender", "categorical"),
+                        ("score", "numeric"), ("rating", "categorical"),
+                        ("region", "text")):
+        defs[alias] = {"id": alias, "alias": alias, "name": alias.title(),
+                       "type": kind, "categories": CATEGORIES}
+    return defs
+
+
+def catalog_json(n):
+    """Return a shoji:catalog of the variables of a dataset, as JSON text."""
+    index = dict(
+        ("%s/" % var_id, {
+            "alias": var["alias"], "name": var["name"], "type": var["type"],
+            "id": var_id, "description": var.get("description", ""),
+            "discarded": False, "derived": False,
+        })
+        for var_id, var in variable_defs(n).items()
+    )
+    return jsonlib.dumps({
+        "element": "shoji:catalog",
+        "self": DATASET + "variables/",
+        "orders": {"hier": DATASET + "variables/hier/"},
+        "index": index,
+    })
+
+
+def column(vardef, rows, rand):
+    kind = vardef["type"]
+    if kind == "categorical":
+        return [rand.choice((1, 2, {"?": -1})) for i in range(rows)]
+    if kind == "numeric":
+        return [round(rand.random() * 100, 2) if i % 50 else {"?": -1}
+                for i in range(rows)]
+    return ["row %d" % i for i in range(rows)]
+
+
+def table_json(cells, columns=20):
+    """Return a crunch:table of 'cells' cells (in 'columns' columns) as JSON text."""
+    rand = random.Random(cells)
+    defs = variable_defs(columns)
+    rows = max(cells // len(defs), 1)
+    return jsonlib.dumps({
+        "element": "crunch:table",
+        "self": DATASET + "table/",
+        "metadata": defs,
+        "data": dict((var_id, column(var, rows, rand)) for var_id, var in defs.items()),
+    })
+
+
+def offline_session(responses):
+    """Return an ElementSession which answers GETs from a {url: body} dict."""
+    session = pycrunch.Session(token="bench")
+
+    def respond(request):
+        return 200, {"Content-Type": "application/json"}, \
+            responses[request.url.split("?")[0]]
+    session.mount(API, StubAdapter(respond))
+    return session
+
+
+# ------------------------------- Benchmarks ------------------------------- #
+
+class Benchmark(object):
+    """One timed operation.
+
+    setup(scale) builds the fixtures (untimed) and returns a dict of
+    parameters describing them. prepare() returns the argument of each
+    run (untimed; for operations which consume their input), and run(arg)
+    is the operation which is timed.
+    """
+
+    name = None
+
+    def setup(self, scale):
+        return {}
+
+    def prepare(self):
+        return None
+
+    def run(self, arg):
+        raise NotImplementedError
+
+
+class ParseCatalog(Benchmark):
+    """elements.parse_element of the decoded JSON of a variables catalog."""
+
+    name = "parse_catalog"
+
+    def setup(self, scale):
+        self.session = pycrunch.Session(token="bench")
+        self.decoded = jsonlib.loads(catalog_json(scale["variables"]))
+        return {"variables": scale["variables"]}
+
+    def prepare(self):
+        return copy.deepcopy(self.decoded)
+
+    def run(self, j):
+        return elements.parse_element(self.session, j)
+
+
+class DecodeAndParseCatalog(ParseCatalog):
+    """jsonlib.loads and then elements.parse_element of a variables catalog."""
+
+    name = "decode_parse_catalog"
+
+    def setup(self, scale):
+        self.session = pycrunch.Session(token="bench")
+        self.text = catalog_json(scale["variables"])
+        return {"variables": scale["variables"], "bytes": len(self.text)}
+
+    def prepare(self):
+        return self.text
+
+    def run(self, text):
+        return elements.parse_element(self.session, jsonlib.loads(text))
+
+
+class DecodeElementsCatalog(DecodeAndParseCatalog):
+    """jsonlib.loads of a variables catalog with elements.element_hook."""
+
+    name = "decode_hook_catalog"
+
+    def run(self, text):
+        return jsonlib.loads(text, object_hook=elements.element_hook(self.session))
+
+
+class ParseTable(Benchmark):
+    """elements.parse_element of the decoded JSON of a crunch:table."""
+
+    name = "parse_table"
+
+    def setup(self, scale):
+        self.session = pycrunch.Session(token="bench")
+        self.decoded = jsonlib.loads(table_json(scale["cells"]))
+        return {"cells": scale["cells"]}
+
+    def prepare(self):
+        return copy.deepcopy(self.decoded)
+
+    def run(self, j):
+        return elements.parse_element(self.session, j)
+
+
+class DecodeElementsTable(Benchmark):
+    """jsonlib.loads of a crunch:table with elements.element_hook."""
+
+    name = "decode_hook_table"
+
+    def setup(self, scale):
+        self.session = pycrunch.Session(token="bench")
+        self.text = table_json(scale["cells"])
+        return {"cells": scale["cells"], "bytes": len(self.text)}
+
+    def run(self, arg):
+        return jsonlib.loads(self.text, object_hook=elements.element_hook(self.session))
+
+
+class BuildIndex(Benchmark):
+    """shoji.Index construction from the (parsed) tuples of a catalog."""
+
+    name = "index"
+
+    def setup(self, scale):
+        self.session = pycrunch.Session(token="bench")
+        catalog = jsonlib.loads(catalog_json(scale["variables"]))
+        self.index = dict(
+            (url, elements.JSONObject(**tup)) for url, tup in catalog["index"].items())
+        self.url = URL(catalog["self"], "")
+        return {"variables": scale["variables"]}
+
+    def prepare(self):
+        # Index adopts the given tuples; give it fresh ones each time.
+        return dict((url, tup.copy()) for url, tup in self.index.items())
+
+    def run(self, index):
+        return shoji.Index(self.session, self.url, **index)
+
+
+class CatalogBy(Benchmark):
+    """Catalog.by("alias") of a variables catalog, building the index."""
+
+    name = "catalog_by"
+
+    def setup(self, scale):
+        session = pycrunch.Session(token="bench")
+        self.catalog = elements.parse_element(
+            session, jsonlib.loads(catalog_json(scale["variables"])))
+        return {"variables": scale["variables"]}
+
+    def prepare(self):
+        self.catalog.invalidate_indexes()
+
+    def run(self, arg):
+        return self.catalog.by("alias")
+
+
+class CatalogByMemoized(CatalogBy):
+    """Catalog.by("alias") of a variables catalog, once it has been built."""
+
+    name = "catalog_by_memoized"
+
+    def prepare(self):
+        return None
+
+
+class RowsAsCSV(Benchmark):
+    """csvlib.rows_as_csv_file of rows of mixed values."""
+
+    name = "rows_as_csv"
+
+    def setup(self, scale):
+        rand = random.Random(0)
+        columns = 10
+        self.rows = [
+            [i, rand.random(), None if i % 7 == 0 else "text %d" % i, 1, 2.5,
+             u"caf\xe9", None, i * 2, "x", rand.randint(0, 9)][:columns]
+            for i in range(scale["cells"] // columns)
+        ]
+        return {"cells": scale["cells"]}
+
+    def run(self, arg):
+        return csvlib.rows_as_csv_file(self.rows)
+
+
+class ParseExpr(Benchmark):
+    """expressions.parse_expr of a compound filter expression."""
+
+    name = "parse_expr"
+
+    def setup(self, scale):
+        return {"length": len(EXPRESSION)}
+
+    def run(self, arg):
+        return expressions.parse_expr(EXPRESSION)
+
+
+class ProcessExpr(Benchmark):
+    """expressions.process_expr, resolving aliases via the dataset table."""
+
+    name = "process_expr"
+
+    def setup(self, scale):
+        metadata = variable_defs(scale["variables"])
+        session = offline_session({
+            DATASET: jsonlib.dumps({
+                "element": "shoji:entity", "self": DATASET, "body": {},
+                "fragments": {"table": DATASET + "table/"},
+            }),
+            DATASET + "table/": jsonlib.dumps({
+                "element": "crunch:table", "metadata": metadata, "data": {}}),
+        })
+        self.ds = session.get(DATASET).payload
+        self.expr = expressions.parse_expr(EXPRESSION)
+        return {"variables": scale["variables"]}
+
+    def prepare(self):
+        return copy.deepcopy(self.expr)
+
+    def run(self, expr):
+        return expressions.process_expr(expr, self.ds)
+
+
+class Prettify(Benchmark):
+    """expressions.prettify of a parsed compound expression."""
+
+    name = "prettify"
+
+    def setup(self, scale):
+        self.expr = expressions.parse_expr(EXPRESSION)
+        return {}
+
+    def run(self, arg):
+        return expressions.prettify(self.expr)
+
+
+class SeriesFromVariable(Benchmark):
+    """pandaslib.series_from_variable of categorical and numeric columns."""
+
+    name = "series_from_variable"
+
+    def setup(self, scale):
+        from pycrunch import pandaslib
+        self.series_from_variable = pandaslib.series_from_variable
+        rand = random.Random(0)
+        rows = scale["cells"] // 2
+        self.columns = [
+            (column({"type": t}, rows, rand),
+             elements.JSONObject(type=t, categories=CATEGORIES))
+            for t in ("categorical", "numeric")
+        ]
+        return {"cells": rows * 2}
+
+    def run(self, arg):
+        return [self.series_from_variable(col, vardef) for col, vardef in self.columns]
+
+
+BENCHMARKS = [
+    ParseCatalog, DecodeAndParseCatalog, DecodeElementsCatalog, ParseTable,
+    DecodeElementsTable, BuildIndex, CatalogBy, CatalogByMemoized,
+    RowsAsCSV, ParseExpr, ProcessExpr, Prettify, SeriesFromVariable,
+]
+
+
+# --------------------------------- Runner --------------------------------- #
+
+def measure(bench, repeat, min_time):
+    """Return a dict of the timings and allocations of the given benchmark.
+
+    Each of the 'repeat' repeats runs the operation as many times as
+    fit in 'min_time' seconds (at least once); the time per operation
+    of the fastest and the median repeat are reported.
+    """
+    bench.run(bench.prepare())  # Warm up caches.
+
+    per_op = []
+    ops = 0
+    for r in range(repeat):
+        spent = 0.0
+        n = 0
+        while n == 0 or spent < min_time:
+            arg = bench.prepare()
+            start = timer()
+            bench.run(arg)
+            spent += timer() - start
+            n += 1
+        per_op.append(spent / n)
+        ops += n
+    per_op.sort()
+
+    result = {
+        "ops": ops,
+        "best_s": per_op[0],
+        "median_s": per_op[len(per_op) // 2],
+    }
+    if tracemalloc is not None:
+        arg = bench.prepare()
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            out = bench.run(arg)
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        del out
+        result["peak_bytes"] = peak - before
+        result["retained_bytes"] = current - before
+    return result
+
+
+def load_baseline(path):
+    with open(path) as f:
+        data = json.load(f)
+    return dict(
+        ((r["name"], r["scale"]), r) for r in data["results"]
+    )
+
+
+def main(argv=None):
+    names = [b.name for b in BENCHMARKS]
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--scale", nargs="+", default=["small"], choices=sorted(SCALES))
+    parser.add_argument("--only", nargs="+", choices=names, help="benchmarks to run")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2,
+                        help="minimum seconds per repeat")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="a JSON file of earlier results")
+    args = parser.parse_args(argv)
+
+    baseline = load_baseline(args.compare) if args.compare else {}
+    results = []
+    print("%-22s %-7s %12s %12s %12s %12s%s" % (
+        "benchmark", "scale", "best ms", "median ms", "peak KiB", "kept KiB",
+        "   vs base" if baseline else ""))
+    for scale_name in args.scale:
+        scale = SCALES[scale_name]
+        for cls in BENCHMARKS:
+            if args.only and cls.name not in args.only:
+                continue
+            bench = cls()
+            try:
+                params = bench.setup(scale)
+            except ImportError as exc:
+                print("%-22s %-7s skipped: %s" % (cls.name, scale_name, exc))
+                continue
+            result = measure(bench, args.repeat, args.min_time)
+            result.update(name=cls.name, scale=scale_name, params=params)
+            results.append(result)
+
+            ratio = ""
+            base = baseline.get((cls.name, scale_name))
+            if base is not None:
+                ratio = "   %8.2fx" % (result["median_s"] / base["median_s"])
+            print("%-22s %-7s %12.3f %12.3f %12s %12s%s" % (
+                cls.name, scale_name,
+                result["best_s"] * 1000, result["median_s"] * 1000,
+                "%.1f" % (result["peak_bytes"] / 1024) if "peak_bytes" in result else "-",
+                "%.1f" % (result["retained_bytes"] / 1024) if "retained_bytes" in result else "-",
+                ratio))
+            sys.stdout.flush()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "pycrunch": pycrunch.__version__,
+                "args": vars(args),
+                "results": results,
+            }, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
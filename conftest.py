@@ -0,0 +1,9 @@
+import sys
+
+collect_ignore = []
+if sys.version_info < (3, 5):
+    # async/await syntax is not available.
+    collect_ignore += [
+        'pycrunch/asynclib.py',
+        'pycrunch/tests/test_asynclib.py',
+    ]
@@ -188,6 +188,7 @@ from pycrunch import elements
 from pycrunch import shoji
 from pycrunch.shoji import TaskError, TaskProgressTimeoutError
 from pycrunch import importing
+from pycrunch import variables
 from pycrunch.lemonpy import ClientError, ServerError, urljoin
 from pycrunch.version import __version__
 
@@ -204,7 +205,8 @@ __all__ = [
     'urljoin',
     'connect', 'connect_with_token',
     'csvlib',
-    'datasets'
+    'datasets',
+    'variables'
 ]
 
 
@@ -220,38 +222,68 @@ class CrunchTable(elements.Document):
 session = None
 
 
-def connect(user, pw, site_url="https://app.crunch.io/api/", progress_tracking=None):
+def _connect(sess, site_url, warm_connections, prefetch):
+    """GET the site_url with the given session and return its payload."""
+    global session
+    if warm_connections:
+        sess.warm_up(site_url, warm_connections)
+    ret = sess.get(site_url).payload
+    if prefetch:
+        ret.prefetch(prefetch)
+    if session is None:
+        session = ret
+    return ret
+
+
+def connect(user, pw, site_url="https://app.crunch.io/api/", progress_tracking=None,
+            warm_connections=0, prefetch=(), **session_kwargs):
     """
     Log in to Crunch with a user/pw; return the top-level Site payload.  Using
     this or the other connect method (the first time only) stores a reference
     to the session created in pycrunch.session for future use.
 
+    If 'warm_connections' is given, that many connections to the site are
+    opened (concurrently) before the first request, and kept in the pool
+    for those which follow. 'prefetch' may name links of the site, such as
+    ["datasets", "user_url"], to GET in the background as soon as the site
+    is loaded (see elements.Document.prefetch); the session is then made
+    thread_safe unless that is passed explicitly.
+
+    Any additional keyword arguments (such as pool_maxsize or thread_safe)
+    are passed to the new Session.
+
     Returns the API Root Entity, or errors if unable to connect.
     """
-    global session
-    ret = Session(user, pw, progress_tracking=progress_tracking).get(site_url).payload
-    if session is None:
-        session = ret
-    return ret
+    if prefetch:
+        session_kwargs.setdefault("thread_safe", True)
+    sess = Session(
+        user, pw, progress_tracking=progress_tracking, **session_kwargs
+    )
+    return _connect(sess, site_url, warm_connections, prefetch)
 
 
-def connect_with_token(token, site_url="https://us.crunch.io/api/", progress_tracking=None):
+def connect_with_token(token, site_url="https://us.crunch.io/api/", progress_tracking=None,
+                       warm_connections=0, prefetch=(), **session_kwargs):
     """
     Log in to Crunch with a token; return the top-level Site payload. Using
     this or the other connect method (the first time only) stores a reference
     to the session created in pycrunch.session for future use.
 
+    The 'warm_connections' and 'prefetch' arguments are as for connect.
+    Any additional keyword arguments (such as pool_maxsize or thread_safe)
+    are passed to the new Session.
+
     Returns the API Root Entity, or errors if unable to connect.
     """
-    global session
-    ret = Session(
+    if prefetch:
+        session_kwargs.setdefault("thread_safe", True)
+    sess = Session(
         token=token,
         domain=urllib.parse.urlparse(site_url).netloc,
-        progress_tracking=progress_tracking
-    ).get(site_url).payload
-    if session is None:
-        session = ret
-    return ret
+        progress_tracking=progress_tracking,
+        **session_kwargs
+    )
+    return _connect(sess, site_url, warm_connections, prefetch)
 
 
 def get_dataset(dataset_name_or_id, site=None):
@@ -0,0 +1,293 @@
+"""Asyncio support for pycrunch.
+
+ElementSession is a blocking requests.Session, so every in-flight request
+ties up a thread. AsyncElementSession performs its requests with aiohttp
+on an asyncio event loop instead, so thousands of concurrent requests
+can share a single thread:
+
+    >> import asyncio
+    >> from pycrunch import asynclib
+    >> async def main():
+    ..     async with asynclib.AsyncElementSession(token="...") as session:
+    ..         site = (await session.get("https://app.crunch.io/api/")).payload
+    ..         datasets = await asynclib.follow(site, "datasets")
+    ..         return await asyncio.gather(*[
+    ..             asynclib.fetch(tup) for tup in datasets.index.values()
+    ..         ])
+    >> asyncio.get_event_loop().run_until_complete(main())
+
+Each response is buffered and wrapped in a requests.Response, which is
+then passed through the same ElementResponseHandler as the blocking
+session, so the payloads are the same Catalog, Entity, Dataset, etc.
+instances. Those elements are bound to the AsyncElementSession, however,
+so their blocking helpers (such as .refresh() or following navigation
+links as attributes) cannot be used; call the coroutine functions in
+this module instead.
+
+This module requires Python 3.5+ and aiohttp, and is not imported by
+the ``pycrunch`` package itself.
+"""
+
+import asyncio
+
+import aiohttp
+import requests
+import six
+import yarl
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from pycrunch import elements, jsonlib, lemonpy, shoji
+from pycrunch.progress import DefaultProgressTracking
+
+
+class AsyncElementResponseHandler(elements.ElementResponseHandler):
+    """An ElementResponseHandler which re-authenticates without blocking."""
+
+    async def handle(self, r):
+        """Dispatch the given Response, awaiting any login and replay."""
+        if r.status_code == 401:
+            return await self.status_401_async(r)
+        return self(r)
+
+    async def status_401_async(self, r):
+        login_url = r.json()["urls"]["login_url"]
+        if r.request.url == login_url:
+            raise ValueError("Log in was not successful.")
+
+        creds = {'email': self.session.email, 'password': self.session.password}
+        login_r = await self.session.post(
+            login_url,
+            headers={"Content-Type": "application/json"},
+            data=jsonlib.dumps(creds)
+        )
+
+        # Repeat the request now that we've logged in; the cookie jar
+        # of the aiohttp session has picked up the new token.
+        req = r.request
+        r2 = await self.session.request(
+            req.method, req.url, data=req.body, headers=req.headers)
+        r2.history.append(r)
+        r2.history.append(login_r)
+
+        return r2
+
+
+class AsyncElementSession(object):
+    """An asyncio counterpart of ElementSession, built on aiohttp.
+
+    The 'limit' argument caps the number of simultaneous connections
+    (across all hosts) opened by the underlying aiohttp connector.
+    The aiohttp.ClientSession is created on first use, so instances may
+    be constructed outside of a running event loop. Call .close() (or
+    use the session as an async context manager) when finished.
+    """
+
+    headers = dict(lemonpy.Session.headers, **elements.ElementSession.headers)
+    handler_class = AsyncElementResponseHandler
+
+    def __init__(self, email=None, password=None, token=None, domain=None,
+                 progress_tracking=None, limit=100):
+        self.email = email
+        self.password = password
+        self.token = token
+        self.domain = domain
+        self.progress_tracking = progress_tracking or DefaultProgressTracking()
+        self.limit = limit
+        self.url_table = lemonpy.URLTable()
+        self.headers = dict(self.__class__.headers)
+        self.handler = self.handler_class(self)
+        self._client = None
+
+    @property
+    def client(self):
+        """The aiohttp.ClientSession used to send requests."""
+        if self._client is None:
+            self._client = aiohttp.ClientSession(
+                headers=self.headers,
+                connector=aiohttp.TCPConnector(limit=self.limit),
+                # Responses are decompressed by aiohttp itself.
+                auto_decompress=True,
+            )
+            if self.token:
+                domain = self.domain or 'local.crunch.io'
+                self._client.cookie_jar.update_cookies(
+                    {'token': self.token},
+                    response_url=yarl.URL('http://%s/' % domain)
+                )
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def request(self, method, url, params=None, data=None,
+                      headers=None, **kwargs):
+        """Send a request and return its handled requests.Response.
+
+        As with ElementSession, the returned Response possesses a .payload
+        attribute, and error statuses raise ClientError or ServerError.
+        """
+        if isinstance(data, six.text_type):
+            data = data.encode('utf-8')
+        async with self.client.request(method, url, params=params, data=data,
+                                       headers=headers, **kwargs) as resp:
+            content = await resp.read()
+            r = self._build_response(resp, content, data, headers)
+        return await self.handler.handle(r)
+
+    def _build_response(self, resp, content, body, headers):
+        """Return the given aiohttp response as a (read) requests.Response."""
+        req = requests.PreparedRequest()
+        req.method = resp.method
+        req.url = str(resp.url)
+        req.headers = CaseInsensitiveDict(headers or {})
+        req.body = body
+
+        r = requests.Response()
+        r.status_code = resp.status
+        r.headers = CaseInsensitiveDict(resp.headers)
+        r.encoding = get_encoding_from_headers(r.headers)
+        r.reason = resp.reason
+        r.url = req.url
+        r.request = req
+        r._content = content
+        r._content_consumed = True
+        return r
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, data=None, **kwargs):
+        return self.request('POST', url, data=data, **kwargs)
+
+    def put(self, url, data=None, **kwargs):
+        return self.request('PUT', url, data=data, **kwargs)
+
+    def patch(self, url, data=None, **kwargs):
+        return self.request('PATCH', url, data=data, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+
+# ----------------------- Awaitable Document helpers ----------------------- #
+
+
+def _json_request(method, document, data, **kwargs):
+    kwargs.setdefault('headers', {})
+    kwargs["headers"].setdefault("Content-Type", "application/json")
+    if not isinstance(data, six.string_types):
+        data = jsonlib.dumps(data)
+    return document.session.request(method, document.self, data=data, **kwargs)
+
+
+async def post(document, data, **kwargs):
+    """Await Document.post(data) on an async-bound document."""
+    return await _json_request('POST', document, data, **kwargs)
+
+
+async def put(document, data, **kwargs):
+    """Await Document.put(data) on an async-bound document."""
+    return await _json_request('PUT', document, data, **kwargs)
+
+
+async def patch(document, data, **kwargs):
+    """Await Document.patch(data) on an async-bound document."""
+    return await _json_request('PATCH', document, data, **kwargs)
+
+
+async def refresh(document):
+    """GET document.self, update the document with its payload and return it."""
+    r = await document.session.get(document.self)
+    if r.payload is None:
+        raise TypeError("Response could not be parsed.", r)
+
+    document.clear()
+    document.update(r.payload)
+    return document
+
+
+async def follow(document, key, qs=None):
+    """GET the payload of the requested collection URL of the document."""
+    url = document._navigation_url(key, qs)
+    if url is None:
+        raise AttributeError(
+            "%s has no link %s" % (document.__class__.__name__, key))
+    return (await document.session.get(url)).payload
+
+
+async def fetch(tup):
+    """GET and return the Entity for the given shoji.Tuple."""
+    r = await tup.session.get(tup.entity_url.absolute)
+    if r.payload is None:
+        raise TypeError("Response could not be parsed.", r)
+    return r.payload
+
+
+async def create(catalog, entity=None, progress_tracker=None):
+    """POST the given Entity to the catalog, awaiting any progress.
+
+    See shoji.Catalog.create for the accepted arguments.
+    """
+    entity = catalog._new_entity(entity)
+    r = await post(catalog, entity.json)
+    entity.self = lemonpy.URL(r.headers['Location'], '')
+    if r.status_code == 202:
+        try:
+            r.payload['value']
+        except Exception:  # pragma: no cover
+            # Not a progress API just return the incomplete entity.
+            pass
+        else:
+            await wait_progress(r, catalog.session, progress_tracker, entity)
+    return entity
+
+
+async def edit(catalog, entity_url, **attrs):
+    """Update the catalog with the given entity attributes."""
+    return await edit_index(catalog, {entity_url: attrs})
+
+
+async def edit_index(catalog, index):
+    """Update the catalog with the given (probably partial) index."""
+    return (await patch(catalog, catalog._index_patch(index))).payload
+
+
+async def drop(catalog, entity_url):
+    """Delete the given entity from the catalog."""
+    return await edit_index(catalog, {entity_url: None})
+
+
+async def wait_progress(r, session, progress_tracker=None, entity=None):
+    """Await completion of the task of the given 202 response.
+
+    This is the asynchronous version of shoji.wait_progress; rather than
+    sleeping between polls it yields to the event loop.
+    """
+    progress_url = r.payload['value']
+
+    if progress_tracker is None:
+        progress_tracker = session.progress_tracking
+
+    loop = asyncio.get_event_loop()
+    timeout = progress_tracker.timeout
+    progress_state = progress_tracker.start_progress()
+    begin = loop.time()
+    while timeout is None or loop.time() - begin < timeout:
+        prog_r = await session.get(progress_url)
+        progress = prog_r.payload['value']
+        progress_tracker.on_progress(progress_state, progress)
+        if shoji.progress_completed(progress):
+            break
+        await asyncio.sleep(progress_tracker.interval)
+    else:
+        # Loop completed due to timeout
+        raise shoji.TaskProgressTimeoutError(entity, r)
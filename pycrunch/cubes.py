@@ -1,8 +1,10 @@
 import six
 
 from pycrunch import elements
+from pycrunch.tracing import traced
 
 
+@traced("fetch_cube")
 def fetch_cube(dataset, dimensions, weight=None, **measures):
     """Return a shoji.View containing a crunch:cube.
 
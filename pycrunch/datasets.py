@@ -1,5 +1,3 @@
-import json
-
 import six
 
 if six.PY2:  # pragma: no cover
@@ -9,6 +7,7 @@ else:
 
 import pandas as pd
 
+from pycrunch import jsonlib
 from pycrunch.expressions import parse_expr
 from pycrunch.expressions import process_expr
 from pycrunch.shoji import Entity
@@ -126,6 +125,8 @@ class Dataset(Entity):
     A pycrunch.shoji.Entity subclass that provides dataset-specific methods.
     """
 
+    url_pattern = r"datasets/[^/]+/"
+
     def __getattr__(self, item):
         # First check if the parent class provides the attribute
         try:
@@ -160,7 +161,7 @@ class Dataset(Entity):
             expr_obj = expr
         return self.session.patch(
             self.fragments.exclusion,
-            data=json.dumps(dict(expression=expr_obj))
+            data=jsonlib.dumps(dict(expression=expr_obj))
         )
 
     def create_categorical(self, categories, rules,
@@ -0,0 +1,177 @@
+"""A persistent HTTP response cache, shared across processes.
+
+SQLiteCache is a lemonpy.ResponseCache which also writes each cacheable
+GET response to a SQLite database, so that a new process (a cron job or
+a notebook kernel, say) can revalidate the catalogs which an earlier one
+downloaded with a cheap 304 Not Modified, rather than fetching them again:
+
+    >> from pycrunch.diskcache import SQLiteCache
+    >> site = pycrunch.connect(user, pw, cache=SQLiteCache())
+
+Entries are keyed by URL and by the identity of the session's user
+(a hash of its email, or of its token), so that users sharing a cache
+file never see each other's responses. The database uses SQLite's
+write-ahead log, so any number of processes may read and write it
+at once. Once its response bodies exceed 'max_disk_bytes', the least
+recently used entries are deleted.
+
+Pass offline=True to serve every GET from the cache, without any
+network access at all (see lemonpy.ResponseCache); nothing is written
+to the database in that mode.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from pycrunch import jsonlib
+from pycrunch.lemonpy import CacheEntry, ResponseCache, cache_key
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    headers TEXT NOT NULL,
+    content BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    max_age REAL NOT NULL,
+    stale_while_revalidate REAL NOT NULL,
+    stored_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at);
+"""
+
+
+def default_path():
+    """Return the path of the default cache database for this user."""
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "pycrunch", "http-cache.sqlite")
+
+
+def auth_identity(session):
+    """Return a short hash identifying the user of the given session."""
+    secret = getattr(session, "email", None) or getattr(session, "token", None) or ""
+    return hashlib.sha256(secret.encode("utf-8")).hexdigest()[:16]
+
+
+class SQLiteCache(ResponseCache):
+    """A ResponseCache which persists its entries in a SQLite database.
+
+    Entries are kept in memory as well (bounded by 'max_entries' and
+    'max_bytes', as for ResponseCache); those read back from the database
+    are parsed again on their first use. Responses whose body was parsed
+    as it was downloaded (see Session.stream_threshold) have no body to
+    store, so they are only cached in memory.
+    """
+
+    def __init__(self, path=None, max_disk_bytes=256 * 1024 * 1024,
+                 timeout=30, **kwargs):
+        super(SQLiteCache, self).__init__(**kwargs)
+        self.path = path or default_path()
+        self.max_disk_bytes = max_disk_bytes
+        self.timeout = timeout
+        self._local = threading.local()
+        if not self.offline:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+        self.connection.executescript(SCHEMA)
+
+    @property
+    def connection(self):
+        """The sqlite3 connection of the current thread."""
+        conn = getattr(self._local, "connection", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.path, timeout=self.timeout, isolation_level=None)
+            if not self.offline:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = conn
+        return conn
+
+    def key(self, session, url, params=None):
+        return "%s %s" % (auth_identity(session), cache_key(url, params))
+
+    def lookup(self, key):
+        entry = super(SQLiteCache, self).lookup(key)
+        if entry is not None:
+            return entry
+
+        row = self.connection.execute(
+            "SELECT url, status, headers, content, max_age, "
+            "stale_while_revalidate, stored_at FROM responses WHERE key = ?",
+            (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        url, status, headers, content, max_age, swr, stored_at = row
+        entry = CacheEntry(url, status, jsonlib.loads(headers), bytes(content),
+                           max_age, swr, stored_at)
+        if not self.offline:
+            self.connection.execute(
+                "UPDATE responses SET accessed_at = ? WHERE key = ?",
+                (time.time(), key))
+        super(SQLiteCache, self).store(key, entry)
+        return entry
+
+    def store(self, key, entry):
+        super(SQLiteCache, self).store(key, entry)
+        self._write(key, entry)
+
+    def _write(self, key, entry):
+        if self.offline or not entry.content or entry.size > self.max_disk_bytes:
+            return
+        now = time.time()
+        conn = self.connection
+        conn.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, entry.url, entry.status_code, jsonlib.dumps(dict(entry.headers)),
+             sqlite3.Binary(entry.content), entry.size, entry.max_age,
+             entry.stale_while_revalidate, entry.stored_at, now)
+        )
+        self._evict()
+
+    def _evict(self):
+        """Delete the least recently used rows until under max_disk_bytes."""
+        conn = self.connection
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_disk_bytes:
+            return
+        excess = total - self.max_disk_bytes
+        doomed = []
+        for key, size in conn.execute(
+                "SELECT key, size FROM responses ORDER BY accessed_at"):
+            doomed.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+
+    def update(self, key, entry, r):
+        new = super(SQLiteCache, self).update(key, entry, r)
+        if new is not None and new is entry:
+            # Revalidated; store its new freshness.
+            self._write(key, entry)
+        return new
+
+    def discard(self, key):
+        super(SQLiteCache, self).discard(key)
+        if not self.offline:
+            self.connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    def clear(self):
+        super(SQLiteCache, self).clear()
+        if not self.offline:
+            self.connection.execute("DELETE FROM responses")
+
+    def disk_stats(self):
+        """Return a dict of the number of entries and bytes in the database."""
+        entries, size = self.connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {"entries": entries, "size": size}
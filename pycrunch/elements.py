@@ -19,26 +19,48 @@ class attribute. For example, the class definition:
 
 ...would result in any JSON object with an {"element": "myapp:foo"} member
 being parsed into an instance of Foo, rather than a bare JSONObject.
+
+A subclass may further be chosen by the "self" URL of the object, by giving
+it a url_pattern: a regular expression which the path of that URL after
+the API root must match. For example, given:
+
+    class Bar(Foo):
+        url_pattern = r"bars/[^/]+/"
+
+...an object with {"element": "myapp:foo", "self": "https://host/api/bars/1/"}
+would be parsed into an instance of Bar, but one whose "self" is any other
+URL into an instance of Foo.
 """
 
 import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import mktime_tz, parsedate_tz
 
 import six
+from six.moves.http_cookies import SimpleCookie
 
 import pycrunch
-from pycrunch import lemonpy
+from pycrunch import jsonlib, lemonpy
+from pycrunch.jsonstream import JSONStreamReader
 from pycrunch.progress import DefaultProgressTracking
 from .version import __version__
 
 omitted = object()
 
+STREAM_CHUNK_SIZE = 64 * 1024
+
 
 class JSONObject(dict):
     """A base class for JSON objects."""
 
     @property
     def json(self):
-        return json.dumps(self, indent=4)
+        """This object as compact JSON text, suitable for a request body."""
+        return jsonlib.dumps(self)
 
     def __str__(self):  # pragma: no cover
         return "%s.%s(**%s)" % (self.__module__, self.__class__.__name__,
@@ -69,6 +91,8 @@ class ElementMeta(type):
             # (including Element itself!) to allow for additional
             # base classes.
             elements[d['element']] = new_type
+        if 'url_pattern' in d:
+            register_url_pattern(new_type)
         return new_type
 
 
@@ -88,6 +112,56 @@ class Element(JSONObject):
 
 elements = {}
 
+# The (url_pattern, class) pairs registered for each element, in order.
+url_patterns = {}
+# A regex and {group name: class} dict for each element in url_patterns,
+# compiled on first use.
+_url_classifiers = {}
+
+API_ROOT_PATTERN = r"[^:/?#]+://[^/?#]+/[^/?#]+/"
+
+
+def register_url_pattern(cls):
+    """Choose the given Element class for objects whose URL matches its url_pattern.
+
+    This is done automatically for subclasses which define url_pattern.
+    Where the patterns of two classes with the same element both match
+    a URL, the class registered first is chosen.
+    """
+    url_patterns.setdefault(cls.element, []).append((cls.url_pattern, cls))
+    _url_classifiers.pop(cls.element, None)
+
+
+def url_class(element, url):
+    """Return the class registered for the given element and URL, or None.
+
+    The patterns of all classes registered for the element are compiled
+    into a single regular expression, so this is one match, however
+    many there are.
+    """
+    classifier = _url_classifiers.get(element)
+    if classifier is None:
+        patterns = url_patterns.get(element)
+        if not patterns:
+            return None
+        classes = {}
+        alternatives = []
+        for i, (pattern, cls) in enumerate(patterns):
+            group = "_%d" % i
+            classes[group] = cls
+            alternatives.append("(?P<%s>%s)" % (group, pattern))
+        regex = re.compile(r"^%s(?:%s)(?:[?#].*)?$" % (
+            API_ROOT_PATTERN, "|".join(alternatives)))
+        classifier = _url_classifiers[element] = (regex, classes)
+
+    if not url:
+        return None
+    regex, classes = classifier
+    m = regex.match(getattr(url, "absolute", url))
+    if m is None:
+        return None
+    return classes[m.lastgroup]
+
 
 def parse_element(session, j):
     """Recursively replace dict with appropriate subclasses of JSONObjects."""
@@ -95,23 +169,284 @@ def parse_element(session, j):
     if t is dict:
         for k, v in list(six.iteritems(j)):
             j[k] = parse_element(session, v)
-
-        elem = j.get("element", None)
-        if elem == 'shoji:entity' and is_dataset(j):
-            return pycrunch.datasets.Dataset(session, **j)
-        if elem in elements:
-            return elements[elem](session, **j)
-        else:
-            return JSONObject(**j)
+        return make_element(session, j)
     elif t is list:
         return [parse_element(session, i) for i in j]
     else:
         return j
 
 
+def make_element(session, j, lazy=False):
+    """Return the given dict of parsed members as the appropriate JSONObject.
+
+    If 'lazy' is True, the members of j may instead be unparsed JSON,
+    and an instance of the lazy_class of the JSONObject is returned.
+    """
+    elem = j.get("element", None)
+    cls = elements.get(elem)
+    if cls is None:
+        if lazy:
+            obj = lazy_class(JSONObject)(**j)
+            obj._lazy_session = session
+            return obj
+        return JSONObject(**j)
+
+    if elem in url_patterns:
+        cls = url_class(elem, j.get("self")) or cls
+    if lazy:
+        cls = lazy_class(cls)
+    return cls(session, **j)
+
+
+def parse_lazily(session, j):
+    """Return j as the appropriate JSONObject, parsing its members on access.
+
+    This is the lazy counterpart of parse_element: only the top level of
+    the given JSON is wrapped; each dict or list member is parsed (again
+    lazily) when it is first read.
+    """
+    t = type(j)
+    if t is dict:
+        return make_element(session, j, lazy=True)
+    elif t is list:
+        return [parse_lazily(session, i) for i in j]
+    else:
+        return j
+
+
+class LazyMembers(object):
+    """A mixin for JSONObjects whose dict and list members are parsed on access.
+
+    Each plain dict or list member is kept as the raw decoded JSON, and
+    its key in self._raw, until it is read through the usual dict methods
+    or as an attribute; it is then parsed with self._parse_member, stored
+    in its place and returned. Iterating over values or items parses all
+    remaining members first. Code which reads the underlying dict directly,
+    such as dict(obj) or json.dumps(obj), sees the raw members instead;
+    these are plain dicts and lists with the same contents.
+
+    Use lazy_class(cls) to obtain the lazy version of a JSONObject class.
+    """
+
+    _raw = frozenset()
+    _lazy_session = None
+
+    def __init__(__this__, *args, **members):
+        super(LazyMembers, __this__).__init__(*args, **members)
+        __this__._raw = set(
+            k for k, v in dict.items(__this__) if type(v) in (dict, list))
+        __this__._lazy_session = __this__.__dict__.get("session")
+
+    def _parse_member(self, key, value):
+        return parse_lazily(self._lazy_session, value)
+
+    def _member(self, key, value):
+        if key in self._raw:
+            value = self._parse_member(key, value)
+            dict.__setitem__(self, key, value)
+            self._raw.discard(key)
+        return value
+
+    def _parse_all(self):
+        for key in list(self._raw):
+            self._member(key, dict.__getitem__(self, key))
+
+    def __getitem__(self, key):
+        return self._member(key, dict.__getitem__(self, key))
+
+    def get(self, key, default=None):
+        v = dict.get(self, key, omitted)
+        if v is omitted:
+            return default
+        return self._member(key, v)
+
+    def __setitem__(self, key, value):
+        if key in self._raw:
+            self._raw.discard(key)
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        if key in self._raw:
+            self._raw.discard(key)
+        dict.__delitem__(self, key)
+
+    def pop(self, key, *default):
+        if key not in self:
+            return dict.pop(self, key, *default)
+        value = self[key]
+        del self[key]
+        return value
+
+    def popitem(self):
+        self._parse_all()
+        return dict.popitem(self)
+
+    def setdefault(self, key, default=None):
+        if key in self:
+            return self[key]
+        self[key] = default
+        return default
+
+    def update(self, *args, **kwargs):
+        if len(args) == 1 and isinstance(args[0], LazyMembers):
+            # Carry over the members the source has not parsed yet,
+            # rather than storing them here as plain dicts and lists.
+            other, args = args[0], ()
+            for key, value in list(dict.items(other)):
+                self[key] = value
+                if key in other._raw:
+                    self._raw.add(key)
+        for key, value in six.iteritems(dict(*args, **kwargs)):
+            self[key] = value
+
+    def clear(self):
+        if self._raw:
+            self._raw.clear()
+        dict.clear(self)
+
+    def values(self):
+        self._parse_all()
+        return dict.values(self)
+
+    def items(self):
+        self._parse_all()
+        return dict.items(self)
+
+    if six.PY2:  # pragma: no cover
+        def itervalues(self):
+            self._parse_all()
+            return dict.itervalues(self)
+
+        def iteritems(self):
+            self._parse_all()
+            return dict.iteritems(self)
+
+    def copy(self):
+        """Return a (shallow) copy of self."""
+        new = super(LazyMembers, self).copy()
+        new._lazy_session = self._lazy_session
+        return new
+
+
+lazy_classes = {}
+
+
+def lazy_class(cls):
+    """Return the subclass of the given JSONObject class with LazyMembers.
+
+    Any class attribute of cls which is itself a JSONObject class (such as
+    shoji.Catalog.index_class) is replaced by its lazy class, too.
+    The lazy class of a class may be set explicitly in lazy_classes.
+    """
+    new_type = lazy_classes.get(cls)
+    if new_type is None:
+        new_type = type("Lazy" + cls.__name__, (LazyMembers, cls),
+                        {"__module__": cls.__module__})
+        lazy_classes[cls] = new_type
+        for name in dir(cls):
+            attr = getattr(cls, name, None)
+            if isinstance(attr, type) and issubclass(attr, JSONObject):
+                setattr(new_type, name, lazy_class(attr))
+    return new_type
+
+
 def is_dataset(j):
-    parts = j['self'].split('/')
-    return 'datasets' in parts and len(parts) == 7
+    cls = url_class(j.get("element"), j.get("self"))
+    return cls is not None and issubclass(cls, pycrunch.datasets.Dataset)
+
+
+class NavigationCache(object):
+    """A per-session cache of the payloads of followed navigation links.
+
+    Set an instance as ElementSession.navigation_cache (or pass it as the
+    navigation_cache argument) to have reading a link of a Document, such
+    as ds.variables or ds.summary, return the payload of the last GET of
+    that URL if it was made less than 'ttl' seconds ago, rather than GET
+    it again. At most 'max_entries' payloads are kept; the least recently
+    used are evicted first.
+
+    Any other request than a GET made through the session, such as the
+    POST of Catalog.create or the PATCH of Catalog.edit or Entity.edit,
+    evicts the payloads of its URL, of any URL under it, and of its parent
+    (such as the catalog of an edited entity). Other changes, including
+    those made by other clients, are only seen once an entry expires,
+    or is evicted with invalidate().
+
+    Payloads are shared by every read of the same link. The counters
+    'hits' and 'misses' measure the GETs saved.
+    """
+
+    def __init__(self, ttl=60.0, max_entries=256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """Return a dict of the counters of this cache."""
+        with self.lock:
+            return {"entries": len(self), "hits": self.hits, "misses": self.misses}
+
+    @staticmethod
+    def key(url):
+        return getattr(url, "absolute", url)
+
+    def get(self, url):
+        """Return the cached payload of the given URL, or None if none is fresh."""
+        key = self.key(url)
+        with self.lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, payload = entry
+                if time.time() - stored_at < self.ttl:
+                    self._entries.pop(key)
+                    self._entries[key] = entry
+                    self.hits += 1
+                    return payload
+                del self._entries[key]
+            self.misses += 1
+        return None
+
+    def store(self, url, payload):
+        """Cache the given payload of the given URL."""
+        key = self.key(url)
+        with self.lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.time(), payload)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, url=None):
+        """Evict the given URL, those under it, and its parent.
+
+        The parent is the URL one path segment up; for example, that of
+        http://host/api/datasets/1/ is http://host/api/datasets/.
+        If 'url' is None, evict all entries.
+        """
+        with self.lock:
+            if url is None:
+                self._entries.clear()
+                return
+            url = self.key(url).split("?", 1)[0]
+            parent = url.rstrip("/").rsplit("/", 1)[0] + "/"
+            for key in list(self._entries):
+                path = key.split("?", 1)[0]
+                if path.startswith(url) or path == parent:
+                    del self._entries[key]
+
+    def follow(self, session, url):
+        """Return the payload of the given URL, from the cache or a GET."""
+        payload = self.get(url)
+        if payload is None:
+            payload = session.get(url).payload
+            if payload is not None:
+                self.store(url, payload)
+        return payload
 
 
 class Document(Element):
@@ -124,9 +459,14 @@ class Document(Element):
     as a complete payload; they therefore include helper functions
     for refreshing themselves (via HTTP GET), plus post, put, patch,
     and delete. Not every resource is guaranteed to respond to all.
+
+    The links of a Document may also be fetched ahead of time, in the
+    background, with prefetch(); the next access to each then returns
+    the prefetched payload rather than waiting for a GET.
     """
 
     navigation_collections = ()
+    _prefetches = None
 
     def __getattr__(self, key):
         # Return the requested attribute if present in self.keys
@@ -136,17 +476,18 @@ class Document(Element):
 
         # If the requested attribute is present in a URL collection,
         # do a GET and return its payload.
-        for collname in self.navigation_collections:
-            coll = self.get(collname, {})
-            if key in coll:
-                url = coll[key]
-                return self.session.get(url).payload
+        url = self._navigation_url(key)
+        if url is not None:
+            return self._follow(key, url)
 
         raise AttributeError(
             "%s has no attribute %s" % (self.__class__.__name__, key))
 
-    def follow(self, key, qs=None):
-        """GET the payload of the requested collection URL."""
+    def _navigation_url(self, key, qs=None):
+        """Return the URL for the given key in a navigation collection, or None.
+
+        If 'qs' is not None, it replaces any query string on the URL.
+        """
         for collname in self.navigation_collections:
             coll = self.get(collname, {})
             if key in coll:
@@ -154,17 +495,70 @@ class Document(Element):
                 if qs is not None:
                     # Remove any existing qs, such as for URI Templates.
                     url = url.rsplit("?", 1)[0] + "?" + qs
+                return url
+
+        return None
+
+    def follow(self, key, qs=None):
+        """GET the payload of the requested collection URL."""
+        url = self._navigation_url(key, qs)
+        if url is not None:
+            if qs is not None:
                 return self.session.get(url).payload
+            return self._follow(key, url)
 
         raise AttributeError(
             "%s has no link %s" % (self.__class__.__name__, key))
 
+    def _follow(self, key, url):
+        prefetches = self._prefetches
+        future = prefetches.pop(key, None) if prefetches else None
+        if future is not None:
+            # Each prefetch is used once; later reads GET the link again.
+            return future.result().payload
+        cache = getattr(self.session, "navigation_cache", None)
+        if cache is not None:
+            return cache.follow(self.session, url)
+        return self.session.get(url).payload
+
+    def prefetch(self, keys, max_workers=None):
+        """GET the given links of self concurrently, in the background.
+
+        Each of the 'keys' must name a link in one of the navigation
+        collections of self (as for follow). Their GETs are started at once,
+        on up to 'max_workers' threads (by default, one per key), and this
+        returns without waiting for them. The next read of each link, as an
+        attribute or via follow(key), waits for its GET (if it has not yet
+        finished) and returns its payload, or raises its error.
+
+        The GETs share self.session with the calling thread, which should
+        therefore be thread-safe (see lemonpy.Session).
+        """
+        urls = []
+        for key in keys:
+            url = self._navigation_url(key)
+            if url is None:
+                raise AttributeError(
+                    "%s has no link %s" % (self.__class__.__name__, key))
+            urls.append((key, url))
+        if not urls:
+            return
+
+        if self._prefetches is None:
+            self._prefetches = {}
+        executor = ThreadPoolExecutor(max_workers=max_workers or len(urls))
+        for key, url in urls:
+            self._prefetches[key] = executor.submit(self.session.get, url)
+        executor.shutdown(wait=False)
+
     def refresh(self):
         """GET self.self, update self with its payload and return self."""
         r = self.session.get(self.self)
         if r.payload is None:
             raise TypeError("Response could not be parsed.", r)
 
+        # The links of the new payload may differ from those prefetched.
+        self._prefetches = None
         self.clear()
         self.update(r.payload)
         return self
@@ -173,21 +567,21 @@ class Document(Element):
         kwargs.setdefault('headers', {})
         kwargs["headers"].setdefault("Content-Type", "application/json")
         if not isinstance(data, six.string_types):
-            data = json.dumps(data)
+            data = jsonlib.dumps(data)
         return self.session.post(self.self, data, *args, **kwargs)
 
     def put(self, data, *args, **kwargs):
         kwargs.setdefault('headers', {})
         kwargs["headers"].setdefault("Content-Type", "application/json")
         if not isinstance(data, six.string_types):
-            data = json.dumps(data)
+            data = jsonlib.dumps(data)
         return self.session.put(self.self, data, *args, **kwargs)
 
     def patch(self, data, *args, **kwargs):
         kwargs.setdefault('headers', {})
         kwargs["headers"].setdefault("Content-Type", "application/json")
         if not isinstance(data, six.string_types):
-            data = json.dumps(data)
+            data = jsonlib.dumps(data)
         return self.session.patch(self.self, data, *args, **kwargs)
 
     def delete(self):
@@ -196,13 +590,124 @@ class Document(Element):
 # -------------------------- HTTP request helpers -------------------------- #
 
 
+def element_hook(session):
+    """Return a JSON object_hook which makes each object into a JSONObject.
+
+    Decoding with this hook has the same result as parse_element on the
+    decoded JSON, but in a single pass: each object is made into the
+    appropriate JSONObject or Element as soon as it is decoded, rather
+    than by walking the whole tree (including every list) again.
+    """
+    def hook(j):
+        return make_element(session, j)
+    return hook
+
+
 def parse_json_element_from_response(session, r):
     """Return the appropriate Element instance if possible, otherwise JSON."""
-    if not r.text:
+    if not r.content:
         return JSONObject()
-    j = r.json()
 
-    return parse_element(session, j)
+    if getattr(session, "lazy", False):
+        return parse_lazily(session, jsonlib.loads(r.content))
+    return jsonlib.loads(r.content, object_hook=element_hook(session))
+
+
+def parse_json_element_from_stream(session, r):
+    """Parse the JSON body of r as it is downloaded; see parse_json_element_from_response.
+
+    The members of the top-level object are decoded one at a time, and the
+    entries of any 'index' member one at a time, each being turned into
+    a shoji.Tuple as soon as it has been read. The response text and
+    the intermediate plain dicts of a huge shoji:catalog are therefore
+    never held in memory all at once.
+
+    The body is consumed in the process, so r.content will be empty.
+    """
+    lazy = getattr(session, "lazy", False)
+    parse = parse_lazily if lazy else parse_element
+    reader = JSONStreamReader(r.iter_content(STREAM_CHUNK_SIZE))
+    try:
+        c = reader.peek()
+        if c == '':
+            return JSONObject()
+        if c != '{':
+            return parse(session, reader.read_value())
+
+        members = {}
+        tuples = None
+        for key in reader.iter_object():
+            if key == 'index' and reader.peek() == '{':
+                # Keep the member order; the Index is made once "self" is known.
+                members[key] = None
+                tuples = _read_index_tuples(session, reader, lazy)
+            else:
+                members[key] = parse(session, reader.read_value())
+    finally:
+        r._content = b""
+
+    if tuples is not None:
+        Tuple = pycrunch.shoji.Tuple
+        if members.get('element') == 'shoji:catalog' and 'self' in members:
+            members['index'] = pycrunch.shoji.Index.from_tuples(
+                session, members['self'], tuples)
+        else:
+            members['index'] = JSONObject(**dict(
+                (url, (parse_lazily(session, dict(tup)) if lazy else JSONObject(**tup))
+                 if isinstance(tup, Tuple) else tup)
+                for url, tup in tuples
+            ))
+    return make_element(session, members, lazy)
+
+
+def _read_index_tuples(session, reader, lazy=False):
+    """Read the shoji index object at the reader as a list of (url, Tuple)."""
+    Tuple = pycrunch.shoji.Tuple
+    if lazy:
+        Tuple = lazy_class(Tuple)
+    tuples = []
+    for entity_url in reader.iter_object():
+        tup = reader.read_value()
+        if type(tup) is dict:
+            if not lazy:
+                for k, v in list(six.iteritems(tup)):
+                    tup[k] = parse_element(session, v)
+            # The base URL is set once the catalog's "self" is known.
+            tup = Tuple(session, lemonpy.URL(entity_url, ""), **tup)
+        tuples.append((entity_url, tup))
+    return tuples
+
+
+def cookie_values(header):
+    """Return an OrderedDict of the cookie names and values in the given header."""
+    cookies = SimpleCookie()
+    if header:
+        cookies.load(str(header))
+    return OrderedDict((name, morsel.value) for name, morsel in cookies.items())
+
+
+def cookie_expiry(header):
+    """Return the earliest expiry time of the cookies in a Set-Cookie header, or None."""
+    cookies = SimpleCookie()
+    if header:
+        cookies.load(str(header))
+    expiries = []
+    for morsel in cookies.values():
+        if morsel['max-age']:
+            expiries.append(time.time() + int(morsel['max-age']))
+        elif morsel['expires']:
+            date = parsedate_tz(morsel['expires'])
+            if date is not None:
+                expiries.append(mktime_tz(date))
+    return min(expiries) if expiries else None
+
+
+def set_request_cookies(request, values):
+    """Replace the given cookie values in the Cookie header of the request."""
+    cookies = cookie_values(request.headers.get('Cookie'))
+    cookies.update(values)
+    request.headers['Cookie'] = "; ".join(
+        "%s=%s" % item for item in six.iteritems(cookies))
 
 
 class ElementResponseHandler(lemonpy.ResponseHandler):
@@ -211,26 +716,89 @@ class ElementResponseHandler(lemonpy.ResponseHandler):
     In addition, this subclass traps 401 Unauthorized responses,
     then attempts to authenticate to Crunch.io, and then repeats
     the request. That should probably be moved out somewhere else.
+
+    Only one login is made at a time: when many requests fail at once
+    because the token expired, the first logs in while the rest wait,
+    and those sent with the old token are then repeated with the cookies
+    of that login rather than logging in again. If the login cookies
+    expire, the session logs in again before sending any request within
+    'login_refresh_margin' seconds of their expiry (or within half of
+    their lifetime, if that is shorter).
     """
 
     parsers = {
         'application/json': parse_json_element_from_response
     }
-
-    def status_401(self, r):
-        login_url = r.json()["urls"]["login_url"]
-        if r.request.url == login_url:
-            raise ValueError("Log in was not successful.")
-
+    stream_parsers = {
+        'application/json': parse_json_element_from_stream
+    }
+    login_refresh_margin = 60
+
+    def __init__(self, session):
+        super(ElementResponseHandler, self).__init__(session)
+        self.login_lock = threading.Lock()
+        self.login_url = None
+        self.login_response = None
+        self.login_cookies = {}
+        self.login_refresh_at = None
+
+    def login(self, login_url):
+        """POST the credentials of the session to login_url; return the response.
+
+        The caller must hold self.login_lock.
+        """
+        # Stop refresh_login from logging in again during this request.
+        self.login_refresh_at = None
         creds = {'email': self.session.email, 'password': self.session.password}
         login_r = self.session.post(
             login_url,
             headers={"Content-Type": "application/json"},
-            data=json.dumps(creds)
+            data=jsonlib.dumps(creds)
         )
 
-        # Repeat the request now that we've logged in. What a hack.
-        r.request.headers['Cookie'] = login_r.headers['Set-Cookie']
+        set_cookie = login_r.headers.get('Set-Cookie')
+        self.login_url = login_url
+        self.login_response = login_r
+        self.login_cookies = cookie_values(set_cookie)
+        expires = cookie_expiry(set_cookie)
+        if expires is not None:
+            now = time.time()
+            self.login_refresh_at = expires - min(
+                self.login_refresh_margin, (expires - now) / 2.0)
+        return login_r
+
+    def refresh_login(self, request):
+        """Log in again before sending the request if the login is about to expire."""
+        refresh_at = self.login_refresh_at
+        if refresh_at is None or time.time() < refresh_at:
+            return
+
+        with self.login_lock:
+            if self.login_refresh_at == refresh_at:
+                self.login(self.login_url)
+        set_request_cookies(request, self.login_cookies)
+
+    def status_401(self, r):
+        login_url = r.json()["urls"]["login_url"]
+        if r.request.url == login_url:
+            raise ValueError("Log in was not successful.")
+        if getattr(r.request, "replayed_after_login", False):
+            # Logging in did not help; don't try again forever.
+            return self.status_4xx(r)
+
+        with self.login_lock:
+            sent = cookie_values(r.request.headers.get('Cookie'))
+            if self.login_response is not None and any(
+                    sent.get(name) != value
+                    for name, value in six.iteritems(self.login_cookies)):
+                # This was sent before the latest login; just repeat it.
+                login_r = self.login_response
+            else:
+                login_r = self.login(login_url)
+
+        # Repeat the request now that we've logged in.
+        set_request_cookies(r.request, self.login_cookies)
+        r.request.replayed_after_login = True
         r2 = self.session.send(r.request)
 
         # Add the previous requests to r.history so e.g. cookies get grabbed.
@@ -241,6 +809,19 @@ class ElementResponseHandler(lemonpy.ResponseHandler):
 
 
 class ElementSession(lemonpy.Session):
+    """A lemonpy.Session which parses JSON payloads into Elements.
+
+    Pass lazy=True to parse the members of each payload only as they are
+    read (see LazyMembers), rather than all at once; this saves much of
+    the time spent parsing large payloads of which little is used.
+
+    Pass a NavigationCache as navigation_cache to reuse the payloads
+    of links followed from Documents for a while, rather than GET them
+    each time they are read.
+
+    Any additional keyword arguments, such as pool_maxsize or thread_safe,
+    are passed on to lemonpy.Session.
+    """
 
     headers = {
         "user-agent": "pycrunch/%s" % __version__
@@ -248,13 +829,24 @@ class ElementSession(lemonpy.Session):
     handler_class = ElementResponseHandler
 
     def __init__(self, email=None, password=None, token=None, domain=None,
-                 progress_tracking=None):
+                 progress_tracking=None, lazy=False, navigation_cache=None, **kwargs):
         self.email = email
         self.password = password
         self.token = token
         self.domain = domain
         self.progress_tracking = progress_tracking or DefaultProgressTracking()
-        super(ElementSession, self).__init__()
+        self.lazy = lazy
+        self.navigation_cache = navigation_cache
+        super(ElementSession, self).__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        self.hooks["response"].refresh_login(request)
+        try:
+            return super(ElementSession, self).send(request, **kwargs)
+        finally:
+            if self.navigation_cache is not None and request.method not in ("GET", "HEAD"):
+                # Evict after the response, so no GET made meanwhile is kept.
+                self.navigation_cache.invalidate(request.url)
 
 
 
@@ -1,9 +1,11 @@
 # coding: utf-8
-import json
+from . import jsonlib
 from .lemonpy import URL
 from .shoji import wait_progress
+from .tracing import traced
 
 
+@traced("export_dataset")
 def export_dataset(dataset, options, format='csv', progress_tracker=None):
     """
     Exports a Crunch dataset in the desired format. This is a blocking function
@@ -16,7 +18,7 @@ def export_dataset(dataset, options, format='csv', progress_tracker=None):
     """
     session = dataset.session
     endpoint = dataset.export.views[format]
-    r = session.post(endpoint, json.dumps(options))
+    r = session.post(endpoint, jsonlib.dumps(options))
     dest_file = URL(r.headers['Location'], '')
     if r.status_code == 202:
         try:
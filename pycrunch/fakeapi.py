@@ -0,0 +1,739 @@
+"""An in-process stand-in for the Crunch API, for tests and benchmarks.
+
+FakeCrunchAPI is a WSGI application which serves enough of the Crunch API
+for the workflows of pycrunch to run against it: logging in, the shoji
+catalogs and entities of datasets and their variables, the dataset
+table, stream, summary, cube and export resources, and sources and
+batches (with 202 progress) for importing. It keeps its state in memory.
+FakeServer serves it (with wsgiref) on a local port, in a daemon thread:
+
+    >> from pycrunch import fakeapi
+    >> with fakeapi.FakeServer() as server:
+    ..     server.app.add_dataset("example", rows=1000)
+    ..     site = pycrunch.connect("me@example.com", "secret", server.url)
+    ..     ds = site.datasets.by("name")["example"].entity
+
+The app can also inject latency (a fixed or random delay in seconds
+before every response) and errors (a random fraction of responses, or
+the next few, fail with an error status) to exercise retries and rate
+limiting. Every request it receives is recorded in app.requests.
+
+Run "python -m pycrunch.fakeapi --port 8080" to serve it standalone.
+"""
+
+from __future__ import division
+
+import csv
+import io
+import itertools
+import random
+import re
+import threading
+import time
+from collections import OrderedDict, deque, namedtuple
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+import six
+from six.moves import urllib
+from six.moves.socketserver import ThreadingMixIn
+
+from pycrunch import jsonlib
+
+
+class FakeRequest(namedtuple("FakeRequest", ["method", "path", "query", "headers", "body"])):
+    """A request received by a FakeCrunchAPI."""
+
+    __slots__ = ()
+
+
+STATUS_LINES = {
+    200: "200 OK",
+    201: "201 Created",
+    202: "202 Accepted",
+    204: "204 No Content",
+    400: "400 Bad Request",
+    401: "401 Unauthorized",
+    404: "404 Not Found",
+    405: "405 Method Not Allowed",
+    429: "429 Too Many Requests",
+    500: "500 Internal Server Error",
+    502: "502 Bad Gateway",
+    503: "503 Service Unavailable",
+    504: "504 Gateway Timeout",
+}
+
+CATEGORIES = [
+    {"id": 1, "name": "Yes", "numeric_value": 1, "missing": False},
+    {"id": 2, "name": "No", "numeric_value": 0, "missing": False},
+    {"id": -1, "name": "No Data", "numeric_value": None, "missing": True},
+]
+
+DEFAULT_VARIABLES = [
+    {"alias": "id", "name": "ID", "type": "numeric"},
+    {"alias": "answer", "name": "Answer", "type": "categorical",
+     "categories": CATEGORIES},
+    {"alias": "score", "name": "Score", "type": "numeric"},
+    {"alias": "comment", "name": "Comment", "type": "text"},
+]
+
+
+class FakeDataset(object):
+    """A dataset of a FakeCrunchAPI: variable definitions and columns of data."""
+
+    def __init__(self, id, name, variables=None, description=""):
+        self.id = id
+        self.name = name
+        self.description = description
+        self.body_extra = {}
+        self.variables = OrderedDict()
+        self.columns = {}
+        self.rows = 0
+        self.batches = OrderedDict()
+        for var in variables or ():
+            self.add_variable(var)
+
+    def add_variable(self, var):
+        """Add a variable, given a dict with its alias, name and type."""
+        var = dict(var)
+        var_id = var.get("id") or "%06d" % (len(self.variables) + 1)
+        var["id"] = var_id
+        var.setdefault("name", var.get("alias", var_id))
+        var.setdefault("alias", var_id)
+        var.setdefault("type", "text")
+        if var["type"] == "categorical":
+            var.setdefault("categories", CATEGORIES)
+        values = var.pop("values", None)
+        self.variables[var_id] = var
+        column = self.columns[var_id] = [{"?": -1}] * self.rows
+        if values is not None:
+            column[:len(values)] = values
+        return var
+
+    def fake_value(self, var, i, rand):
+        if var["alias"] == "id":
+            return i
+        kind = var["type"]
+        if kind == "categorical":
+            return rand.choice([c["id"] for c in var["categories"]])
+        if kind == "numeric":
+            return round(rand.random() * 100, 2)
+        return "row %d" % i
+
+    def fill(self, rows, seed=0):
+        """Append the given number of rows of random data."""
+        rand = random.Random(seed)
+        for var_id, var in six.iteritems(self.variables):
+            self.columns[var_id].extend(
+                self.fake_value(var, i, rand)
+                for i in range(self.rows, self.rows + rows)
+            )
+        self.rows += rows
+
+    def append_row(self, row):
+        """Append one row, given as a dict of {variable id: value}."""
+        for var_id, column in six.iteritems(self.columns):
+            column.append(row.get(var_id, {"?": -1}))
+        self.rows += 1
+
+    def append_csv(self, text):
+        """Append the rows of the given CSV text; return how many.
+
+        The first row is skipped if it holds the aliases of the variables;
+        the cells of each row are otherwise assigned to the variables in
+        order, numbers being parsed as such and empty cells as No Data.
+        """
+        if six.PY3:
+            reader = csv.reader(io.StringIO(text))
+        else:  # pragma: no cover
+            reader = csv.reader(io.BytesIO(text.encode("utf-8")))
+        var_ids = list(self.variables)
+        aliases = [var["alias"] for var in six.itervalues(self.variables)]
+        count = 0
+        for n, cells in enumerate(reader):
+            if n == 0 and cells and set(cells) <= set(aliases):
+                var_ids = [var_ids[aliases.index(alias)] for alias in cells]
+                continue
+            row = {}
+            for var_id, cell in zip(var_ids, cells):
+                row[var_id] = parse_cell(cell)
+            self.append_row(row)
+            count += 1
+        return count
+
+
+def parse_cell(cell):
+    if cell == "":
+        return {"?": -1}
+    try:
+        value = float(cell)
+    except ValueError:
+        return cell
+    return int(value) if value.is_integer() else value
+
+
+def parse_multipart(body, content_type):
+    """Return a dict of {field name: bytes} from a multipart/form-data body."""
+    match = re.search(r'boundary="?([^";]+)"?', content_type)
+    if match is None:
+        return {}
+    boundary = b"--" + match.group(1).encode("ascii")
+    fields = {}
+    for part in body.split(boundary)[1:]:
+        if part.startswith(b"--"):
+            break
+        head, _, content = part.partition(b"\r\n\r\n")
+        name = re.search(br'name="([^"]*)"', head)
+        if name is not None:
+            fields[name.group(1).decode("utf-8")] = content[:-2]  # Trailing CRLF
+    return fields
+
+
+class Route(object):
+
+    def __init__(self, pattern, **handlers):
+        self.pattern = re.compile("^" + pattern + "$")
+        self.handlers = handlers
+
+
+class FakeCrunchAPI(object):
+    """A WSGI application which imitates the Crunch API.
+
+    If 'require_login' is True (the default), every request but a login
+    must carry a token cookie from a POST of any email and password to
+    the login URL; others receive 401 Unauthorized, as from Crunch.
+
+    Each response is delayed by 'latency' seconds, which may be a number
+    or a (min, max) tuple to choose from at random. A random 'error_rate'
+    fraction of requests fail with 'error_status'; call fail_next to make
+    the next few requests fail.
+
+    Progress (of imports and exports) reaches 100% after it has been
+    polled 'progress_steps' times.
+    """
+
+    def __init__(self, require_login=True, latency=0, error_rate=0,
+                 error_status=503, progress_steps=1, seed=0, max_requests=10000):
+        self.require_login = require_login
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.progress_steps = progress_steps
+        self.random = random.Random(seed)
+        self.lock = threading.RLock()
+        self._local = threading.local()
+        self.requests = deque(maxlen=max_requests)
+        self.request_count = 0
+        self.tokens = set()
+        self.datasets = OrderedDict()
+        self.sources = {}
+        self.progress = {}
+        self.downloads = {}
+        self._failures = deque()
+        self._ids = itertools.count(1)
+        self.routes = [
+            Route(r"/api/", GET=self.get_root),
+            Route(r"/api/public/login/", POST=self.post_login),
+            Route(r"/api/users/(\w+)/", GET=self.get_user),
+            Route(r"/api/sources/", POST=self.post_source),
+            Route(r"/api/sources/(\w+)/", GET=self.get_source, PATCH=self.ok),
+            Route(r"/api/progress/(\w+)/", GET=self.get_progress),
+            Route(r"/api/downloads/([\w-]+)\.(\w+)", GET=self.get_download),
+            Route(r"/api/datasets/", GET=self.get_datasets, POST=self.post_dataset),
+            Route(r"/api/datasets/(\w+)/", GET=self.get_dataset,
+                  PATCH=self.patch_dataset, DELETE=self.delete_dataset),
+            Route(r"/api/datasets/(\w+)/variables/", GET=self.get_variables,
+                  POST=self.post_variable, PATCH=self.patch_variables),
+            Route(r"/api/datasets/(\w+)/variables/(\w+)/", GET=self.get_variable,
+                  PATCH=self.patch_variable),
+            Route(r"/api/datasets/(\w+)/variables/(\w+)/values/", GET=self.get_values),
+            Route(r"/api/datasets/(\w+)/table/", GET=self.get_table, POST=self.ok),
+            Route(r"/api/datasets/(\w+)/stream/", POST=self.post_stream),
+            Route(r"/api/datasets/(\w+)/summary/", GET=self.get_summary),
+            Route(r"/api/datasets/(\w+)/cube/", GET=self.get_cube),
+            Route(r"/api/datasets/(\w+)/exclusion/", PATCH=self.ok),
+            Route(r"/api/datasets/(\w+)/export/", GET=self.get_export),
+            Route(r"/api/datasets/(\w+)/export/(\w+)/", POST=self.post_export),
+            Route(r"/api/datasets/(\w+)/batches/", GET=self.get_batches,
+                  POST=self.post_batch),
+            Route(r"/api/datasets/(\w+)/batches/(\w+)/", GET=self.get_batch),
+        ]
+
+    # --------------------------- Configuration --------------------------- #
+
+    def new_id(self):
+        return "%x" % next(self._ids)
+
+    def add_dataset(self, name, rows=0, variables=None, seed=0):
+        """Add a dataset with the given variables and rows of random data.
+
+        The 'variables' are dicts of alias, name and type (and categories,
+        for categorical variables); by default, DEFAULT_VARIABLES.
+        Return the new FakeDataset.
+        """
+        with self.lock:
+            ds = FakeDataset(self.new_id(), name, variables or DEFAULT_VARIABLES)
+            ds.fill(rows, seed)
+            self.datasets[ds.id] = ds
+            return ds
+
+    def fail_next(self, count=1, status=None):
+        """Make the next 'count' requests fail with the given (or error_) status."""
+        with self.lock:
+            self._failures.extend([status or self.error_status] * count)
+
+    # ------------------------------- WSGI -------------------------------- #
+
+    def __call__(self, environ, start_response):
+        method = environ["REQUEST_METHOD"]
+        path = environ.get("PATH_INFO", "/")
+        query = dict(urllib.parse.parse_qsl(environ.get("QUERY_STRING", "")))
+        headers = dict(
+            (key[5:].replace("_", "-").title(), value)
+            for key, value in six.iteritems(environ)
+            if key.startswith("HTTP_")
+        )
+        if environ.get("CONTENT_TYPE"):
+            headers["Content-Type"] = environ["CONTENT_TYPE"]
+        length = int(environ.get("CONTENT_LENGTH") or 0)
+        body = environ["wsgi.input"].read(length) if length else b""
+        request = FakeRequest(method, path, query, headers, body)
+
+        with self.lock:
+            self.requests.append(request)
+            self.request_count += 1
+            failure = self._failures.popleft() if self._failures else None
+            if failure is None and self.error_rate and self.random.random() < self.error_rate:
+                failure = self.error_status
+            latency = self.latency
+            if isinstance(latency, tuple):
+                latency = self.random.uniform(*latency)
+
+        if latency:
+            time.sleep(latency)
+        if failure is not None:
+            status, resp_headers, resp_body = failure, {}, {"message": "Injected failure"}
+        else:
+            try:
+                status, resp_headers, resp_body = self.dispatch(request, environ)
+            except Exception as exc:
+                status, resp_headers, resp_body = 500, {}, {"message": repr(exc)}
+        return self.respond(start_response, status, resp_headers, resp_body)
+
+    def base_url(self, environ):
+        return "http://%s" % environ.get("HTTP_HOST", "%s:%s" % (
+            environ["SERVER_NAME"], environ["SERVER_PORT"]))
+
+    def dispatch(self, request, environ):
+        self._local.base = self.base_url(environ)
+        for route in self.routes:
+            match = route.pattern.match(request.path)
+            if match is None:
+                continue
+            handler = route.handlers.get(request.method)
+            if handler is None:
+                return 405, {}, {"message": "Method not allowed"}
+            if self.require_login and handler != self.post_login and not self.logged_in(request):
+                return 401, {}, {"urls": {"login_url": self.url("/api/public/login/")}}
+            with self.lock:
+                return handler(request, *match.groups())
+        return 404, {}, {"message": "Not found: %s" % request.path}
+
+    def respond(self, start_response, status, headers, body):
+        headers = dict(headers)
+        if isinstance(body, (dict, list)):
+            body = jsonlib.dumps(body)
+            headers.setdefault("Content-Type", "application/json")
+        if isinstance(body, six.text_type):
+            body = body.encode("utf-8")
+        body = body or b""
+        headers["Content-Length"] = str(len(body))
+        start_response(
+            STATUS_LINES.get(status, "%d Unknown" % status),
+            [(str(k), str(v)) for k, v in six.iteritems(headers)]
+        )
+        return [body]
+
+    def logged_in(self, request):
+        cookies = request.headers.get("Cookie", "")
+        return any(
+            part.strip()[len("token="):] in self.tokens
+            for part in cookies.split(";")
+            if part.strip().startswith("token=")
+        )
+
+    def url(self, path):
+        return self._local.base + path
+
+    def dataset(self, ds_id):
+        ds = self.datasets.get(ds_id)
+        if ds is None:
+            raise KeyError("No such dataset %s" % ds_id)
+        return ds
+
+    def ds_url(self, ds, path=""):
+        return self.url("/api/datasets/%s/%s" % (ds.id, path))
+
+    def new_progress(self):
+        progress_id = self.new_id()
+        self.progress[progress_id] = 0
+        return self.url("/api/progress/%s/" % progress_id)
+
+    def accepted(self, location):
+        return 202, {"Location": location}, {
+            "element": "shoji:view", "value": self.new_progress()}
+
+    # ----------------------------- Resources ----------------------------- #
+
+    def ok(self, request, *args):
+        return 204, {}, b""
+
+    def get_root(self, request):
+        return 200, {}, {
+            "element": "shoji:catalog",
+            "self": self.url("/api/"),
+            "description": "The API root.",
+            "index": {},
+            "catalogs": {"datasets": self.url("/api/datasets/")},
+            "urls": {
+                "login_url": self.url("/api/public/login/"),
+                "user_url": self.url("/api/users/1/"),
+            },
+            "views": {},
+        }
+
+    def post_login(self, request):
+        token = "fake%s" % self.new_id()
+        self.tokens.add(token)
+        return 204, {"Set-Cookie": "token=%s; Path=/" % token}, b""
+
+    def get_user(self, request, user_id):
+        return 200, {}, {
+            "element": "shoji:entity",
+            "self": self.url("/api/users/%s/" % user_id),
+            "body": {"name": "Fake User", "email": "me@example.com"},
+            "catalogs": {"sources": self.url("/api/sources/")},
+        }
+
+    def post_source(self, request):
+        fields = parse_multipart(request.body, request.headers.get("Content-Type", ""))
+        source_id = self.new_id()
+        self.sources[source_id] = fields.get("uploaded_file", request.body)
+        return 201, {"Location": self.url("/api/sources/%s/" % source_id)}, b""
+
+    def get_source(self, request, source_id):
+        if source_id not in self.sources:
+            return 404, {}, {"message": "No such source"}
+        return 200, {}, {
+            "element": "shoji:entity",
+            "self": self.url("/api/sources/%s/" % source_id),
+            "body": {"settings": {}},
+        }
+
+    def get_progress(self, request, progress_id):
+        step = self.progress.get(progress_id)
+        if step is None:
+            return 404, {}, {"message": "No such progress"}
+        step = self.progress[progress_id] = step + 1
+        return 200, {}, {"element": "shoji:view", "value": {
+            "progress": min(100, int(100 * step / max(self.progress_steps, 1))),
+            "message": "",
+        }}
+
+    def get_download(self, request, name, format):
+        content = self.downloads.get(name)
+        if content is None:
+            return 404, {}, {"message": "No such download"}
+        return 200, {"Content-Type": "text/csv"}, content
+
+    def get_datasets(self, request):
+        return 200, {}, {
+            "element": "shoji:catalog",
+            "self": self.url("/api/datasets/"),
+            "index": dict(
+                (self.ds_url(ds), {"id": ds.id, "name": ds.name,
+                                   "description": ds.description})
+                for ds in six.itervalues(self.datasets)
+            ),
+        }
+
+    def post_dataset(self, request):
+        body = jsonlib.loads(request.body).get("body", {})
+        ds = FakeDataset(self.new_id(), body.get("name", "Untitled"),
+                         body.get("table", {}).get("metadata", {}).values(),
+                         body.get("description", ""))
+        self.datasets[ds.id] = ds
+        return 201, {"Location": self.ds_url(ds)}, b""
+
+    def get_dataset(self, request, ds_id):
+        ds = self.dataset(ds_id)
+        body = {"id": ds.id, "name": ds.name, "description": ds.description,
+                "size": {"rows": ds.rows, "columns": len(ds.variables)}}
+        body.update(ds.body_extra)
+        return 200, {}, {
+            "element": "shoji:entity",
+            "self": self.ds_url(ds),
+            "body": body,
+            "catalogs": {
+                "variables": self.ds_url(ds, "variables/"),
+                "batches": self.ds_url(ds, "batches/"),
+            },
+            "fragments": {
+                "table": self.ds_url(ds, "table/"),
+                "stream": self.ds_url(ds, "stream/"),
+                "exclusion": self.ds_url(ds, "exclusion/"),
+            },
+            "views": {
+                "summary": self.ds_url(ds, "summary/"),
+                "cube": self.ds_url(ds, "cube/"),
+                "export": self.ds_url(ds, "export/"),
+            },
+            "urls": {"user_url": self.url("/api/users/1/")},
+        }
+
+    def patch_dataset(self, request, ds_id):
+        ds = self.dataset(ds_id)
+        body = jsonlib.loads(request.body)
+        body = body.get("body", body)
+        ds.name = body.pop("name", ds.name)
+        ds.description = body.pop("description", ds.description)
+        ds.body_extra.update(body)
+        return 204, {}, b""
+
+    def delete_dataset(self, request, ds_id):
+        self.datasets.pop(ds_id, None)
+        return 204, {}, b""
+
+    def variable_tuple(self, var):
+        return dict((k, var[k]) for k in ("id", "name", "alias", "type"))
+
+    def get_variables(self, request, ds_id):
+        ds = self.dataset(ds_id)
+        return 200, {}, {
+            "element": "shoji:catalog",
+            "self": self.ds_url(ds, "variables/"),
+            "index": dict(
+                ("%s/" % var_id, self.variable_tuple(var))
+                for var_id, var in six.iteritems(ds.variables)
+            ),
+        }
+
+    def post_variable(self, request, ds_id):
+        ds = self.dataset(ds_id)
+        var = ds.add_variable(jsonlib.loads(request.body).get("body", {}))
+        return 201, {"Location": self.ds_url(ds, "variables/%s/" % var["id"])}, b""
+
+    def patch_variables(self, request, ds_id):
+        ds = self.dataset(ds_id)
+        index = jsonlib.loads(request.body).get("index", {})
+        for key, attrs in six.iteritems(index):
+            var_id = key.rstrip("/").rsplit("/", 1)[-1]
+            if var_id not in ds.variables:
+                continue
+            if attrs is None:
+                del ds.variables[var_id]
+                del ds.columns[var_id]
+            else:
+                ds.variables[var_id].update(attrs)
+        return 204, {}, b""
+
+    def get_variable(self, request, ds_id, var_id):
+        ds = self.dataset(ds_id)
+        var = ds.variables.get(var_id)
+        if var is None:
+            return 404, {}, {"message": "No such variable"}
+        return 200, {}, {
+            "element": "shoji:entity",
+            "self": self.ds_url(ds, "variables/%s/" % var_id),
+            "body": var,
+            "views": {"values": self.ds_url(ds, "variables/%s/values/" % var_id)},
+        }
+
+    def patch_variable(self, request, ds_id, var_id):
+        ds = self.dataset(ds_id)
+        body = jsonlib.loads(request.body).get("body", {})
+        ds.variables[var_id].update(body)
+        return 204, {}, b""
+
+    def get_values(self, request, ds_id, var_id):
+        ds = self.dataset(ds_id)
+        return 200, {}, {"element": "shoji:view", "value": ds.columns[var_id]}
+
+    def get_table(self, request, ds_id):
+        ds = self.dataset(ds_id)
+        offset = int(request.query.get("offset", 0))
+        limit = int(request.query.get("limit", ds.rows))
+        return 200, {}, {
+            "element": "crunch:table",
+            "self": self.ds_url(ds, "table/"),
+            "metadata": dict(ds.variables),
+            "data": dict(
+                (var_id, column[offset:offset + limit])
+                for var_id, column in six.iteritems(ds.columns)
+            ),
+        }
+
+    def post_stream(self, request, ds_id):
+        ds = self.dataset(ds_id)
+        for line in request.body.decode("utf-8").splitlines():
+            if line.strip():
+                ds.append_row(jsonlib.loads(line))
+        return 204, {}, b""
+
+    def get_summary(self, request, ds_id):
+        ds = self.dataset(ds_id)
+        return 200, {}, {"element": "shoji:view", "value": {
+            "unweighted": {"total": ds.rows},
+            "weighted": {"total": ds.rows},
+            "variables": len(ds.variables),
+        }}
+
+    def get_cube(self, request, ds_id):
+        ds = self.dataset(ds_id)
+        query = jsonlib.loads(request.query.get("query", "{}"))
+        counts = []
+        for dim in query.get("dimensions", [])[:1]:
+            ref = dim.get("variable") or (dim.get("args") or [{}])[0].get("variable")
+            var_id = (ref or "").rstrip("/").rsplit("/", 1)[-1]
+            var = ds.variables.get(var_id)
+            if var is not None and var["type"] == "categorical":
+                column = ds.columns[var_id]
+                counts = [
+                    sum(1 for value in column if value == cat["id"])
+                    for cat in var["categories"] if not cat["missing"]
+                ]
+        return 200, {}, {"element": "shoji:view", "value": {
+            "element": "crunch:cube",
+            "query": query,
+            "result": {"counts": counts or [ds.rows], "n": ds.rows},
+        }}
+
+    def get_export(self, request, ds_id):
+        ds = self.dataset(ds_id)
+        return 200, {}, {
+            "element": "shoji:view",
+            "self": self.ds_url(ds, "export/"),
+            "views": {
+                "csv": self.ds_url(ds, "export/csv/"),
+                "spss": self.ds_url(ds, "export/spss/"),
+            },
+        }
+
+    def post_export(self, request, ds_id, format):
+        ds = self.dataset(ds_id)
+        out = io.StringIO() if six.PY3 else io.BytesIO()
+        writer = csv.writer(out, lineterminator="\n")
+        writer.writerow([var["alias"] for var in six.itervalues(ds.variables)])
+        columns = list(six.itervalues(ds.columns))
+        for i in range(ds.rows):
+            writer.writerow([
+                "" if isinstance(column[i], dict) else column[i]
+                for column in columns
+            ])
+        name = "%s-%s" % (ds.id, self.new_id())
+        content = out.getvalue()
+        self.downloads[name] = content.encode("utf-8") if six.PY3 else content
+        return self.accepted(self.url("/api/downloads/%s.%s" % (name, format)))
+
+    def get_batches(self, request, ds_id):
+        ds = self.dataset(ds_id)
+        return 200, {}, {
+            "element": "shoji:catalog",
+            "self": self.ds_url(ds, "batches/"),
+            "index": dict(
+                ("%s/" % batch_id, {"status": batch["status"]})
+                for batch_id, batch in six.iteritems(ds.batches)
+            ),
+        }
+
+    def post_batch(self, request, ds_id):
+        ds = self.dataset(ds_id)
+        body = jsonlib.loads(request.body).get("body", {})
+        source_id = body.get("source", "").rstrip("/").rsplit("/", 1)[-1]
+        content = self.sources.get(source_id)
+        if content is None:
+            return 400, {}, {"message": "No such source"}
+        batch_id = self.new_id()
+        rows = ds.append_csv(content.decode("utf-8"))
+        ds.batches[batch_id] = {
+            "source": body["source"], "status": "imported", "rows": rows}
+        return self.accepted(self.ds_url(ds, "batches/%s/" % batch_id))
+
+    def get_batch(self, request, ds_id, batch_id):
+        ds = self.dataset(ds_id)
+        return 200, {}, {
+            "element": "shoji:entity",
+            "self": self.ds_url(ds, "batches/%s/" % batch_id),
+            "body": ds.batches[batch_id],
+        }
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class QuietHandler(WSGIRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeServer(object):
+    """Serves a FakeCrunchAPI on a local port from a daemon thread.
+
+    Use it as a context manager, or call start() and stop(). The API
+    root URL (to pass to pycrunch.connect) is server.url.
+    """
+
+    def __init__(self, app=None, host="127.0.0.1", port=0):
+        self.app = app or FakeCrunchAPI()
+        self.httpd = make_server(host, port, self.app,
+                                 server_class=ThreadingWSGIServer,
+                                 handler_class=QuietHandler)
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return "http://%s:%d/api/" % (host, port)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve a fake Crunch API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--rows", type=int, default=1000,
+                        help="rows of the example dataset")
+    parser.add_argument("--latency", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    args = parser.parse_args(argv)
+
+    app = FakeCrunchAPI(latency=args.latency, error_rate=args.error_rate)
+    app.add_dataset("example", rows=args.rows)
+    server = FakeServer(app, args.host, args.port)
+    print("Serving a fake Crunch API at %s" % server.url)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,23 @@
-import json
 import mimetypes
 import os
 import time
 
 import six
 
-from pycrunch import shoji, csvlib
+from pycrunch import shoji, csvlib, jsonlib
+from pycrunch.tracing import traced
+
+
+class Source(shoji.Entity):
+    """The shoji:entity of an uploaded source file."""
+
+    url_pattern = r"sources/[^/]+/"
+
+
+class Batch(shoji.Entity):
+    """The shoji:entity of a batch of rows appended to a dataset."""
+
+    url_pattern = r"datasets/[^/]+/batches/[^/]+/"
 
 
 class Importer(object):
@@ -29,6 +41,7 @@ class Importer(object):
         self.strict = strict
         self.progress_tracker = progress_tracker
 
+    @traced("Importer.wait_for_batch_status")
     def wait_for_batch_status(self, batch, status):
         """Wait for the given status(es) and return the batch. Error if not reached."""
         if isinstance(status, six.string_types):
@@ -53,6 +66,7 @@ class Importer(object):
             raise ValueError("The batch did not reach the '%s' state in the "
                              "given time. Please check again later." % status)
 
+    @traced("Importer.add_source")
     def add_source(self, ds, filename, fp, mimetype):
         """Create a new Source on the given dataset and return its URL."""
         sources_url = ds.user_url.catalogs['sources']
@@ -74,6 +88,7 @@ class Importer(object):
 
         return new_source_url
 
+    @traced("Importer.create_batch_from_source")
     def create_batch_from_source(self, ds, source_url, workflow=None, async=False,
                                  savepoint=True, autorollback=True):
         """Create and return a Batch on the given dataset for the given source."""
@@ -83,6 +98,7 @@ class Importer(object):
         }, savepoint=savepoint, autorollback=autorollback)
         return ds.batches.create(batch, progress_tracker=self.progress_tracker).refresh()
 
+    @traced("Importer.append_rows")
     def append_rows(self, ds, rows):
         """Append the given rows of Python values. Return the new Batch."""
         f = csvlib.rows_as_csv_file(rows)
@@ -90,6 +106,7 @@ class Importer(object):
     # Deprecated spelling:
     create_batch_from_rows = append_rows
 
+    @traced("Importer.append_csv_string")
     def append_csv_string(self, ds, csv_file, filename=None):
         """Append the given CSV string or open file. Return its Batch."""
         if filename is None:
@@ -100,6 +117,7 @@ class Importer(object):
     # Deprecated spellings:
     create_batch_from_csv_file = append_csv_string
 
+    @traced("Importer.append_stream")
     def append_stream(self, ds, fp, filename=None, mimetype=None):
         """Append the given file-like object to the dataset. Return its Batch."""
         if filename is None:
@@ -111,6 +129,7 @@ class Importer(object):
         source_url = self.add_source(ds, filename, fp, mimetype)
         return self.create_batch_from_source(ds, source_url)
 
+    @traced("Importer.append_file")
     def append_file(self, ds, path, filename=None, mimetype=None):
         """Append the file at the given path to the dataset. Return its Batch."""
         if filename is None:
@@ -122,6 +141,7 @@ class Importer(object):
         source_url = self.add_source(ds, filename, open(path, 'rb'), mimetype)
         return self.create_batch_from_source(ds, source_url)
 
+    @traced("Importer.stream_rows")
     def stream_rows(self, ds, values):
         """Send a data row (or list of rows) to the given dataset's stream.
 
@@ -139,7 +159,7 @@ class Importer(object):
             values = [values]
         return ds.session.post(
             ds.fragments.stream,
-            data="\n".join([json.dumps(row, indent=None) for row in values])
+            data="\n".join([jsonlib.dumps(row) for row in values])
         )
 
 
@@ -0,0 +1,107 @@
+"""JSON encoding and decoding for pycrunch, with a pluggable decoder.
+
+Responses are decoded with the fastest JSON library available: orjson
+if it is installed, then ujson, and otherwise the stdlib json module.
+To choose one explicitly:
+
+    >> import pycrunch.jsonlib
+    >> pycrunch.jsonlib.set_backend("json")
+
+Request bodies are always encoded with the stdlib, compactly, without the
+whitespace of pretty printing, which for large PATCH bodies is a substantial
+part of their size:
+
+    >>> dumps({"index": {"1/": {"name": "one"}}})
+    '{"index":{"1/":{"name":"one"}}}'
+
+The faster libraries are not used to encode, since their output differs:
+orjson writes NaN and Infinity as null, and encodes datetimes and other
+objects which the stdlib rejects, and ujson writes Inf for Infinity and
+can silently write invalid JSON for integers too large for it.
+The output of dumps is ASCII text (any other characters are escaped),
+so it is safe to pass as the data of a request.
+
+To build objects other than dicts while decoding, pass an object_hook,
+which is called with each decoded JSON object, innermost first:
+
+    >>> loads('{"a": {"b": 1}}', object_hook=lambda d: sorted(d))
+    ['a']
+
+Only the stdlib json module supports hooks, so it decodes such calls
+whichever backend is in use.
+"""
+
+import json
+
+BACKENDS = ("orjson", "ujson", "json")
+
+_stdlib_encoder = json.JSONEncoder(separators=(",", ":"))
+
+
+def _stdlib():
+    def loads(s):
+        if isinstance(s, bytes):
+            s = s.decode("utf-8")
+        return json.loads(s)
+
+    return loads
+
+
+def _orjson():
+    import orjson
+
+    return orjson.loads
+
+
+def _ujson():
+    import ujson
+
+    return ujson.loads
+
+
+_factories = {"orjson": _orjson, "ujson": _ujson, "json": _stdlib}
+
+backend = None
+_loads = None
+
+
+def set_backend(name=None):
+    """Use the named JSON backend, or the fastest available if None.
+
+    Raises ImportError if the named backend is not installed.
+    """
+    global backend, _loads
+    if name is None:
+        for name in BACKENDS:
+            try:
+                return set_backend(name)
+            except ImportError:
+                pass
+
+    if name not in _factories:
+        raise ValueError(
+            "Unknown JSON backend %r; choose one of %s" % (name, BACKENDS))
+    _loads = _factories[name]()
+    backend = name
+    return name
+
+
+def loads(s, object_hook=None):
+    """Return the Python object decoded from the given JSON text or bytes.
+
+    If 'object_hook' is given, it is called with each JSON object (as a
+    dict) as it is decoded, and its return value is used in place of it.
+    """
+    if object_hook is not None:
+        if isinstance(s, bytes):
+            s = s.decode("utf-8")
+        return json.loads(s, object_hook=object_hook)
+    return _loads(s)
+
+
+def dumps(obj):
+    """Return the given object encoded as compact, ASCII JSON text."""
+    return _stdlib_encoder.encode(obj)
+
+
+set_backend()
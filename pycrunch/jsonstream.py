@@ -0,0 +1,118 @@
+"""Incremental reading of JSON documents from a stream of bytes.
+
+The stdlib json module can only decode complete documents, so decoding a
+huge response requires holding all of its text in memory at once, and
+then all of its decoded values too. JSONStreamReader instead walks
+the members of JSON objects as the bytes arrive, decoding one member
+value at a time; only the text of the value being decoded is buffered.
+
+    >>> reader = JSONStreamReader([b'{"a": 1, "b"', b': {"c": [2, 3]}}'])
+    >>> for key in reader.iter_object():
+    ...     if key == 'b':
+    ...         for subkey in reader.iter_object():
+    ...             print(subkey, reader.read_value())
+    ...     else:
+    ...         print(key, reader.read_value())
+    a 1
+    c [2, 3]
+"""
+
+from __future__ import print_function
+
+import codecs
+import json
+import re
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+MIN_READ = 64 * 1024
+
+
+class JSONStreamReader(object):
+    """Reads JSON values incrementally from an iterable of byte chunks."""
+
+    def __init__(self, chunks, encoding="utf-8"):
+        self.chunks = iter(chunks)
+        self.decoder = codecs.getincrementaldecoder(encoding)()
+        self.json_decoder = json.JSONDecoder()
+        self.buf = u""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, size):
+        """Append at least 'size' more characters to the buffer, unless at EOF.
+
+        Consumed text is discarded first, so self.pos is reset to 0.
+        """
+        pieces = [self.buf[self.pos:]]
+        self.pos = 0
+        read = 0
+        while read < size and not self.eof:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                text = self.decoder.decode(b"", final=True)
+                self.eof = True
+            else:
+                text = self.decoder.decode(chunk)
+            pieces.append(text)
+            read += len(text)
+        self.buf = u"".join(pieces)
+
+    def peek(self):
+        """Skip whitespace and return the next character, or '' at EOF."""
+        while True:
+            self.pos = WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if self.eof:
+                return u""
+            self._fill(1)
+
+    def expect(self, char):
+        c = self.peek()
+        if c != char:
+            raise ValueError("Expected %r at position %d, found %r" %
+                             (char, self.pos, c))
+        self.pos += 1
+
+    def read_value(self):
+        """Decode and return the complete JSON value at the current position."""
+        self.peek()
+        size = MIN_READ
+        while True:
+            try:
+                value, end = self.json_decoder.raw_decode(self.buf, self.pos)
+            except ValueError:
+                if self.eof:
+                    raise
+            else:
+                # A value which ends at the end of the buffer may be
+                # a truncated number; read on to be sure it is complete.
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            # Grow geometrically, so that a value spanning many chunks
+            # is not re-decoded once per chunk.
+            size = max(size, len(self.buf) - self.pos)
+            self._fill(size)
+
+    def iter_object(self):
+        """Yield each key of the JSON object at the current position.
+
+        After each key is yielded, its value MUST be consumed (with
+        read_value or a nested iter_object) before the next key is read.
+        """
+        self.expect(u"{")
+        if self.peek() == u"}":
+            self.pos += 1
+            return
+        while True:
+            key = self.read_value()
+            self.expect(u":")
+            yield key
+            c = self.peek()
+            self.pos += 1
+            if c == u"}":
+                return
+            if c != u",":
+                raise ValueError("Expected ',' or '}' at position %d, found %r"
+                                 % (self.pos - 1, c))
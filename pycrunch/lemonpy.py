@@ -1,12 +1,28 @@
 from __future__ import division
 
 import logging
+import random
+import re
+import sys
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque
+from email.utils import mktime_tz, parsedate_tz
 
 import six
 from six.moves import urllib
 
 import requests
+from requests.adapters import DEFAULT_POOLBLOCK, DEFAULT_POOLSIZE
+from requests.cookies import RequestsCookieJar
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
 
+from pycrunch import tracing
+from pycrunch.transports import make_transport
+
+log = logging.getLogger(__name__)
 requests_log = logging.getLogger("requests")
 requests_log.setLevel(logging.WARNING)
 urljoin = requests.compat.urljoin
@@ -44,6 +60,21 @@ class ServerError(LemonPyError):
         super(ServerError, self).__init__(response, *args)
 
 
+class OfflineError(LemonPyError):
+    """Raised for a request which an offline cache cannot serve."""
+
+
+class CircuitOpenError(LemonPyError):
+    """Raised instead of sending a request to a host whose circuit is open."""
+
+    def __init__(self, host, retry_in):
+        super(CircuitOpenError, self).__init__(
+            "Too many failures from %s; not retrying for %.1f seconds."
+            % (host, retry_in), host, retry_in)
+        self.host = host
+        self.retry_in = retry_in
+
+
 class ResponseHandler(object):
     """A requests.Session response-hook aware of status and Content-Type.
 
@@ -59,16 +90,38 @@ class ResponseHandler(object):
 
     Assuming a handler is found, it should call self.parse_payload(r),
     which attempts to parse the Response based on its Content-Type.
+
+    If the session has a pycrunch.metrics.MetricsRegistry as its
+    .metrics attribute, each Response is also recorded in it.
+
+    If the session has a .stream_threshold (in bytes), a response body
+    larger than that (or of unknown length) is instead passed to a parser
+    registered in self.stream_parsers for its Content-Type, if any,
+    before it has been downloaded, so that it may be parsed as it arrives.
     """
 
     parsers = {
         'application/json': lambda session, r: r.json()
     }
+    stream_parsers = {}
 
     def __init__(self, session):
         self.session = session
 
     def __call__(self, r, *args, **kwargs):
+        metrics = getattr(self.session, "metrics", None)
+        if metrics is None:
+            return self.dispatch(r)
+
+        started = time.time()
+        r.parse_time = 0.0
+        try:
+            return self.dispatch(r)
+        finally:
+            metrics.record_response(r, started, r.parse_time)
+
+    def dispatch(self, r):
+        """Pass the given Response to the handler method for its status."""
         code = r.status_code
 
         # First, try the specific response status code
@@ -94,8 +147,32 @@ class ResponseHandler(object):
         have to examine the Response directly to determine its payload.
         """
         ct = r.headers.get("Content-Type", "").split(";", 1)[0]
-        parser = self.parsers.get(ct)
-        r.payload = parser(self.session, r) if parser else None
+        parser = None
+        streaming = self.should_stream(r)
+        if streaming:
+            parser = self.stream_parsers.get(ct)
+        if parser is None:
+            streaming = False
+            parser = self.parsers.get(ct)
+        if parser is None:
+            r.payload = None
+            return
+
+        if not streaming and getattr(self.session, "metrics", None) is not None:
+            # Download the body first, so only the parsing is timed.
+            r.content
+        start = time.time()
+        with tracing.tracer.span("parse", {"content_type": ct, "streaming": streaming}):
+            r.payload = parser(self.session, r)
+        r.parse_time = time.time() - start
+
+    def should_stream(self, r):
+        """Return True if the body of r should be parsed as it is downloaded."""
+        threshold = getattr(self.session, "stream_threshold", None)
+        if threshold is None or r._content_consumed:
+            return False
+        length = r.headers.get("Content-Length")
+        return length is None or int(length) >= threshold
 
     def status_2xx(self, r):
         self.parse_payload(r)
@@ -108,6 +185,11 @@ class ResponseHandler(object):
         r.payload = None
         return r
 
+    def status_304(self, r):
+        # Not Modified: a conditional GET whose cached payload is still valid.
+        r.payload = None
+        return r
+
     def status_4xx(self, r):
         self.parse_payload(r)
         raise ClientError(r)
@@ -142,16 +224,843 @@ def make_cookie(name, value, domain):
     )
 
 
+def parse_cache_control(value):
+    """Return the given Cache-Control header value as a dict of directives."""
+    directives = {}
+    for part in value.split(","):
+        name, _, arg = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = arg.strip('"') or None
+    return directives
+
+
+class CacheEntry(object):
+    """A cached GET response.
+
+    The entry is fresh for 'max_age' seconds after it was stored (or last
+    revalidated); after that it may still be served while it is revalidated
+    in the background for another 'stale_while_revalidate' seconds.
+    Both default to the values of the cache, but are overridden by
+    any max-age or stale-while-revalidate directives in the
+    Cache-Control header of the response.
+    """
+
+    def __init__(self, url, status_code, headers, content,
+                 max_age=0, stale_while_revalidate=0, stored_at=None):
+        self.url = url
+        self.status_code = status_code
+        # HTTP/2 servers send lowercase header names; look them up in any case.
+        self.headers = CaseInsensitiveDict(headers)
+        self.content = content
+        self.max_age = max_age
+        self.stale_while_revalidate = stale_while_revalidate
+        self.stored_at = time.time() if stored_at is None else stored_at
+        self._update_freshness(headers)
+
+    def _update_freshness(self, headers):
+        cc = parse_cache_control(headers.get("Cache-Control", ""))
+        if "no-cache" in cc:
+            self.max_age = 0
+        elif cc.get("max-age"):
+            self.max_age = int(cc["max-age"])
+        if cc.get("stale-while-revalidate"):
+            self.stale_while_revalidate = int(cc["stale-while-revalidate"])
+
+    @property
+    def size(self):
+        return len(self.content)
+
+    @property
+    def etag(self):
+        return self.headers.get("ETag")
+
+    @property
+    def last_modified(self):
+        return self.headers.get("Last-Modified")
+
+    def validators(self):
+        """Return the conditional request headers to revalidate this entry."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def is_fresh(self, now):
+        return now - self.stored_at < self.max_age
+
+    def is_usable_stale(self, now):
+        return now - self.stored_at < self.max_age + self.stale_while_revalidate
+
+    def revalidated(self, headers):
+        """Mark the entry as fresh again, given the headers of a 304 response."""
+        self.stored_at = time.time()
+        headers = CaseInsensitiveDict(headers)
+        for name in ("ETag", "Last-Modified", "Cache-Control"):
+            if name in headers:
+                self.headers[name] = headers[name]
+        self._update_freshness(headers)
+
+    def response(self, request=None):
+        """Return a requests.Response for this entry, without a payload."""
+        r = requests.Response()
+        r.status_code = self.status_code
+        r.headers = CaseInsensitiveDict(self.headers)
+        r.encoding = get_encoding_from_headers(r.headers)
+        r.url = self.url
+        r.request = request
+        r._content = self.content
+        r._content_consumed = True
+        r.from_cache = True
+        return r
+
+
+class ResponseCache(object):
+    """An in-memory LRU cache of GET responses.
+
+    Set an instance as Session.cache to have the session store every
+    successful GET response which has an ETag or Last-Modified header
+    (or a positive max-age). The next GET of the same URL is then sent
+    with If-None-Match and/or If-Modified-Since headers, and if the server
+    responds 304 Not Modified, the stored body is reused rather than
+    downloaded again. Entries which are still fresh (see CacheEntry)
+    are served without a request at all.
+
+    Each response served from the cache has its own payload, parsed from
+    the stored body, so callers may change it (as Document.refresh does)
+    without affecting any other.
+
+    GETs of URLs matching any of the 'volatile' regular expressions,
+    such as the progress URLs polled by shoji.wait_progress, are never
+    cached, so a max_age cannot serve them stale.
+
+    The cache is bounded by both the number of entries and the total size
+    of their response bodies (in bytes); the least recently used entries
+    are evicted first.
+
+    If 'offline' is True, the session serves every GET from the cache,
+    however stale, without any request; any other request, or a GET
+    of a URL which is not cached, raises OfflineError.
+
+    The counters 'hits' (served without downloading, including the
+    'stale_hits' subset served while revalidating in the background),
+    'misses', 'revalidations' (304 responses) and 'bytes_saved'
+    (response bodies not downloaded) measure the traffic saved.
+    """
+
+    def __init__(self, max_entries=1000, max_bytes=64 * 1024 * 1024,
+                 max_age=0, stale_while_revalidate=0, offline=False,
+                 volatile=(r"/progress/",)):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.stale_while_revalidate = stale_while_revalidate
+        self.offline = offline
+        self.volatile = re.compile("|".join(volatile)) if volatile else None
+        self.lock = threading.RLock()
+        self._entries = OrderedDict()
+        self._revalidating = set()
+        self.size = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.bytes_saved = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """Return a dict of the counters of this cache."""
+        with self.lock:
+            return {
+                "entries": len(self),
+                "size": self.size,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "revalidations": self.revalidations,
+                "bytes_saved": self.bytes_saved,
+            }
+
+    def key(self, session, url, params=None):
+        """Return the key under which the given session caches a GET of url."""
+        return cache_key(url, params)
+
+    def is_volatile(self, url):
+        """Return True if GETs of the given URL should not be cached."""
+        return self.volatile is not None and self.volatile.search(url) is not None
+
+    def lookup(self, key):
+        """Return the CacheEntry for the given key, or None."""
+        with self.lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                # Re-insert to mark the entry as the most recently used.
+                self._entries[key] = entry
+            return entry
+
+    def store(self, key, entry):
+        """Add the given CacheEntry, evicting others as needed."""
+        if entry.size > self.max_bytes:
+            return
+        with self.lock:
+            self._discard(key)
+            self._entries[key] = entry
+            self.size += entry.size
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+                old_key, old = self._entries.popitem(last=False)
+                self.size -= old.size
+
+    def discard(self, key):
+        """Remove the entry for the given key, if any."""
+        with self.lock:
+            self._discard(key)
+
+    def _discard(self, key):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.size -= old.size
+
+    def clear(self):
+        with self.lock:
+            self._entries.clear()
+            self.size = 0
+
+    def begin_revalidation(self, key):
+        """Return True if no background revalidation of key is in progress."""
+        with self.lock:
+            if key in self._revalidating:
+                return False
+            self._revalidating.add(key)
+            return True
+
+    def end_revalidation(self, key):
+        with self.lock:
+            self._revalidating.discard(key)
+
+    def record_hit(self, entry, stale=False):
+        with self.lock:
+            self.hits += 1
+            self.bytes_saved += entry.size
+            if stale:
+                self.stale_hits += 1
+
+    def update(self, key, entry, r):
+        """Update the cache from the Response to a (conditional) GET.
+
+        Return the CacheEntry for the response if it is cacheable, or None.
+        """
+        if r.status_code == 304 and entry is not None:
+            entry.revalidated(r.headers)
+            with self.lock:
+                self.revalidations += 1
+                self.bytes_saved += entry.size
+            return entry
+
+        with self.lock:
+            self.misses += 1
+        if r.status_code != 200 or r.request.method != "GET":
+            return None
+
+        cc = parse_cache_control(r.headers.get("Cache-Control", ""))
+        if "no-store" in cc:
+            self.discard(key)
+            return None
+
+        new = CacheEntry(
+            r.url, r.status_code, r.headers, r.content,
+            max_age=self.max_age,
+            stale_while_revalidate=self.stale_while_revalidate
+        )
+        if new.etag or new.last_modified or new.max_age > 0:
+            self.store(key, new)
+            return new
+        self.discard(key)
+        return None
+
+
+def cache_key(url, params=None):
+    """Return the absolute URL for the given url and query params."""
+    if not params:
+        return url
+    p = requests.PreparedRequest()
+    p.prepare_url(url, params)
+    return p.url
+
+
+class RequestCoalescer(object):
+    """Collapses concurrent identical GETs into a single request.
+
+    Set an instance as Session.coalescer to share one request among all
+    the threads which GET the same URL (with the same params, headers and
+    other arguments) while it is in flight: the first thread sends it and
+    the others wait, then all get the same Response (and parsed payload)
+    or exception. The 'requests' counter is the number of GETs sent, and
+    'saved' the number of GETs which were not sent but shared one instead.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.requests = 0
+        self.saved = 0
+
+    def key(self, url, kwargs):
+        """Return the key of a GET with the given arguments, or None."""
+        params = kwargs.get("params")
+        key = (
+            cache_key(url, params),
+            tuple(sorted(six.iteritems(kwargs.get("headers") or {}))),
+            tuple(sorted(
+                (k, v) for k, v in six.iteritems(kwargs)
+                if k not in ("params", "headers")
+            )),
+        )
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def call(self, key, func):
+        """Return func(), or the result of the call to it in flight for key."""
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _CoalescedCall()
+                self.requests += 1
+            else:
+                self.saved += 1
+
+        if leader:
+            try:
+                call.result = func()
+            except BaseException:
+                call.exc_info = sys.exc_info()
+                raise
+            finally:
+                with self.lock:
+                    del self.calls[key]
+                call.done.set()
+            return call.result
+
+        call.done.wait()
+        if call.exc_info is not None:
+            six.reraise(*call.exc_info)
+        return call.result
+
+    def stats(self):
+        """Return a dict of the counters of this coalescer."""
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "saved": self.saved,
+                "in_flight": len(self.calls),
+            }
+
+
+class _CoalescedCall(object):
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.exc_info = None
+
+
+class CircuitBreaker(object):
+    """Fails fast for a host which keeps failing.
+
+    After 'threshold' consecutive failures the circuit "opens", and requests
+    raise CircuitOpenError without being sent. After 'reset_timeout'
+    seconds it is "half-open": one trial request is let through, which
+    closes the circuit again if it succeeds or re-opens it if it fails.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, host, threshold=5, reset_timeout=30, on_change=None):
+        self.host = host
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.on_change = on_change
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def _set_state(self, state):
+        if state != self.state:
+            old, self.state = self.state, state
+            if self.on_change is not None:
+                self.on_change(self, old, state)
+
+    def before_request(self):
+        """Raise CircuitOpenError unless a request may be sent now."""
+        with self.lock:
+            if self.state == self.CLOSED:
+                return
+            retry_in = self.opened_at + self.reset_timeout - time.time()
+            if self.state == self.OPEN and retry_in <= 0:
+                # Let this one request through as a trial.
+                self._set_state(self.HALF_OPEN)
+                return
+            raise CircuitOpenError(self.host, max(retry_in, 0))
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self._set_state(self.CLOSED)
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                self.opened_at = time.time()
+                self._set_state(self.OPEN)
+
+
+class RetryPolicy(object):
+    """Retries failed requests with exponential backoff and jitter.
+
+    Set an instance as Session.retry_policy to retry requests which fail
+    with a connection error or timeout, or with one of the 'statuses'
+    (by default 429 Too Many Requests and the 502, 503 and 504 statuses
+    of an unavailable server). Requests are retried only if their method
+    is idempotent, except that a 429 response (which the server did not
+    act upon) is retried whatever the method.
+
+    Before retry number n (starting at 0) the session sleeps for a random
+    time between 0 and min(backoff_max, backoff_factor * 2 ** n) seconds,
+    or for the time given by a Retry-After header on the response,
+    if present, but never longer than backoff_max.
+
+    Each host also gets a CircuitBreaker with the given 'breaker_threshold'
+    and 'breaker_timeout'; while it is open, requests to that host fail
+    immediately with CircuitOpenError. Pass breaker_threshold=None to
+    disable circuit breaking.
+
+    Every retry and breaker state change is appended to self.events
+    (a bounded deque of dicts), and logged; the 'retries' counter and
+    'retry_time' (seconds spent on failed attempts and backing off)
+    measure the total cost of retrying.
+    """
+
+    idempotent_methods = frozenset(["GET", "HEAD", "OPTIONS", "PUT", "DELETE"])
+    connection_errors = (
+        requests.exceptions.ConnectionError,
+        requests.exceptions.Timeout,
+        requests.exceptions.ChunkedEncodingError,
+    )
+
+    def __init__(self, max_retries=3, backoff_factor=0.5, backoff_max=30,
+                 statuses=(429, 502, 503, 504), methods=None,
+                 breaker_threshold=5, breaker_timeout=30, max_events=1000):
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.backoff_max = backoff_max
+        self.statuses = frozenset(statuses)
+        if methods is not None:
+            self.idempotent_methods = frozenset(m.upper() for m in methods)
+        self.breaker_threshold = breaker_threshold
+        self.breaker_timeout = breaker_timeout
+        self.lock = threading.Lock()
+        self.breakers = {}
+        self.events = deque(maxlen=max_events)
+        self.retries = 0
+        self.retry_time = 0.0
+
+    def breaker(self, url):
+        """Return the CircuitBreaker for the host of the given URL, or None."""
+        if self.breaker_threshold is None:
+            return None
+        host = urllib.parse.urlsplit(url).netloc
+        with self.lock:
+            breaker = self.breakers.get(host)
+            if breaker is None:
+                breaker = self.breakers[host] = CircuitBreaker(
+                    host, self.breaker_threshold, self.breaker_timeout,
+                    on_change=self._breaker_changed)
+            return breaker
+
+    def is_retryable(self, method, status=None):
+        """Return True if a request which failed with status may be retried.
+
+        A status of None means the request failed without a response.
+        """
+        if status == 429 and 429 in self.statuses:
+            return True
+        if method.upper() not in self.idempotent_methods:
+            return False
+        return status is None or status in self.statuses
+
+    def delay(self, attempt, r=None):
+        """Return the seconds to wait before the given retry attempt."""
+        if r is not None:
+            retry_after = parse_retry_after(r.headers.get("Retry-After"))
+            if retry_after is not None:
+                # Don't let the server block the caller for hours.
+                return min(retry_after, self.backoff_max)
+        return random.uniform(
+            0, min(self.backoff_max, self.backoff_factor * (2 ** attempt)))
+
+    def record(self, event, **info):
+        info.update(event=event, time=time.time())
+        with self.lock:
+            self.events.append(info)
+        log.info("%s: %r", event, info)
+
+    def record_retry(self, request, attempt, reason, elapsed, delay):
+        with self.lock:
+            self.retries += 1
+            self.retry_time += elapsed + delay
+        self.record("retry", method=request.method, url=request.url,
+                    attempt=attempt, reason=reason,
+                    elapsed=elapsed, delay=delay)
+
+    def _breaker_changed(self, breaker, old, new):
+        self.record("breaker", host=breaker.host, old=old, new=new,
+                    failures=breaker.failures)
+
+    def stats(self):
+        """Return a dict of the counters of this policy."""
+        with self.lock:
+            return {
+                "retries": self.retries,
+                "retry_time": self.retry_time,
+                "open_circuits": sorted(
+                    host for host, b in six.iteritems(self.breakers)
+                    if b.state != CircuitBreaker.CLOSED),
+            }
+
+
+def parse_retry_after(value):
+    """Return the seconds to wait from a Retry-After header value, or None."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    date = parsedate_tz(value)
+    if date is None:
+        return None
+    return max(mktime_tz(date) - time.time(), 0)
+
+
+class ConcurrencyLimiter(object):
+    """Adapts the number of requests in flight to the health of the server.
+
+    Set an instance as Session.limiter to make every request sent by the
+    session (from any thread) wait until fewer than 'limit' requests are
+    in flight. The limit starts at 'initial' and is adjusted as responses
+    arrive (additive increase, multiplicative decrease):
+
+    * after each healthy response, it grows by 1 / limit, that is,
+      by about one per round of 'limit' requests, up to 'max_limit';
+    * on a 'throttle_statuses' response (by default 429 and 503), or a
+      latency spike, it is multiplied by 'backoff', down to 'min_limit'.
+
+    A latency spike is a time to first byte above 'latency_target'
+    seconds if that is given, or else above 'spike_factor' times the
+    moving average of recent latencies. Only responses to requests which
+    were sent after the last decrease can decrease the limit again, so
+    one burst of throttled requests cuts it just once.
+
+    A thread which already holds a slot (for example, while a response
+    handler replays a request after logging in, or while following
+    a redirect) does not wait for another.
+
+    If the session has a pycrunch.metrics.MetricsRegistry, the limit and
+    the number of requests in flight are kept in its "concurrency_limit"
+    and "requests_in_flight" gauges.
+    """
+
+    def __init__(self, initial=4, min_limit=1, max_limit=64, backoff=0.5,
+                 latency_target=None, spike_factor=3.0, smoothing=0.1,
+                 throttle_statuses=(429, 503)):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.latency_target = latency_target
+        self.spike_factor = spike_factor
+        self.smoothing = smoothing
+        self.throttle_statuses = frozenset(throttle_statuses)
+        self.condition = threading.Condition()
+        self._local = threading.local()
+        self.in_flight = 0
+        self.latency = None
+        self.last_decrease = 0.0
+        self.throttled = 0
+        self.spikes = 0
+        self.decreases = 0
+
+    def acquire(self):
+        """Wait for a free slot, take it, and return the time it was taken.
+
+        Return None, without waiting, if this thread already holds a slot.
+        """
+        if getattr(self._local, "held", False):
+            return None
+        with self.condition:
+            while self.in_flight >= max(int(self.limit), self.min_limit):
+                self.condition.wait()
+            self.in_flight += 1
+        self._local.held = True
+        return time.time()
+
+    def release(self, started, status=None, latency=None):
+        """Free the slot taken at 'started' and adjust the limit.
+
+        The 'status' of the response (None if there was none, in which
+        case the limit is left alone) and its 'latency' (by default, the
+        time since 'started') determine the adjustment. A 'started' of
+        None (from a nested acquire) is ignored.
+        """
+        if started is None:
+            return
+        self._local.held = False
+        if latency is None:
+            latency = time.time() - started
+        with self.condition:
+            self.in_flight -= 1
+            if status is not None:
+                if status in self.throttle_statuses:
+                    self.throttled += 1
+                    self._decrease(started)
+                elif self._is_spike(latency):
+                    self.spikes += 1
+                    self._decrease(started)
+                elif self.limit < self.max_limit:
+                    self.limit = min(self.limit + 1.0 / self.limit, self.max_limit)
+
+                if self.latency is None:
+                    self.latency = latency
+                else:
+                    self.latency += self.smoothing * (latency - self.latency)
+            self.condition.notify_all()
+
+    def _is_spike(self, latency):
+        if self.latency_target is not None:
+            return latency > self.latency_target
+        return self.latency is not None and latency > self.spike_factor * self.latency
+
+    def _decrease(self, started):
+        if started < self.last_decrease:
+            return
+        self.limit = max(self.limit * self.backoff, self.min_limit)
+        self.last_decrease = time.time()
+        self.decreases += 1
+
+    def stats(self):
+        """Return a dict of the current limit and the counters of this limiter."""
+        with self.condition:
+            return {
+                "limit": self.limit,
+                "in_flight": self.in_flight,
+                "latency": self.latency,
+                "throttled": self.throttled,
+                "spikes": self.spikes,
+                "decreases": self.decreases,
+            }
+
+
+class RequestCompression(object):
+    """Compresses large request bodies before they are sent.
+
+    Set an instance as Session.compression to compress the body of any
+    POST, PUT or PATCH request of at least 'threshold' bytes with the
+    given 'encoding' ("gzip" or "deflate"), and send it with a matching
+    Content-Encoding header. Only JSON and text bodies (or bodies with no
+    Content-Type, such as Importer.stream_rows sends) are compressed,
+    and only when that makes them smaller.
+
+    Set 'enabled' to False if the server does not accept compressed
+    bodies. A server which answers a compressed request with 415
+    Unsupported Media Type is also remembered (in self.rejected_hosts),
+    and the request is sent again uncompressed; later requests to that
+    host are not compressed.
+
+    The 'requests', 'bytes_in' and 'bytes_out' counters record the number
+    of compressed requests and their total size before and after.
+    """
+
+    methods = frozenset(["POST", "PUT", "PATCH"])
+    content_types = ("application/json", "text/")
+
+    def __init__(self, threshold=16 * 1024, encoding="gzip", level=6, enabled=True):
+        if encoding not in ("gzip", "deflate"):
+            raise ValueError("Unsupported encoding %r" % encoding)
+        self.threshold = threshold
+        self.encoding = encoding
+        self.level = level
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.rejected_hosts = set()
+        self.requests = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def compressible(self, request):
+        if not self.enabled or request.method not in self.methods:
+            return False
+        if "Content-Encoding" in request.headers:
+            return False
+        content_type = request.headers.get("Content-Type")
+        if content_type and not content_type.startswith(self.content_types):
+            return False
+        return urllib.parse.urlsplit(request.url).netloc not in self.rejected_hosts
+
+    def compress(self, request):
+        """Compress the body of the given PreparedRequest, if worthwhile.
+
+        Return the original body if it was compressed, otherwise None.
+        """
+        body = request.body
+        if body is None or hasattr(body, "read") or not self.compressible(request):
+            return None
+        data = body.encode("utf-8") if isinstance(body, six.text_type) else body
+        if len(data) < self.threshold:
+            return None
+
+        wbits = zlib.MAX_WBITS | 16 if self.encoding == "gzip" else zlib.MAX_WBITS
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, wbits)
+        compressed = compressor.compress(data) + compressor.flush()
+        if len(compressed) >= len(data):
+            return None
+
+        request.body = compressed
+        request.headers["Content-Encoding"] = self.encoding
+        request.headers["Content-Length"] = str(len(compressed))
+        with self.lock:
+            self.requests += 1
+            self.bytes_in += len(data)
+            self.bytes_out += len(compressed)
+        return body
+
+    def reject(self, request, body):
+        """Restore the given uncompressed body, and stop compressing for its host."""
+        host = urllib.parse.urlsplit(request.url).netloc
+        log.warning("%s rejected a compressed request body; "
+                    "no longer compressing requests to it", host)
+        with self.lock:
+            self.rejected_hosts.add(host)
+        del request.headers["Content-Encoding"]
+        request.prepare_body(body, None)
+
+    def stats(self):
+        """Return a dict of the counters of this compressor."""
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "bytes_saved": self.bytes_in - self.bytes_out,
+                "rejected_hosts": sorted(self.rejected_hosts),
+            }
+
+
+class LockingCookieJar(RequestsCookieJar):
+    """A RequestsCookieJar which may be read while other threads write to it.
+
+    CookieJar already serializes its writes (and header generation) with
+    self._cookies_lock, but iterating over the jar, which requests does
+    to merge cookies into each new request, walks the underlying dicts
+    without it. This iterates over a snapshot taken under the lock instead.
+    """
+
+    def __iter__(self):
+        with self._cookies_lock:
+            cookies = list(super(LockingCookieJar, self).__iter__())
+        return iter(cookies)
+
+
 class Session(requests.Session):
+    """A requests.Session which dispatches responses to its handler_class.
+
+    Connections are pooled by the transport adapter (by default, an
+    HTTPAdapter) mounted for http:// and https:// URL's. By default
+    requests pools up to 10 connections per host and, once they are all
+    in use, opens (and then discards) extra ones. When many threads share
+    one session, pass pool_maxsize of at least the number of threads,
+    and optionally pool_block=True to make threads wait for a free
+    connection rather than open new ones. pool_connections is the number
+    of per-host pools to keep.
+
+    Pass thread_safe=True to share one session across threads: cookies
+    are then held in a LockingCookieJar, and the merging of session
+    headers and cookies into each request happens under self.lock.
+    Code which mutates session.headers or session.cookies after
+    the session has been shared should hold self.lock while doing so.
+
+    Pass a ResponseCache as 'cache' to revalidate repeated GETs of
+    the same URL rather than downloading and parsing them again.
+
+    Pass a RetryPolicy as 'retry_policy' to retry requests which fail
+    transiently, and to stop sending requests to a host which is down.
+
+    Pass a pycrunch.metrics.MetricsRegistry as 'metrics' to record
+    the size and timings of every request.
+
+    Pass a 'stream_threshold' (in bytes) to parse larger responses
+    incrementally as they are downloaded, where the handler supports it.
+
+    Pass a RequestCompression as 'compression' to gzip large request bodies.
+
+    Pass the name of one of pycrunch.transports.TRANSPORTS as 'transport'
+    to send requests with another HTTP library than requests itself.
+
+    Pass a RequestCoalescer as 'coalescer' to share one GET among
+    the threads which request the same URL at the same time.
+
+    Pass a ConcurrencyLimiter as 'limiter' to adapt the number of
+    requests in flight at once (from all threads) to the server's health.
+
+    Each request sent is recorded as a span by pycrunch.tracing.tracer,
+    once it has an exporter.
+
+    The URL's of the entities in catalog indexes are interned in
+    self.url_table; see URLTable.
+    """
 
     headers = {
         "Accept-Encoding": "gzip",
     }
     handler_class = ResponseHandler
 
-    def __init__(self):
+    def __init__(self, pool_connections=DEFAULT_POOLSIZE,
+                 pool_maxsize=DEFAULT_POOLSIZE, pool_block=DEFAULT_POOLBLOCK,
+                 thread_safe=False, cache=None, retry_policy=None, metrics=None,
+                 stream_threshold=None, compression=None, transport=None,
+                 coalescer=None, limiter=None):
         super(Session, self).__init__()
 
+        self.lock = threading.RLock()
+        self.thread_safe = thread_safe
+        self.cache = cache
+        self.retry_policy = retry_policy
+        self.metrics = metrics
+        self.stream_threshold = stream_threshold
+        self.compression = compression
+        self.coalescer = coalescer
+        self.limiter = limiter
+        self.url_table = URLTable()
+        if thread_safe:
+            self.cookies = LockingCookieJar()
+
+        for prefix in ('https://', 'http://'):
+            self.mount(prefix, make_transport(
+                transport,
+                pool_connections=pool_connections,
+                pool_maxsize=pool_maxsize,
+                pool_block=pool_block
+            ))
+
         self.headers.update(self.__class__.headers)
 
         if self.token:
@@ -160,39 +1069,311 @@ class Session(requests.Session):
 
         self.hooks["response"] = self.handler_class(self)
 
+    def prepare_request(self, request):
+        if self.thread_safe:
+            with self.lock:
+                return super(Session, self).prepare_request(request)
+        return super(Session, self).prepare_request(request)
+
+    def send(self, request, **kwargs):
+        with tracing.tracer.span("HTTP %s" % request.method, {
+            "http.method": request.method,
+            "http.url": request.url,
+        }) as span:
+            r = self._send_compressed(request, **kwargs)
+            span.set_attribute("http.status_code", r.status_code)
+            return r
+
+    def _send_compressed(self, request, **kwargs):
+        compression = self.compression
+        body = None if compression is None else compression.compress(request)
+        if body is None:
+            return self._send(request, **kwargs)
+
+        try:
+            return self._send(request, **kwargs)
+        except ClientError as exc:
+            if exc.status_code != 415:
+                raise
+            compression.reject(request, body)
+            return self._send(request, **kwargs)
+
+    def _send(self, request, **kwargs):
+        policy = self.retry_policy
+        if policy is None:
+            return self._send_once(request, **kwargs)
+
+        breaker = policy.breaker(request.url)
+        attempt = 0
+        while True:
+            if breaker is not None:
+                breaker.before_request()
+            start = time.time()
+            try:
+                r = self._send_once(request, **kwargs)
+            except (ClientError, ServerError) as exc:
+                error, r = exc, exc.args[0]
+                status = r.status_code
+            except policy.connection_errors as exc:
+                error, r = exc, None
+                status = None
+            else:
+                if breaker is not None:
+                    breaker.record_success()
+                return r
+            elapsed = time.time() - start
+
+            if breaker is not None:
+                if status is None or status >= 500:
+                    breaker.record_failure()
+                    if breaker.state == CircuitBreaker.OPEN:
+                        # Don't retry through a circuit we just opened.
+                        raise error
+                else:
+                    breaker.record_success()
+
+            if attempt >= policy.max_retries or not policy.is_retryable(request.method, status):
+                raise error
+
+            delay = policy.delay(attempt, r)
+            policy.record_retry(request, attempt, status or error.__class__.__name__,
+                                elapsed, delay)
+            time.sleep(delay)
+            attempt += 1
+
+    def _send_once(self, request, **kwargs):
+        limiter = self.limiter
+        if limiter is None:
+            return super(Session, self).send(request, **kwargs)
+
+        started = limiter.acquire()
+        r = None
+        try:
+            r = super(Session, self).send(request, **kwargs)
+            return r
+        except (ClientError, ServerError) as exc:
+            r = exc.args[0]
+            raise
+        finally:
+            if r is None:
+                limiter.release(started)
+            else:
+                limiter.release(started, r.status_code, r.elapsed.total_seconds())
+            metrics = self.metrics
+            if metrics is not None:
+                metrics.set_gauge("concurrency_limit", limiter.limit)
+                metrics.set_gauge("requests_in_flight", limiter.in_flight)
+
+    def warm_up(self, url, connections=1):
+        """Open connections to the host of url before they are needed.
+
+        The connections (and their TLS handshakes) are made concurrently,
+        and kept in the pool of the transport mounted for url, so that the
+        first requests to the host need not wait for them. Return the number
+        of connections opened; failures are logged rather than raised,
+        so that the requests which follow report them instead.
+        """
+        warm_up = getattr(self.get_adapter(url), "warm_up", None)
+        if warm_up is None:
+            return 0
+        try:
+            return warm_up(url, connections, verify=self.verify)
+        except Exception:
+            log.warning("Could not warm up connections to %s", url, exc_info=True)
+            return 0
+
+    def request(self, method, url, *args, **kwargs):
+        coalescer = self.coalescer
+        if (
+            coalescer is not None and not args and
+            method.upper() == "GET" and not kwargs.get("stream")
+        ):
+            key = coalescer.key(url, kwargs)
+            if key is not None:
+                return coalescer.call(
+                    key, lambda: self._request(method, url, **kwargs))
+        return self._request(method, url, *args, **kwargs)
+
+    def _request(self, method, url, *args, **kwargs):
+        if self.cache is None:
+            return super(Session, self).request(method, url, *args, **kwargs)
+
+        method = method.upper()
+        if method == "GET" and not args and not kwargs.get("stream") \
+                and not self.cache.is_volatile(url):
+            return self._cached_get(url, **kwargs)
+
+        if self.cache.offline:
+            raise OfflineError("Cannot %s %s while offline" % (method, url))
+        r = super(Session, self).request(method, url, *args, **kwargs)
+        if method not in ("GET", "HEAD", "OPTIONS"):
+            # Any write to a resource invalidates our copy of it.
+            self.cache.discard(self.cache.key(self, url))
+        return r
+
+    def _cached_get(self, url, **kwargs):
+        """GET the given URL via self.cache, revalidating any stored entry."""
+        key = self.cache.key(self, url, kwargs.get("params"))
+        entry = self.cache.lookup(key)
+        if self.cache.offline:
+            if entry is None:
+                raise OfflineError("%s is not cached" % url)
+            self.cache.record_hit(entry, stale=not entry.is_fresh(time.time()))
+            return self._cached_response(entry)
+        if entry is not None:
+            now = time.time()
+            if entry.is_fresh(now):
+                self.cache.record_hit(entry)
+                return self._cached_response(entry)
+            if entry.is_usable_stale(now) and self.cache.begin_revalidation(key):
+                t = threading.Thread(target=self._revalidate,
+                                     args=(key, entry, url, kwargs))
+                t.daemon = True
+                t.start()
+                self.cache.record_hit(entry, stale=True)
+                return self._cached_response(entry)
+
+        return self._conditional_get(key, entry, url, kwargs)
+
+    def _conditional_get(self, key, entry, url, kwargs):
+        if entry is not None:
+            kwargs = dict(kwargs)
+            kwargs["headers"] = dict(kwargs.get("headers") or {}, **entry.validators())
+
+        r = super(Session, self).request("GET", url, **kwargs)
+        new = self.cache.update(key, entry, r)
+        if r.status_code == 304 and new is not None:
+            return self._cached_response(new, r.request)
+        return r
+
+    def _revalidate(self, key, entry, url, kwargs):
+        try:
+            self._conditional_get(key, entry, url, kwargs)
+        except Exception:
+            # The stale entry is kept; the next request will try again.
+            log.exception("Revalidation of %s failed", key)
+        finally:
+            self.cache.end_revalidation(key)
+
+    def _cached_response(self, entry, request=None):
+        """Return a Response for the given CacheEntry, with a new payload.
+
+        The stored body is parsed again for each response, rather than
+        sharing one payload, since callers may change their payloads.
+        """
+        r = entry.response(request)
+        self.hooks["response"].parse_payload(r)
+        return r
+
 
 class URL(str):
-    """A subclass of str for URL's. self.absolute = urljoin(self.base, self)."""
+    """A subclass of str for URL's. self.absolute = urljoin(self.base, self).
+
+    The absolute URL, and its parsed parts, are computed when first
+    needed and then kept until self.base is changed.
+    """
 
     def __new__(cls, value, *args, **kwargs):
         return str.__new__(cls, value)
 
     def __init__(self, value, base):
-        self.base = base
+        self._base = base
+        self._absolute = None
+        self._parts = None
+
+    @property
+    def base(self):
+        return self._base
+
+    @base.setter
+    def base(self, base):
+        self._base = base
+        self._absolute = None
+        self._parts = None
 
     @property
     def absolute(self):
         """Return self, which may be relative to self.base, as an absolute URL."""
-        return urljoin(self.base, self)
+        absolute = self._absolute
+        if absolute is None:
+            absolute = self._absolute = urljoin(self._base, self)
+        return absolute
+
+    @property
+    def parts(self):
+        """Return (urlparse(self.absolute), tuple of its path segments)."""
+        parts = self._parts
+        if parts is None:
+            parts = self._parts = _url_parts(self.absolute)
+        return parts
 
     def relative_to(self, base):
         """Return self, relative to the given absolute base."""
-        base = urllib.parse.urlparse(base)
-        new = urllib.parse.urlparse(self.absolute)
+        base, base_path = base.parts if isinstance(base, URL) else _url_parts(base)
+        new, new_path = self.parts
 
         if base.scheme != new.scheme or base.netloc != new.netloc:
             return self.absolute
 
-        base_path = base.path.split('/')[:-1]
-        new_path = new.path.split('/')
-        while base_path and new_path:
-            a, b = base_path[0], new_path[0]
+        base_path = base_path[:-1]
+        common = 0
+        for a, b in zip(base_path, new_path):
             if a != b:
                 break
-            base_path.pop(0)
-            new_path.pop(0)
-        new_path = (['..'] * len(base_path)) + new_path
-        new_path = '/'.join(new_path)
+            common += 1
+        new_path = '/'.join(['..'] * (len(base_path) - common) + list(new_path[common:]))
 
         return urllib.parse.urlunparse(("", "", new_path,
                                     new.params, new.query, new.fragment))
+
+
+def _url_parts(url):
+    parsed = urllib.parse.urlparse(url)
+    return parsed, tuple(parsed.path.split('/'))
+
+
+class URLTable(object):
+    """Interns the URL instances of a session.
+
+    Every Index of every Catalog GET'ed makes a URL for each of its entries,
+    most of which are the same as those made for the previous GET of that
+    catalog (or of another catalog of the same entities). Asking the table
+    for a URL instead returns any URL of the same value and base which it
+    already holds, so that each is stored, and its absolute form computed,
+    only once. At most 'max_urls' URL's are held; the least recently used
+    are dropped first. (URL's cannot be held weakly, since Python 2 has no
+    weak references to str subclasses.)
+
+    Since interned URL's are shared, their .base must not be changed.
+    """
+
+    def __init__(self, max_urls=100000):
+        self.max_urls = max_urls
+        self.lock = threading.Lock()
+        self.urls = OrderedDict()
+
+    def __len__(self):
+        return len(self.urls)
+
+    def get(self, value, base):
+        """Return the interned URL for the given value and base."""
+        key = (value, base)
+        with self.lock:
+            url = self.urls.pop(key, None)
+            if url is None:
+                url = URL(value, base)
+                if len(self.urls) >= self.max_urls:
+                    self.urls.popitem(last=False)
+            self.urls[key] = url
+        return url
+
+
+def intern_url(session, value, base):
+    """Return a URL for the given value and base from session.url_table.
+
+    A new URL is returned if the session has no URLTable.
+    """
+    table = getattr(session, "url_table", None)
+    if isinstance(table, URLTable):
+        return table.get(value, base)
+    return URL(value, base)
@@ -0,0 +1,234 @@
+"""Per-request metrics for pycrunch sessions.
+
+Pass a MetricsRegistry to a Session to record every HTTP request it makes:
+
+    >> registry = pycrunch.metrics.MetricsRegistry()
+    >> site = pycrunch.connect(user, pw, metrics=registry)
+    >> ds = site.datasets.by('name')['my dataset'].entity
+    >> for (method, template), stats in registry.summary().items():
+    ..     print(method, template, stats['count'], stats['latency']['p50'])
+    GET /api/ 1 0.213
+    GET /api/datasets/ 1 0.097
+    GET /api/datasets/{id}/ 1 0.088
+
+The ResponseHandler of the session creates one RequestRecord per response.
+Records are aggregated by method and URL template (the URL path with
+any ids collapsed to "{id}"). They are also passed to each exporter
+function added with registry.add_exporter, for example to forward them
+to a monitoring system or to write them to a log.
+"""
+
+import bisect
+import logging
+import re
+import threading
+import time
+from collections import deque, namedtuple
+
+import six
+from six.moves import urllib
+
+log = logging.getLogger(__name__)
+
+ID_SEGMENT = re.compile(r"^(?:\d+|[0-9a-fA-F]{6,}|[0-9a-fA-F-]{32,36})$")
+
+
+def url_template(url):
+    """Return the path of the given URL with any id segments collapsed.
+
+    >>> url_template('https://app.crunch.io/api/datasets/5d3c2a/variables/000001/?limit=5')
+    '/api/datasets/{id}/variables/{id}/'
+    """
+    path = urllib.parse.urlsplit(url).path
+    return "/".join(
+        "{id}" if ID_SEGMENT.match(segment) else segment
+        for segment in path.split("/")
+    )
+
+
+class RequestRecord(namedtuple("RequestRecord", [
+    "method", "url", "template", "status",
+    "bytes_sent", "bytes_received",
+    "ttfb", "latency", "parse_time", "timestamp",
+])):
+    """The metrics of a single HTTP request.
+
+    The 'ttfb' (time to first byte) is the time until the response headers
+    were received, 'latency' is the time until the response was handled,
+    including downloading the body, and 'parse_time' is the part of that
+    spent parsing the body into a payload. All are in seconds.
+    """
+
+    __slots__ = ()
+
+
+# Exponential bucket boundaries from 1ms to ~2 minutes.
+DEFAULT_BOUNDS = tuple(0.001 * (2 ** i) for i in range(18))
+
+
+class Histogram(object):
+    """Counts observations into buckets, for approximate quantiles."""
+
+    def __init__(self, bounds=DEFAULT_BOUNDS):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else None
+
+    def quantile(self, q):
+        """Return the upper bound of the bucket holding the q quantile."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank and n:
+                if i == len(self.bounds):
+                    return self.max
+                return min(self.bounds[i], self.max)
+        return self.max  # pragma: no cover
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min,
+            "max": self.max,
+            "mean": self.mean,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+        }
+
+
+class RequestStats(object):
+    """The aggregated metrics of all requests with the same method and template."""
+
+    timings = ("ttfb", "latency", "parse_time")
+
+    def __init__(self):
+        self.count = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.statuses = {}
+        for name in self.timings:
+            setattr(self, name, Histogram())
+
+    def add(self, record):
+        self.count += 1
+        self.bytes_sent += record.bytes_sent
+        self.bytes_received += record.bytes_received
+        self.statuses[record.status] = self.statuses.get(record.status, 0) + 1
+        for name in self.timings:
+            getattr(self, name).observe(getattr(record, name))
+
+    def as_dict(self):
+        d = {
+            "count": self.count,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "statuses": dict(self.statuses),
+        }
+        for name in self.timings:
+            d[name] = getattr(self, name).as_dict()
+        return d
+
+
+class MetricsRegistry(object):
+    """An in-process registry of RequestRecords.
+
+    The most recent 'max_records' records are kept in self.records;
+    all are aggregated into RequestStats by (method, template).
+
+    Current values, such as the limit of a lemonpy.ConcurrencyLimiter,
+    are kept by name in self.gauges.
+    """
+
+    def __init__(self, max_records=10000):
+        self.lock = threading.Lock()
+        self.records = deque(maxlen=max_records)
+        self.stats = {}
+        self.gauges = {}
+        self.exporters = []
+
+    def add_exporter(self, exporter):
+        """Call the given exporter(record) for every new RequestRecord."""
+        self.exporters.append(exporter)
+
+    def record(self, record):
+        with self.lock:
+            self.records.append(record)
+            key = (record.method, record.template)
+            stats = self.stats.get(key)
+            if stats is None:
+                stats = self.stats[key] = RequestStats()
+            stats.add(record)
+
+        for exporter in self.exporters:
+            try:
+                exporter(record)
+            except Exception:
+                log.exception("Metrics exporter %r failed", exporter)
+
+    def set_gauge(self, name, value):
+        """Set the current value of the named gauge."""
+        with self.lock:
+            self.gauges[name] = value
+
+    def record_response(self, r, started, parse_time):
+        """Record the given handled Response.
+
+        The 'started' argument is the time.time() at which the response
+        was passed to the handler, after its headers had been received.
+        """
+        now = time.time()
+        ttfb = r.elapsed.total_seconds()
+        request = r.request
+        body = request.body
+        if body is None or hasattr(body, "read"):
+            bytes_sent = 0
+        else:
+            bytes_sent = len(body)
+
+        bytes_received = r.headers.get("Content-Length")
+        if bytes_received is not None:
+            bytes_received = int(bytes_received)
+        elif r._content_consumed and r._content:
+            bytes_received = len(r._content)
+        else:
+            bytes_received = 0
+
+        self.record(RequestRecord(
+            request.method, request.url, url_template(request.url),
+            r.status_code, bytes_sent, bytes_received,
+            ttfb, ttfb + (now - started), parse_time, now
+        ))
+
+    def summary(self):
+        """Return a dict of {(method, template): stats dict}."""
+        with self.lock:
+            return dict(
+                (key, stats.as_dict())
+                for key, stats in six.iteritems(self.stats)
+            )
+
+    def reset(self):
+        with self.lock:
+            self.records.clear()
+            self.stats.clear()
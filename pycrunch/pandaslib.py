@@ -1,6 +1,8 @@
 import six
 from pandas import DataFrame, Categorical, Series, to_datetime
 
+from pycrunch.tracing import traced
+
 
 def series_from_variable(col, vardef):
     """Return the given Crunch column and variable def as a Pandas Series."""
@@ -25,6 +27,7 @@ def series_from_variable(col, vardef):
 ROWCHUNKSIZE = 1000
 
 
+@traced("dataframe")
 def dataframe(dataset, variables=None):
     """Return a Pandas DataFrame for the given Crunch Dataset Entity object.
     Retrieve a dataset using pycrunch.get_dataset("dataset name or id").
@@ -4,16 +4,23 @@ See https://bitbucket.org/fumanchu/shoji/src/tip/spec.txt?at=default
 for the latest Shoji specification.
 """
 
-import json
 
+import threading
 import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 from six.moves import urllib
 
 import six
 
 import pycrunch
-from pycrunch import elements
-from pycrunch.lemonpy import URL, ClientError, ServerError
+from pycrunch import elements, jsonlib
+from pycrunch.tracing import traced
+from pycrunch.lemonpy import URL, ClientError, ServerError, intern_url, urljoin
+
+DEFAULT_FETCH_WORKERS = 8
+DEFAULT_EDIT_BATCH = 500
 
 
 class Tuple(elements.JSONObject):
@@ -75,27 +82,100 @@ class Index(elements.JSONObject):
             if tup is not None:
                 url = entity_url
                 if not hasattr(url, "relative_to"):  # Faster than isinstance(url, URL)
-                    url = URL(url, catalog_url_absolute)
+                    url = intern_url(session, url, catalog_url_absolute)
 
                 members[entity_url] = Tuple(session, url, **tup)
 
         elements.JSONObject.__init__(self, **members)
 
+    @classmethod
+    def from_tuples(cls, session, catalog_url, tuples):
+        """Return an Index of the given (url, Tuple) pairs without copying them.
+
+        Each Tuple.entity_url is replaced by the (interned) URL of its
+        entity relative to the given catalog_url.
+        """
+        if not isinstance(catalog_url, URL):
+            catalog_url = URL(catalog_url, "")
+        self = cls.__new__(cls)
+        self.session = session
+        self.catalog_url = catalog_url
+        base, frag = urllib.parse.urldefrag(catalog_url.absolute)
+        for entity_url, tup in tuples:
+            if isinstance(tup, Tuple):
+                tup.entity_url = intern_url(session, entity_url, base)
+        dict.update(self, tuples)
+        return self
+
+    def fetch_entities(self, max_workers=DEFAULT_FETCH_WORKERS, refresh=False):
+        """Concurrently fetch the Entity of each Tuple into Tuple.entity.
+
+        Up to 'max_workers' requests are made at once. Tuples whose entity
+        has already been fetched are skipped unless 'refresh' is True.
+        A failure to fetch one entity does not stop the others; instead,
+        a dict of {entity_url: exception} is returned for all failures.
+        """
+        tuples = [
+            tup for tup in six.itervalues(self)
+            if tup is not None and (refresh or tup._entity is None)
+        ]
+        errors = {}
+        if not tuples:
+            return errors
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = dict((executor.submit(tup.fetch), tup) for tup in tuples)
+            for future in as_completed(futures):
+                tup = futures[future]
+                try:
+                    tup._entity = future.result()
+                except Exception as exc:
+                    errors[tup.entity_url] = exc
+        return errors
+
+
+class LazyIndex(elements.LazyMembers, Index):
+    """An Index which makes the Tuple for each entity when it is first read.
+
+    This is the Index of catalogs parsed lazily (see elements.LazyMembers);
+    the URL of each entity is only resolved, and its Tuple made (lazily),
+    when it is read.
+    """
+
+    def __init__(self, session, catalog_url, **members):
+        self.session = session
+        self.catalog_url = catalog_url
+        elements.JSONObject.__init__(self, **members)
+        self._raw = set(k for k, v in six.iteritems(members) if type(v) is dict)
+        self._lazy_session = session
+
+    def _parse_member(self, entity_url, tup):
+        base, frag = urllib.parse.urldefrag(self.catalog_url.absolute)
+        url = intern_url(self.session, entity_url, base)
+        return elements.lazy_class(Tuple)(self.session, url, **tup)
+
+
+elements.lazy_classes[Index] = LazyIndex
+
 
 class Catalog(elements.Document):
     """A Shoji Catalog."""
 
     element = "shoji:catalog"
     navigation_collections = ("catalogs", "orders", "views", "urls")
+    index_class = Index
+    _secondary_indexes = None
 
     def __init__(__this__, session, **members):
         if 'self' in members:
             if not isinstance(members['self'], URL):
-                members['self'] = URL(members['self'], "")
-            if 'index' in members:
-                members['index'] = Index(session, members['self'], **members['index'])
+                members['self'] = intern_url(session, members['self'], "")
+            if 'index' in members and not isinstance(members['index'], Index):
+                members['index'] = __this__.index_class(
+                    session, members['self'], **members['index'])
         super(Catalog, __this__).__init__(session, **members)
 
+    @traced("Catalog.create")
     def create(self, entity=None, progress_tracker=None):
         """POST the given Entity to this catalog to create a new resource.
 
@@ -117,6 +197,11 @@ class Catalog(elements.Document):
 
         An entity is returned.
         """
+        entity = self._new_entity(entity)
+        return self._wait_for_progress(entity, self.post(data=entity.json), progress_tracker)
+
+    def _new_entity(self, entity=None):
+        """Return the given entity (or attributes) as an Entity to create."""
         _cls = Entity
         if 'self' in self and (
                     self['self'].endswith('/api/datasets/') or
@@ -129,7 +214,7 @@ class Catalog(elements.Document):
             entity = _cls(self.session)
         elif isinstance(entity, dict) and not isinstance(entity, Entity):
             entity = _cls(self.session, **entity)
-        return self._wait_for_progress(entity, self.post(data=entity.json), progress_tracker)
+        return entity
 
     def by(self, attr):
         """Return the Tuples of self.index indexed by the given 'attr' instead.
@@ -141,12 +226,65 @@ class Catalog(elements.Document):
         The specified attr is not popped from the Tuple; it is merely
         copied to the output keys. Due to restrictions on Python dicts,
         specifying attrs which are not hashable will raise an error.
+
+        The result is kept, and returned again by later calls, until
+        self.index is replaced or changes size, or self is refreshed or
+        edited (see invalidate_indexes); treat it as read-only.
         """
-        return elements.JSONObject(**dict(
+        return self._secondary_index("by", attr, lambda: elements.JSONObject(**dict(
             (tupl[attr], tupl)
             for tupl in six.itervalues(self.index)
             if attr in tupl
-        ))
+        )))
+
+    def by_all(self, attr):
+        """Return lists of the Tuples of self.index indexed by the given 'attr'.
+
+        This is the multi-valued counterpart of by(), for attributes which
+        are not unique, such as "name": each value of the attribute maps
+        to a list of all the Tuples with that value, in index order.
+        """
+        def build():
+            result = elements.JSONObject()
+            for tupl in six.itervalues(self.index):
+                if attr in tupl:
+                    result.setdefault(tupl[attr], []).append(tupl)
+            return result
+        return self._secondary_index("by_all", attr, build)
+
+    def _secondary_index(self, kind, attr, build):
+        """Return the memoized result of build() for the given kind and attr."""
+        index = self.index
+        indexes = self._secondary_indexes
+        if indexes is None:
+            indexes = self._secondary_indexes = {}
+        entry = indexes.get((kind, attr))
+        if entry is not None and entry[0] is index and entry[1] == len(index):
+            return entry[2]
+        result = build()
+        indexes[(kind, attr)] = (index, len(index), result)
+        return result
+
+    def invalidate_indexes(self):
+        """Discard the memoized results of by() and by_all().
+
+        This is done automatically by refresh, edit, edit_index, drop
+        and add; call it after changing the Tuples of self.index in place.
+        """
+        self._secondary_indexes = None
+
+    def refresh(self):
+        """GET self.self, update self with its payload and return self."""
+        self.invalidate_indexes()
+        return super(Catalog, self).refresh()
+
+    def fetch_entities(self, max_workers=DEFAULT_FETCH_WORKERS, refresh=False):
+        """Concurrently fetch the Entity of each Tuple in self.index.
+
+        See Index.fetch_entities; a dict of {entity_url: exception}
+        is returned for any entities which could not be fetched.
+        """
+        return self.index.fetch_entities(max_workers, refresh)
 
     def add(self, entity_url, attrs=None, **kwargs):
         """Add the given entity, plus any spurious index attributes (ICK), to self.
@@ -154,24 +292,66 @@ class Catalog(elements.Document):
         This is a total hack because Crunch has an endpoint (dataset permissions)
         where non-tuples are included in a Catalog.index.
         """
+        self.invalidate_indexes()
         kwargs[entity_url] = attrs or {}
-        p = json.dumps(dict(element="shoji:catalog", self=self.self, index=kwargs))
+        p = jsonlib.dumps(dict(element="shoji:catalog", self=self.self, index=kwargs))
         return self.patch(data=p).payload
 
     def edit(self, entity_url, **attrs):
         """Update the catalog with the given entity attributes."""
-        p = self.__class__(self.session, self=self.self, index={entity_url: attrs})
-        return self.patch(data=p.json).payload
+        return self.edit_index({entity_url: attrs})
 
     def edit_index(self, index):
-        """Update the catalog with the given (probably partial) index."""
-        p = self.__class__(self.session, self=self.self, index=index)
-        return self.patch(data=p.json).payload
+        """Update the catalog with the given (probably partial) index.
+
+        Within a buffered_edits block for this catalog, the index is
+        merged into the buffer instead, and None is returned.
+        """
+        self.invalidate_indexes()
+        buf = active_edit_buffer(self)
+        if buf is not None:
+            for entity_url, attrs in six.iteritems(index):
+                buf.edit(entity_url, attrs)
+            return None
+        return self.patch(data=self._index_patch(index)).payload
 
     def drop(self, entity_url):
         """Delete the given entity from the catalog."""
-        p = self.__class__(self.session, self=self.self, index={entity_url: None})
-        return self.patch(data=p.json).payload
+        return self.edit_index({entity_url: None})
+
+    @contextmanager
+    def buffered_edits(self, max_size=DEFAULT_EDIT_BATCH):
+        """Buffer the edits and drops of entities in this catalog.
+
+        Within the block, edit, drop and edit_index calls on this catalog
+        (or any Catalog with the same URL), and Entity.edit calls on any of
+        the entities in its index, made by the current thread, are merged
+        into an EditBuffer rather than sent one at a time. Each time
+        edits of 'max_size' entities have been buffered they are sent as
+        one edit_index PATCH; any remaining are sent when the block exits
+        (unless it raised an error, in which case they are discarded):
+
+            with ds.variables.buffered_edits() as edits:
+                for url, tup in ds.variables.index.items():
+                    ds.variables.edit(url, name=tup.name.title())
+            print(edits.patches)
+
+        Entity.edit buffers only the attributes which the entity's tuple
+        in the catalog index holds; any others are sent to the entity
+        at once, as outside the block.
+        """
+        buf = EditBuffer(self, max_size)
+        stack = _edit_buffer_stack()
+        stack.append(buf)
+        try:
+            yield buf
+        finally:
+            stack.remove(buf)
+        buf.flush()
+
+    def _index_patch(self, index):
+        """Return the JSON body of a PATCH of the given partial index."""
+        return self.__class__(self.session, self=self.self, index=index).json
 
     def _wait_for_progress(self, entity, r, progress_tracker):
         entity.self = URL(r.headers['Location'], '')
@@ -188,21 +368,129 @@ class Catalog(elements.Document):
         return entity
 
 
+class EditBuffer(object):
+    """Pending edits of the entities of a Catalog; see Catalog.buffered_edits.
+
+    Edits of the same entity are merged, later attributes replacing
+    earlier ones; once an entity is dropped, later edits of it are ignored.
+    The 'patches' counter is the number of PATCH requests sent.
+    """
+
+    def __init__(self, catalog, max_size=DEFAULT_EDIT_BATCH):
+        self.catalog = catalog
+        self.max_size = max_size
+        self.pending = OrderedDict()
+        self.patches = 0
+        self._entity_urls = None
+
+    def __len__(self):
+        return len(self.pending)
+
+    def edit(self, entity_url, attrs):
+        """Buffer the given attrs (or a drop, if None) of the given entity."""
+        pending = self.pending
+        if attrs is None:
+            pending[entity_url] = None
+        elif entity_url not in pending:
+            pending[entity_url] = dict(attrs)
+        elif pending[entity_url] is not None:
+            pending[entity_url].update(attrs)
+
+        if len(pending) >= self.max_size:
+            self.flush()
+
+    def flush(self):
+        """Send all pending edits as one edit_index PATCH."""
+        if not self.pending:
+            return
+        index, self.pending = self.pending, OrderedDict()
+        self.catalog.patch(data=self.catalog._index_patch(index))
+        self.patches += 1
+
+    def index_key(self, entity_url):
+        """Return the key of the given entity in the catalog index, or None."""
+        if self._entity_urls is None:
+            base = self.catalog.self
+            self._entity_urls = dict(
+                (urljoin(base, key), key) for key in self.catalog.index.keys())
+        return self._entity_urls.get(entity_url)
+
+    def index_members(self, key):
+        """Return the names of the attributes the catalog index holds for the given key."""
+        return frozenset(self.catalog.index.get(key) or ())
+
+
+_edit_buffers = threading.local()
+
+
+def _edit_buffer_stack():
+    stack = getattr(_edit_buffers, "stack", None)
+    if stack is None:
+        stack = _edit_buffers.stack = []
+    return stack
+
+
+def active_edit_buffer(catalog):
+    """Return the current thread's EditBuffer for the given Catalog, or None."""
+    stack = getattr(_edit_buffers, "stack", None)
+    if stack:
+        url = catalog.get("self")
+        for buf in reversed(stack):
+            if buf.catalog is catalog:
+                return buf
+            if url is not None and buf.catalog.get("self") == url:
+                return buf
+    return None
+
+
+def _entity_edit_buffer(entity_url):
+    """Return the (buffer, index key) for edits of the given entity, or (None, None)."""
+    stack = getattr(_edit_buffers, "stack", None)
+    if stack:
+        for buf in reversed(stack):
+            key = buf.index_key(entity_url)
+            if key is not None:
+                return buf, key
+    return None, None
+
+
 class Entity(elements.Document):
 
     element = "shoji:entity"
     navigation_collections = ("catalogs", "fragments", "views", "urls")
+    tuple_class = Tuple
 
     def __init__(__this__, session, **members):
         members.setdefault("body", {})
         if 'self' in members:
             if not isinstance(members['self'], URL):
-                members['self'] = URL(members['self'], "")
-            members['body'] = Tuple(session, members['self'], **members['body'])
+                members['self'] = intern_url(session, members['self'], "")
+            members['body'] = __this__.tuple_class(
+                session, members['self'], **members['body'])
         super(Entity, __this__).__init__(session, **members)
 
     def edit(self, **body_attrs):
-        """Update the entity with the new body attributes."""
+        """Update the entity with the new body attributes.
+
+        Within a Catalog.buffered_edits block for a catalog of this entity,
+        the attributes which its index holds are buffered as an edit of
+        the index instead. Any others are sent to the entity as usual;
+        if there are none, None is returned.
+        """
+        if 'self' in self:
+            buf, key = _entity_edit_buffer(getattr(self.self, "absolute", self.self))
+            if buf is not None:
+                indexed = buf.index_members(key)
+                buffered = dict(
+                    (k, v) for k, v in six.iteritems(body_attrs) if k in indexed)
+                if buffered:
+                    buf.edit(key, buffered)
+                    self.body.update(buffered)
+                    body_attrs = dict(
+                        (k, v) for k, v in six.iteritems(body_attrs) if k not in indexed)
+                    if not body_attrs:
+                        return None
+
         p = self.__class__(self.session, body=body_attrs)
         payload = super(Entity, self).patch(data=p.json).payload
         self.body.update(body_attrs)
@@ -220,6 +508,7 @@ class Entity(elements.Document):
         return self
 
 
+@traced("wait_progress")
 def wait_progress(r, session, progress_tracker=None, entity=None):
     """Waits for completion of an Entity from API response that provides progress reporting.
 
@@ -250,11 +539,7 @@ def wait_progress(r, session, progress_tracker=None, entity=None):
         prog_r = session.get(progress_url)
         progress = prog_r.payload['value']
         progress_tracker.on_progress(progress_state, progress)
-        if progress['progress'] == -1:
-            # Completed due to error
-            raise TaskError(progress['message'])
-        elif progress['progress'] == 100:
-            # Completed with success
+        if progress_completed(progress):
             break
         time.sleep(progress_tracker.interval)
     else:
@@ -262,6 +547,18 @@ def wait_progress(r, session, progress_tracker=None, entity=None):
         raise TaskProgressTimeoutError(entity, r)
 
 
+def progress_completed(progress):
+    """Return True if the given progress value is complete, False if not.
+
+    Raise TaskError if the task completed due to an error.
+    """
+    if progress['progress'] == -1:
+        # Completed due to error
+        raise TaskError(progress['message'])
+    # Completed with success?
+    return progress['progress'] == 100
+
+
 class View(elements.Document):
 
     element = "shoji:view"
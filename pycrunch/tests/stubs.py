@@ -0,0 +1,122 @@
+"""Helpers for testing sessions without a network."""
+
+import io
+import json
+import threading
+
+from requests.adapters import HTTPAdapter
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from six.moves.socketserver import ThreadingMixIn
+
+try:
+    from requests.packages.urllib3.response import HTTPResponse
+except ImportError:  # pragma: no cover
+    from urllib3.response import HTTPResponse
+
+
+class StubAdapter(HTTPAdapter):
+    """A transport adapter which answers requests from a responder function.
+
+    The responder is called with each PreparedRequest and must return
+    a (status, headers, body) tuple; a non-string body is sent as JSON.
+    Mount an instance on a session for a URL prefix to use it:
+
+        session.mount('http://api.test/', StubAdapter(responder))
+    """
+
+    def __init__(self, responder):
+        super(StubAdapter, self).__init__()
+        self.responder = responder
+        self.requests = []
+
+    def send(self, request, **kwargs):
+        self.requests.append(request)
+        status, headers, body = self.responder(request)
+        headers = dict(headers)
+        if not isinstance(body, (bytes, type(u''))):
+            body = json.dumps(body)
+            headers.setdefault('Content-Type', 'application/json')
+        if not isinstance(body, bytes):
+            body = body.encode('utf-8')
+        headers.setdefault('Content-Length', str(len(body)))
+        resp = HTTPResponse(
+            body=io.BytesIO(body), headers=headers, status=status,
+            preload_content=False, decode_content=False
+        )
+        return self.build_response(request, resp)
+
+
+class StubServer(object):
+    """A local HTTP server which answers requests from a responder function.
+
+    The responder is called with a StubRequest for each request and must
+    return a (status, headers, body) tuple, as for StubAdapter. The server
+    runs in a daemon thread from start() until stop():
+
+        server = StubServer(responder).start()
+        session.get(server.url('/api/'))
+    """
+
+    def __init__(self, responder):
+        self.responder = responder
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def handle_request(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                request = StubRequest(self.command, self.path, self.headers, body)
+                stub.requests.append(request)
+                status, headers, body = stub.responder(request)
+                headers = dict(headers)
+                if not isinstance(body, (bytes, type(u''))):
+                    body = json.dumps(body)
+                    headers.setdefault('Content-Type', 'application/json')
+                if not isinstance(body, bytes):
+                    body = body.encode('utf-8')
+                self.send_response(status)
+                for name, values in headers.items():
+                    if not isinstance(values, list):
+                        values = [values]
+                    for value in values:
+                        self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = handle_request
+
+            def log_message(self, *args):
+                pass
+
+        class Server(ThreadingMixIn, HTTPServer):
+            daemon_threads = True
+
+        self.server = Server(('127.0.0.1', 0), Handler)
+        self.thread = None
+
+    def url(self, path):
+        return 'http://127.0.0.1:%d%s' % (self.server.server_address[1], path)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class StubRequest(object):
+    """A request received by a StubServer."""
+
+    def __init__(self, method, path, headers, body):
+        self.method = method
+        self.path = path
+        self.headers = headers
+        self.body = body
@@ -0,0 +1,151 @@
+import asyncio
+import json
+from unittest import TestCase
+
+import pytest
+
+aiohttp = pytest.importorskip("aiohttp")
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from pycrunch import asynclib
+from pycrunch.datasets import Dataset
+from pycrunch.progress import DefaultProgressTracking
+from pycrunch.shoji import Catalog, Entity, TaskError
+
+
+class FakeAPI(object):
+    """A tiny aiohttp app serving a datasets catalog and its entities."""
+
+    def __init__(self):
+        self.requests = []
+        self.progress = [30, 100]
+        self.logged_in = True
+        app = web.Application()
+        app.router.add_route('*', '/{path:.*}', self.handle)
+        self.server = TestServer(app)
+
+    def url(self, path):
+        return str(self.server.make_url(path))
+
+    @staticmethod
+    def shoji(status=200, headers=None, **body):
+        return web.Response(
+            status=status, headers=headers, text=json.dumps(body),
+            content_type='application/json')
+
+    async def handle(self, request):
+        body = await request.text()
+        self.requests.append((request.method, request.path, body))
+        path = request.path
+        if path == '/api/login/':
+            self.logged_in = True
+            return web.Response(status=204)
+        if not self.logged_in:
+            return self.shoji(
+                401, urls={'login_url': self.url('/api/login/')})
+        if path == '/api/datasets/':
+            if request.method == 'POST':
+                return self.shoji(
+                    202,
+                    headers={'Location': self.url('/api/datasets/3/')},
+                    element='shoji:view', value=self.url('/api/progress/1/'))
+            return self.shoji(
+                element='shoji:catalog', self=self.url(path),
+                index={'1/': {'name': 'one'}, '2/': {'name': 'two'}},
+                catalogs={'progress': self.url('/api/progress/')})
+        if path == '/api/progress/1/':
+            progress = self.progress.pop(0)
+            return self.shoji(element='shoji:view', value={
+                'progress': progress, 'message': 'failed'})
+        if path.startswith('/api/datasets/'):
+            return self.shoji(
+                element='shoji:entity', self=self.url(path),
+                body={'name': path.split('/')[-2]},
+                catalogs={'variables': self.url(path + 'variables/')})
+        return web.Response(status=404)
+
+
+class TestAsyncElementSession(TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.api = FakeAPI()
+        self.loop.run_until_complete(self.api.server.start_server(loop=self.loop))
+        self.session = asynclib.AsyncElementSession(
+            email='me@example.com', password='secret',
+            progress_tracking=DefaultProgressTracking(timeout=5, interval=0))
+
+    def tearDown(self):
+        self.loop.run_until_complete(self.session.close())
+        self.loop.run_until_complete(self.api.server.close())
+        self.loop.close()
+
+    def run_async(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def test_get_parses_elements(self):
+        r = self.run_async(self.session.get(self.api.url('/api/datasets/')))
+        assert isinstance(r.payload, Catalog)
+        assert r.payload.session is self.session
+        assert sorted(t.name for t in r.payload.index.values()) == ['one', 'two']
+
+    def test_concurrent_fetch(self):
+        catalog = self.run_async(
+            self.session.get(self.api.url('/api/datasets/'))).payload
+
+        async def fetch_all():
+            return await asyncio.gather(*[
+                asynclib.fetch(tup) for tup in catalog.index.values()])
+
+        entities = self.run_async(fetch_all())
+        assert sorted(e.body.name for e in entities) == ['1', '2']
+        assert all(isinstance(e, Dataset) for e in entities)
+
+    def test_follow_and_refresh(self):
+        entity = self.run_async(
+            self.session.get(self.api.url('/api/datasets/1/'))).payload
+        entity.body['name'] = 'changed'
+        self.run_async(asynclib.refresh(entity))
+        assert entity.body.name == '1'
+
+        with self.assertRaises(AttributeError):
+            self.run_async(asynclib.follow(entity, 'nonexistent'))
+
+    def test_create_waits_for_progress(self):
+        catalog = self.run_async(
+            self.session.get(self.api.url('/api/datasets/'))).payload
+        entity = self.run_async(asynclib.create(catalog, {'body': {'name': 'x'}}))
+
+        assert isinstance(entity, Entity)
+        assert entity.self == self.api.url('/api/datasets/3/')
+        assert self.api.progress == []
+        method, path, body = self.api.requests[1]
+        assert (method, path) == ('POST', '/api/datasets/')
+        assert json.loads(body)['body'] == {'name': 'x'}
+
+    def test_create_raises_task_error(self):
+        self.api.progress = [-1]
+        catalog = self.run_async(
+            self.session.get(self.api.url('/api/datasets/'))).payload
+        with self.assertRaises(TaskError):
+            self.run_async(asynclib.create(catalog, {'body': {'name': 'x'}}))
+
+    def test_edit_and_drop_patch_index(self):
+        catalog = self.run_async(
+            self.session.get(self.api.url('/api/datasets/'))).payload
+        self.run_async(asynclib.edit(catalog, '1/', name='uno'))
+        self.run_async(asynclib.drop(catalog, '2/'))
+
+        patches = [json.loads(b) for m, p, b in self.api.requests if m == 'PATCH']
+        assert [p['index'] for p in patches] == [{'1/': {'name': 'uno'}}, {'2/': None}]
+
+    def test_401_logs_in_and_replays(self):
+        self.api.logged_in = False
+        r = self.run_async(self.session.get(self.api.url('/api/datasets/1/')))
+
+        assert r.payload.body.name == '1'
+        assert [h.status_code for h in r.history] == [401, 204]
+        assert [p for m, p, b in self.api.requests] == [
+            '/api/datasets/1/', '/api/login/', '/api/datasets/1/']
@@ -0,0 +1,167 @@
+import json
+import time
+from unittest import TestCase
+
+from pycrunch.elements import ElementSession
+from pycrunch.lemonpy import CacheEntry, ResponseCache, parse_cache_control
+from pycrunch.shoji import Catalog
+from pycrunch.tests.stubs import StubAdapter
+
+URL = 'http://api.test/api/datasets/'
+
+
+class TestResponseCache(TestCase):
+
+    def setUp(self):
+        self.etag = '"v1"'
+        self.cache_control = None
+        self.lowercase = False
+        self.cache = ResponseCache()
+        self.session = ElementSession(token='abc', cache=self.cache)
+        self.adapter = StubAdapter(self.respond)
+        self.session.mount('http://api.test/', self.adapter)
+
+    def respond(self, request):
+        if request.method != 'GET':
+            return 204, {}, b''
+        headers = {'ETag': self.etag}
+        if self.cache_control:
+            headers['Cache-Control'] = self.cache_control
+        if self.lowercase:
+            # As sent by HTTP/2 servers.
+            headers = dict((k.lower(), v) for k, v in headers.items())
+        if request.headers.get('If-None-Match') == self.etag:
+            return 304, headers, b''
+        return 200, headers, {
+            'element': 'shoji:catalog', 'self': URL, 'index': {},
+            'etag': self.etag
+        }
+
+    def test_revalidates_with_etag(self):
+        first = self.session.get(URL).payload
+        r = self.session.get(URL)
+
+        assert isinstance(r.payload, Catalog)
+        # Each response gets its own payload, which its caller may change.
+        assert r.payload == first
+        assert r.payload is not first
+        assert r.status_code == 200
+        assert r.from_cache
+        assert self.adapter.requests[1].headers['If-None-Match'] == '"v1"'
+        stats = self.cache.stats()
+        assert stats['misses'] == 1
+        assert stats['revalidations'] == 1
+        assert stats['bytes_saved'] == stats['size'] > 0
+
+    def test_lowercase_validators(self):
+        self.lowercase = True
+        self.session.get(URL)
+        r = self.session.get(URL)
+
+        assert r.from_cache
+        assert self.adapter.requests[1].headers['If-None-Match'] == '"v1"'
+        assert self.cache.misses == 1
+        assert self.cache.revalidations == 1
+        assert self.cache.lookup(URL).etag == '"v1"'
+
+        entry = CacheEntry(URL, 200, {'last-modified': 'Mon, 01 Jan 2018 00:00:00 GMT'},
+                           b'{}')
+        entry.revalidated({'etag': '"v2"', 'cache-control': 'max-age=60'})
+        assert entry.validators() == {
+            'If-None-Match': '"v2"',
+            'If-Modified-Since': 'Mon, 01 Jan 2018 00:00:00 GMT',
+        }
+        assert entry.max_age == 60
+
+    def test_changed_resource_is_refetched(self):
+        self.session.get(URL)
+        self.etag = '"v2"'
+        r = self.session.get(URL)
+
+        assert r.payload.etag == '"v2"'
+        assert self.cache.misses == 2
+        assert self.cache.revalidations == 0
+        assert self.cache.lookup(URL).etag == '"v2"'
+
+    def test_fresh_entries_skip_the_network(self):
+        self.cache_control = 'max-age=60'
+        self.session.get(URL)
+        r = self.session.get(URL)
+
+        assert r.payload.etag == '"v1"'
+        assert len(self.adapter.requests) == 1
+        assert self.cache.hits == 1
+
+    def test_stale_while_revalidate(self):
+        self.cache_control = 'max-age=0, stale-while-revalidate=60'
+        self.session.get(URL)
+        self.etag = '"v2"'
+        r = self.session.get(URL)
+
+        # The stale payload is served while the new one is fetched.
+        assert r.payload.etag == '"v1"'
+        assert self.cache.stale_hits == 1
+        for i in range(100):
+            if self.cache.lookup(URL).etag == '"v2"':
+                break
+            time.sleep(0.01)
+        assert self.session.get(URL).payload.etag == '"v2"'
+
+    def test_refresh_of_a_cached_payload(self):
+        catalog = self.session.get(URL).payload
+        catalog.refresh()
+        assert catalog.self == URL
+        assert catalog.etag == '"v1"'
+        assert self.cache.revalidations == 1
+
+        # Likewise when it is served fresh, without a request.
+        self.cache_control = 'max-age=60'
+        self.cache.clear()
+        fresh = self.session.get(URL).payload
+        fresh.refresh()
+        assert fresh.etag == '"v1"'
+        assert self.cache.hits == 1
+
+    def test_volatile_urls_are_not_cached(self):
+        self.cache = ResponseCache(max_age=60)
+        self.session.cache = self.cache
+        progress = 'http://api.test/api/progress/1/'
+        self.session.get(progress)
+        self.session.get(progress)
+        assert len(self.adapter.requests) == 2
+        assert len(self.cache) == 0
+        assert 'If-None-Match' not in self.adapter.requests[1].headers
+
+    def test_query_params_are_keyed(self):
+        self.session.get(URL, params={'offset': 1})
+        self.session.get(URL, params={'offset': 2})
+        assert len(self.cache) == 2
+        assert self.cache.lookup(URL + '?offset=1') is not None
+
+    def test_writes_invalidate(self):
+        self.session.get(URL)
+        self.session.patch(URL, data=json.dumps({}))
+        assert self.cache.lookup(URL) is None
+
+    def test_uncacheable_responses(self):
+        self.cache_control = 'no-store'
+        self.session.get(URL)
+        assert len(self.cache) == 0
+
+    def test_lru_eviction(self):
+        cache = ResponseCache(max_entries=2, max_bytes=25)
+        for i in range(3):
+            cache.store(str(i), CacheEntry(str(i), 200, {}, b'x' * 10))
+        assert [cache.lookup(k) is not None for k in '012'] == [False, True, True]
+
+        cache.lookup('1')
+        cache.store('3', CacheEntry('3', 200, {}, b'x' * 10))
+        assert cache.lookup('2') is None
+        assert cache.size == 20
+
+        cache.store('4', CacheEntry('4', 200, {}, b'x' * 30))
+        assert cache.lookup('4') is None
+
+    def test_parse_cache_control(self):
+        assert parse_cache_control('max-age=5, no-cache, private="x"') == {
+            'max-age': '5', 'no-cache': None, 'private': 'x'}
@@ -0,0 +1,79 @@
+import threading
+import time
+from unittest import TestCase
+
+from pycrunch.elements import ElementSession
+from pycrunch.lemonpy import ClientError, RequestCoalescer
+from pycrunch.shoji import Catalog
+from pycrunch.tests.stubs import StubAdapter
+
+URL = 'http://api.test/api/datasets/abc/variables/'
+
+
+class TestRequestCoalescing(TestCase):
+
+    threads = 6
+
+    def setUp(self):
+        self.status = 200
+        self.release = threading.Event()
+        self.coalescer = RequestCoalescer()
+        self.session = ElementSession(
+            token='abc', thread_safe=True, coalescer=self.coalescer)
+        self.adapter = StubAdapter(self.respond)
+        self.session.mount('http://api.test/', self.adapter)
+
+    def respond(self, request):
+        self.release.wait(5)
+        if self.status != 200:
+            return self.status, {}, {'message': 'Nope'}
+        return 200, {}, {'element': 'shoji:catalog', 'self': URL, 'index': {}}
+
+    def get_concurrently(self, **kwargs):
+        results = []
+
+        def get():
+            try:
+                results.append(self.session.get(URL, **kwargs).payload)
+            except Exception as exc:
+                results.append(exc)
+
+        threads = [threading.Thread(target=get) for i in range(self.threads)]
+        for t in threads:
+            t.start()
+        deadline = time.time() + 5
+        while self.coalescer.saved < self.threads - 1 and time.time() < deadline:
+            time.sleep(0.001)
+        self.release.set()
+        for t in threads:
+            t.join()
+        return results
+
+    def test_identical_gets_share_one_request(self):
+        results = self.get_concurrently()
+
+        assert len(self.adapter.requests) == 1
+        assert len(results) == self.threads
+        assert isinstance(results[0], Catalog)
+        assert all(r is results[0] for r in results)
+        assert self.coalescer.stats() == {'requests': 1, 'saved': self.threads - 1,
+                                          'in_flight': 0}
+
+    def test_errors_are_shared(self):
+        self.status = 404
+        results = self.get_concurrently()
+
+        assert len(self.adapter.requests) == 1
+        assert all(isinstance(r, ClientError) for r in results)
+
+    def test_sequential_and_different_gets_are_not_coalesced(self):
+        self.release.set()
+        self.session.get(URL)
+        self.session.get(URL)
+        self.session.get(URL, params={'limit': 1})
+        self.session.get(URL, headers={'X-Test': '1'})
+        self.session.patch(URL, data='{}')
+
+        assert len(self.adapter.requests) == 5
+        assert self.coalescer.requests == 4
+        assert self.coalescer.saved == 0
@@ -0,0 +1,93 @@
+import json
+import zlib
+from unittest import TestCase
+
+from pycrunch.elements import ElementSession
+from pycrunch.lemonpy import RequestCompression
+from pycrunch.shoji import Catalog
+from pycrunch.tests.stubs import StubAdapter
+
+URL = 'http://api.test/api/datasets/'
+
+
+class TestRequestCompression(TestCase):
+
+    def setUp(self):
+        self.accept_gzip = True
+        self.bodies = []
+        self.encodings = []
+        self.compression = RequestCompression(threshold=1024)
+        self.session = ElementSession(token='abc', compression=self.compression)
+        self.adapter = StubAdapter(self.respond)
+        self.session.mount('http://api.test/', self.adapter)
+
+    def respond(self, request):
+        body = request.body
+        encoding = request.headers.get('Content-Encoding')
+        self.encodings.append(encoding)
+        if encoding == 'gzip':
+            if not self.accept_gzip:
+                return 415, {}, {'message': 'Unsupported Content-Encoding'}
+            body = zlib.decompress(body, zlib.MAX_WBITS | 16)
+        elif encoding == 'deflate':
+            body = zlib.decompress(body)
+        if isinstance(body, bytes):
+            body = body.decode('utf-8')
+        self.bodies.append((encoding, body))
+        return 204, {}, b''
+
+    def big_index(self):
+        return dict(('%06d/' % i, {'name': 'Variable %d' % i}) for i in range(200))
+
+    def test_large_bodies_are_gzipped(self):
+        catalog = Catalog(self.session, self=URL, index={})
+        index = self.big_index()
+        catalog.edit_index(index)
+
+        request = self.adapter.requests[0]
+        assert request.headers['Content-Encoding'] == 'gzip'
+        assert int(request.headers['Content-Length']) == len(request.body)
+        encoding, body = self.bodies[0]
+        assert json.loads(body)['index'] == index
+
+        stats = self.compression.stats()
+        assert stats['requests'] == 1
+        assert stats['bytes_in'] == len(body)
+        assert stats['bytes_out'] == len(request.body)
+        assert stats['bytes_saved'] > stats['bytes_out']
+
+    def test_small_bodies_are_not_compressed(self):
+        self.session.patch(URL, data=json.dumps({'index': {}}))
+
+        assert 'Content-Encoding' not in self.adapter.requests[0].headers
+        assert self.compression.requests == 0
+
+    def test_deflate_and_text_bodies(self):
+        self.compression.encoding = 'deflate'
+        rows = "\n".join(json.dumps({'000001': i}) for i in range(200))
+        self.session.post(URL + '1/stream/', data=rows)
+
+        assert self.bodies == [('deflate', rows)]
+
+    def test_other_content_types_are_not_compressed(self):
+        self.session.post(URL, data=b'x' * 4096,
+                          headers={'Content-Type': 'application/octet-stream'})
+        assert self.bodies[0][0] is None
+
+    def test_disabled(self):
+        self.compression.enabled = False
+        self.session.post(URL, data='x' * 4096)
+        assert self.bodies[0][0] is None
+
+    def test_rejected_compression_is_resent_uncompressed(self):
+        self.accept_gzip = False
+        data = json.dumps(self.big_index())
+        r = self.session.post(URL, data=data)
+
+        assert r.status_code == 204
+        assert self.bodies == [(None, data)]
+        assert self.encodings == ['gzip', None]
+        assert self.compression.rejected_hosts == set(['api.test'])
+
+        self.session.post(URL, data=data)
+        assert self.bodies[1] == (None, data)
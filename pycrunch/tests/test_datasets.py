@@ -157,7 +157,7 @@ class TestExclusionFilters(TestCase):
 
         ds.session.patch.assert_called_once_with(
             ds.fragments.exclusion,
-            data=json.dumps({'expression': {}})
+            data='{"expression":{}}'
         )
 
     def _exclude_payload(self, expr):
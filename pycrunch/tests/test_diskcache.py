@@ -0,0 +1,130 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from pycrunch.diskcache import SQLiteCache, auth_identity
+from pycrunch.elements import ElementSession
+from pycrunch.lemonpy import OfflineError
+from pycrunch.shoji import Catalog
+from pycrunch.tests.stubs import StubAdapter
+
+URL = 'http://api.test/api/datasets/'
+
+
+class TestSQLiteCache(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'cache', 'http.sqlite')
+        self.etag = '"v1"'
+        self.header_names = ('ETag', 'Last-Modified')
+        self.requests = []
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def respond(self, request):
+        self.requests.append(dict(request.headers))
+        if request.method != 'GET':
+            return 204, {}, b''
+        etag, last_modified = self.header_names
+        headers = {etag: self.etag, last_modified: 'Mon, 01 Jan 2018 00:00:00 GMT'}
+        if request.headers.get('If-None-Match') == self.etag:
+            return 304, headers, b''
+        return 200, headers, {
+            'element': 'shoji:catalog', 'self': URL,
+            'index': {'1/': {'name': 'one'}}
+        }
+
+    def make_session(self, token='abc', **kwargs):
+        cache = SQLiteCache(self.path, **kwargs)
+        session = ElementSession(token=token, cache=cache)
+        session.mount('http://api.test/', StubAdapter(self.respond))
+        return session
+
+    def test_entries_are_shared_across_caches(self):
+        self.make_session().get(URL)
+
+        # A second process opening the same database revalidates
+        # rather than downloading the catalog again.
+        session = self.make_session()
+        r = session.get(URL)
+
+        assert r.status_code == 200
+        assert r.from_cache
+        assert isinstance(r.payload, Catalog)
+        assert r.payload.index['1/'].name == 'one'
+        assert self.requests[1]['If-None-Match'] == '"v1"'
+        assert session.cache.revalidations == 1
+
+    def test_lowercase_headers_round_trip(self):
+        # As sent by HTTP/2 servers.
+        self.header_names = ('etag', 'last-modified')
+        self.make_session().get(URL)
+
+        cache = SQLiteCache(self.path)
+        entry = cache.lookup(cache.key(ElementSession(token='abc'), URL))
+        assert entry.etag == '"v1"'
+        assert entry.validators() == {
+            'If-None-Match': '"v1"',
+            'If-Modified-Since': 'Mon, 01 Jan 2018 00:00:00 GMT',
+        }
+
+        session = self.make_session()
+        assert session.get(URL).from_cache
+        assert self.requests[1]['If-None-Match'] == '"v1"'
+        assert session.cache.revalidations == 1
+
+    def test_refresh_of_a_cached_payload(self):
+        self.make_session().get(URL)
+        session = self.make_session()
+
+        catalog = session.get(URL).payload
+        catalog.refresh()
+        assert catalog.self == URL
+        assert catalog.index['1/'].name == 'one'
+        assert session.cache.revalidations == 2
+
+    def test_entries_are_separated_by_identity(self):
+        self.make_session(token='abc').get(URL)
+        self.make_session(token='xyz').get(URL)
+
+        assert 'If-None-Match' not in self.requests[1]
+        assert SQLiteCache(self.path).disk_stats()['entries'] == 2
+        assert auth_identity(ElementSession(token='abc')) != \
+            auth_identity(ElementSession(token='xyz'))
+
+    def test_writes_invalidate_the_entry(self):
+        session = self.make_session()
+        session.get(URL)
+        session.post(URL, data='{}')
+
+        assert SQLiteCache(self.path).disk_stats()['entries'] == 0
+
+    def test_least_recently_used_entries_are_evicted(self):
+        session = self.make_session()
+        session.get(URL)
+        size = session.cache.disk_stats()['size']
+        session.cache.max_disk_bytes = size * 2
+        session.get(URL + '?page=2')
+        session.get(URL + '?page=3')
+
+        stats = session.cache.disk_stats()
+        assert stats['entries'] == 2
+        assert stats['size'] <= size * 2
+        row = session.cache.connection.execute(
+            "SELECT key FROM responses WHERE url = ?", (URL,)).fetchone()
+        assert row is None
+
+    def test_offline_mode_serves_only_cached_entries(self):
+        self.make_session().get(URL)
+        session = self.make_session(offline=True)
+
+        r = session.get(URL)
+        assert r.payload.index['1/'].name == 'one'
+        assert len(self.requests) == 1
+        with self.assertRaises(OfflineError):
+            session.get(URL + 'other/')
+        with self.assertRaises(OfflineError):
+            session.post(URL, data='{}')
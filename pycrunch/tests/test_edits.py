@@ -0,0 +1,119 @@
+import json
+from unittest import TestCase
+
+from pycrunch.elements import ElementSession
+from pycrunch.shoji import Catalog, active_edit_buffer
+from pycrunch.tests.stubs import StubAdapter
+
+CATALOG = 'http://api.test/api/datasets/1/variables/'
+
+
+def var_url(i):
+    return CATALOG + '%d/' % i
+
+
+class TestBufferedEdits(TestCase):
+
+    def setUp(self):
+        self.patches = []
+        self.session = ElementSession(token='abc')
+        self.session.mount('http://api.test/', StubAdapter(self.respond))
+        self.catalog = self.session.get(CATALOG).payload
+
+    def respond(self, request):
+        if request.method == 'PATCH':
+            self.patches.append((request.url, json.loads(request.body)))
+            return 204, {}, b''
+        if request.url == CATALOG:
+            return 200, {}, {
+                'element': 'shoji:catalog', 'self': CATALOG,
+                'index': dict(('%d/' % i, {'name': 'v%d' % i}) for i in range(5)),
+            }
+        return 200, {}, {
+            'element': 'shoji:entity', 'self': request.url,
+            'body': {'name': 'v'},
+        }
+
+    def test_edits_are_sent_together_on_exit(self):
+        with self.catalog.buffered_edits() as edits:
+            assert self.catalog.edit(var_url(0), name='a') is None
+            self.catalog.edit(var_url(1), name='b')
+            self.catalog.edit(var_url(0), description='c')
+            self.catalog.drop(var_url(2))
+            assert self.patches == []
+
+        assert edits.patches == 1
+        url, body = self.patches[0]
+        assert url == CATALOG
+        assert body == {
+            'element': 'shoji:catalog', 'self': CATALOG,
+            'index': {
+                var_url(0): {'name': 'a', 'description': 'c'},
+                var_url(1): {'name': 'b'},
+                var_url(2): None,
+            },
+        }
+
+    def test_edits_are_flushed_in_chunks(self):
+        with self.catalog.buffered_edits(max_size=2) as edits:
+            for i in range(5):
+                self.catalog.edit(var_url(i), name='n%d' % i)
+            assert len(self.patches) == 2
+
+        assert edits.patches == 3
+        assert [len(body['index']) for url, body in self.patches] == [2, 2, 1]
+
+    def test_drops_win_over_later_edits(self):
+        with self.catalog.buffered_edits():
+            self.catalog.drop(var_url(0))
+            self.catalog.edit(var_url(0), name='gone')
+        assert self.patches[0][1]['index'] == {var_url(0): None}
+
+    def test_entity_edits_are_buffered(self):
+        entity = self.catalog.index['3/'].entity
+        other = self.session.get('http://api.test/api/datasets/1/').payload
+
+        with self.catalog.buffered_edits():
+            assert entity.edit(name='renamed') is None
+            assert entity.body.name == 'renamed'
+            # Entities which are not in the catalog are edited as usual.
+            other.edit(name='dataset')
+            assert self.patches[0][0] == 'http://api.test/api/datasets/1/'
+
+        assert self.patches[1] == (CATALOG, {
+            'element': 'shoji:catalog', 'self': CATALOG,
+            'index': {'3/': {'name': 'renamed'}},
+        })
+
+    def test_other_entity_attributes_are_sent_at_once(self):
+        entity = self.catalog.index['3/'].entity
+
+        with self.catalog.buffered_edits():
+            self.catalog.edit(var_url(0), name='a')
+            entity.edit(name='renamed', format={'digits': 2})
+            assert self.patches == [(var_url(3), {
+                'element': 'shoji:entity', 'body': {'format': {'digits': 2}},
+            })]
+            assert entity.body.format == {'digits': 2}
+
+        assert self.patches[1][1]['index'] == {
+            var_url(0): {'name': 'a'},
+            '3/': {'name': 'renamed'},
+        }
+
+    def test_catalogs_without_self_are_not_confused(self):
+        unsaved = Catalog(self.session, index={})
+        with Catalog(self.session, index={}).buffered_edits():
+            assert active_edit_buffer(unsaved) is None
+            with unsaved.buffered_edits() as edits:
+                assert active_edit_buffer(unsaved) is edits
+
+    def test_errors_discard_pending_edits(self):
+        with self.assertRaises(ValueError):
+            with self.catalog.buffered_edits():
+                self.catalog.edit(var_url(0), name='a')
+                raise ValueError()
+        assert self.patches == []
+
+        self.catalog.edit(var_url(0), name='a')
+        assert len(self.patches) == 1
@@ -0,0 +1,83 @@
+from unittest import TestCase
+
+import pycrunch
+from pycrunch import cubes, exporting, importing
+from pycrunch.fakeapi import FakeCrunchAPI, FakeServer
+from pycrunch.lemonpy import RetryPolicy, ServerError
+from pycrunch.progress import DefaultProgressTracking
+from pycrunch.shoji import Catalog
+
+
+class TestFakeAPI(TestCase):
+
+    def setUp(self):
+        self.app = FakeCrunchAPI(progress_steps=2)
+        self.app.add_dataset('example', rows=1500)
+        self.server = FakeServer(self.app).start()
+        self.saved_session = pycrunch.session
+        self.site = pycrunch.connect(
+            'me@example.com', 'secret', self.server.url,
+            progress_tracking=DefaultProgressTracking(interval=0))
+        self.ds = self.site.datasets.by('name')['example'].entity
+
+    def tearDown(self):
+        pycrunch.session = self.saved_session
+        self.server.stop()
+
+    def paths(self):
+        return [(r.method, r.path) for r in self.app.requests]
+
+    def test_connect_logs_in(self):
+        assert isinstance(self.site, Catalog)
+        assert self.paths()[:3] == [
+            ('GET', '/api/'), ('POST', '/api/public/login/'), ('GET', '/api/')]
+        assert self.ds.body.size.rows == 1500
+
+    def test_append_rows(self):
+        batch = importing.Importer(frequency=0).append_rows(
+            self.ds, [['id', 'answer'], [5000, 1], [5001, None]])
+        assert batch.body.status == 'imported'
+        assert batch.body.rows == 2
+        assert self.ds.refresh().body.size.rows == 1502
+        assert self.app.datasets[self.ds.body.id].columns['000002'][-1] == {'?': -1}
+
+        importing.importer.stream_rows(self.ds, {'000001': 5002})
+        assert self.ds.summary.value.unweighted.total == 1503
+
+    def test_table(self):
+        t = self.site.session.get(self.ds.fragments.table, params={'limit': 10}).payload
+        assert t.metadata['000002'].alias == 'answer'
+        assert len(t.data['000002']) == 10
+
+    def test_fetch_cube(self):
+        answer = self.ds.variables.by('alias')['answer'].entity_url.absolute
+        cube = cubes.fetch_cube(self.ds, [answer], count=cubes.count())
+        assert isinstance(cube.value, cubes.Cube)
+        assert sum(cube.value.result.counts) <= 1500
+
+    def test_export_dataset(self):
+        url = exporting.export_dataset(self.ds, {})
+        csv = self.site.session.get(url).content.decode('utf-8')
+        lines = csv.splitlines()
+        assert lines[0] == 'id,answer,score,comment'
+        assert len(lines) == 1501
+
+    def test_buffered_edits(self):
+        variables = self.ds.variables
+        with variables.buffered_edits():
+            for url, tup in variables.index.items():
+                variables.edit(url, name=tup.name.upper())
+        patch = ('PATCH', '/api/datasets/%s/variables/' % self.ds.body.id)
+        assert self.paths().count(patch) == 1
+        assert [v['name'] for v in self.app.datasets[self.ds.body.id].variables.values()] \
+            == ['ID', 'ANSWER', 'SCORE', 'COMMENT']
+
+    def test_injected_failures(self):
+        self.app.fail_next(1)
+        with self.assertRaises(ServerError):
+            self.site.datasets
+
+        self.site.session.retry_policy = RetryPolicy(backoff_factor=0)
+        self.app.fail_next(2, status=429)
+        assert isinstance(self.site.datasets, Catalog)
+        assert self.site.session.retry_policy.retries == 2
@@ -2,7 +2,8 @@ from unittest import TestCase
 
 import requests
 from pycrunch import Session, __version__
-from pycrunch.lemonpy import ServerError
+from pycrunch.fakeapi import FakeServer
+from pycrunch.lemonpy import LockingCookieJar, ServerError, make_cookie
 
 try:
     from requests.packages.urllib3.response import HTTPResponse
@@ -18,13 +19,15 @@ class TestHTTPRequests(TestCase):
 
     @classmethod
     def setUpClass(cls):
-        cls.s = Session("not an email", "not a password")
-        cls.r = cls.s.get("http://httpbin.org/headers")
+        with FakeServer() as server:
+            cls.s = Session("not an email", "not a password")
+            cls.r = cls.s.get(server.url)
+            cls.received = server.app.requests[-1]
 
     def test_request_sends_user_agent(self):
         pycrunch_ua = 'pycrunch/%s' % __version__
         req_headers_sent = self.r.request.headers
-        req_headers_received = self.r.json()['headers']
+        req_headers_received = self.received.headers
         self.assertTrue('user-agent' in req_headers_sent)
         self.assertTrue('User-Agent' in req_headers_received)
         self.assertTrue(pycrunch_ua in req_headers_sent.get('user-agent', ''))
@@ -32,7 +35,7 @@ class TestHTTPRequests(TestCase):
 
     def test_request_sends_gzip(self):
         req_headers_sent = self.r.request.headers
-        req_headers_received = self.r.json()['headers']
+        req_headers_received = self.received.headers
         self.assertIn("gzip", req_headers_sent['Accept-Encoding'])
         self.assertIn("gzip", req_headers_received['Accept-Encoding'])
 
@@ -61,3 +64,36 @@ class TestHTTPResponses(TestCase):
         response = exc_info.exception.args[0]
         assert isinstance(response, requests.models.Response)
         self.assertEqual(response.status_code, 504)
+
+
+class TestConnectionPooling(TestCase):
+
+    def test_default_pool(self):
+        s = Session("not an email", "not a password")
+        adapter = s.get_adapter("https://app.crunch.io/api/")
+        self.assertEqual(adapter._pool_maxsize, 10)
+        self.assertFalse(adapter._pool_block)
+        self.assertFalse(s.thread_safe)
+        self.assertNotIsInstance(s.cookies, LockingCookieJar)
+
+    def test_pool_options(self):
+        s = Session("not an email", "not a password",
+                    pool_connections=4, pool_maxsize=64, pool_block=True)
+        for url in ("https://app.crunch.io/api/", "http://localhost/api/"):
+            adapter = s.get_adapter(url)
+            self.assertEqual(adapter._pool_connections, 4)
+            self.assertEqual(adapter._pool_maxsize, 64)
+            self.assertTrue(adapter._pool_block)
+
+    def test_thread_safe_cookies(self):
+        s = Session(token="abc", domain="app.crunch.io", thread_safe=True)
+        self.assertIsInstance(s.cookies, LockingCookieJar)
+        self.assertEqual(s.cookies.get("token"), "abc")
+
+        # Writing to the jar while iterating over it must not fail.
+        for i, cookie in enumerate(s.cookies):
+            s.cookies.set_cookie(make_cookie("c%d" % i, "x", "app.crunch.io"))
+        self.assertEqual(len(s.cookies), 2)
+
+        req = s.prepare_request(requests.Request("GET", "https://app.crunch.io/api/"))
+        self.assertIn("token=abc", req.headers["Cookie"])
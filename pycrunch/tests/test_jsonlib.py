@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+import datetime
+import json
+import uuid
+from unittest import TestCase
+
+import pytest
+
+from pycrunch import elements, jsonlib, shoji
+from pycrunch.elements import JSONObject
+
+
+class TestJSONBackends(TestCase):
+
+    doc = {
+        "element": "shoji:catalog",
+        "self": "https://app.crunch.io/api/datasets/",
+        "index": {"1/": {"name": u"café", "size": 10, "weight": 1.5,
+                         "archived": False, "owner": None}},
+    }
+
+    def setUp(self):
+        self.original = jsonlib.backend
+
+    def tearDown(self):
+        jsonlib.set_backend(self.original)
+
+    def check_backend(self, name):
+        try:
+            jsonlib.set_backend(name)
+        except ImportError:
+            pytest.skip("%s is not installed" % name)
+
+        text = jsonlib.dumps(self.doc)
+        assert json.loads(text) == self.doc
+        # Compact, with escaped non-ASCII text and unescaped slashes.
+        assert ", " not in text and ": " not in text
+        assert u"caf\\u00e9" in text
+        assert "https://app.crunch.io/api/datasets/" in text
+
+        assert jsonlib.loads(text.encode("utf-8")) == self.doc
+        assert jsonlib.loads(text) == self.doc
+        hooked = jsonlib.loads(text.encode("utf-8"), object_hook=JSONObject)
+        assert hooked == self.doc
+        assert type(hooked) is JSONObject
+        assert type(hooked["index"]["1/"]) is JSONObject
+
+    def test_stdlib(self):
+        self.check_backend("json")
+
+    def test_orjson(self):
+        self.check_backend("orjson")
+
+    def test_ujson(self):
+        self.check_backend("ujson")
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            jsonlib.set_backend("yaml")
+
+    def test_unsupported_objects_fall_back_to_stdlib(self):
+        for name in jsonlib.BACKENDS:
+            try:
+                jsonlib.set_backend(name)
+            except ImportError:
+                continue
+            assert json.loads(jsonlib.dumps({1: 2 ** 70})) == {"1": 2 ** 70}
+
+    def test_backends_encode_as_the_stdlib(self):
+        values = [
+            self.doc,
+            {"url": "https://app.crunch.io/api/", "text": u"\u2603 caf\xe9"},
+            [float("nan"), float("inf"), float("-inf")],
+            {"weight": float("nan")},
+            {1: 2 ** 70, "tuple": (1, 2.5, None)},
+            JSONObject(body=JSONObject(name="x")),
+        ]
+        unsupported = [datetime.date(2020, 1, 1), {"at": datetime.datetime(2020, 1, 1)},
+                       uuid.UUID(int=1), set([1])]
+        jsonlib.set_backend("json")
+        expected = [jsonlib.dumps(v) for v in values]
+        for name in jsonlib.BACKENDS:
+            try:
+                jsonlib.set_backend(name)
+            except ImportError:
+                continue
+            assert [jsonlib.dumps(v) for v in values] == expected, name
+            for value in unsupported:
+                with self.assertRaises(TypeError):
+                    jsonlib.dumps(value)
+
+    def test_jsonobject_json_is_compact(self):
+        obj = JSONObject(element="shoji:entity", body={"name": "x"})
+        assert json.loads(obj.json) == {"element": "shoji:entity", "body": {"name": "x"}}
+        assert len(obj.json) == len('{"element":"shoji:entity","body":{"name":"x"}}')
+
+
+class TestElementHook(TestCase):
+
+    text = jsonlib.dumps({
+        "element": "shoji:catalog",
+        "self": "https://app.crunch.io/api/datasets/",
+        "index": {"1/": {"name": "one", "tags": [{"a": 1}]}},
+        "views": {"table": "https://app.crunch.io/api/datasets/table/"},
+        "data": [[1, 2], {"?": -1}],
+    })
+
+    def test_same_as_parse_element(self):
+        session = object()
+        expected = elements.parse_element(session, json.loads(self.text))
+        actual = jsonlib.loads(self.text, object_hook=elements.element_hook(session))
+
+        assert actual == expected
+        assert type(actual) is shoji.Catalog
+        assert actual.session is session
+        assert type(actual.index) is shoji.Index
+        tup = actual.index["1/"]
+        assert type(tup) is shoji.Tuple
+        assert tup.entity_url.absolute == "https://app.crunch.io/api/datasets/1/"
+        assert type(tup.tags[0]) is JSONObject
+        assert type(actual.views) is JSONObject
+        assert type(actual.data[1]) is JSONObject
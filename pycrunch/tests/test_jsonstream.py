@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+from unittest import TestCase
+
+from pycrunch.elements import ElementSession, JSONObject
+from pycrunch.jsonstream import JSONStreamReader
+from pycrunch.shoji import Catalog, Index, Tuple
+from pycrunch.tests.stubs import StubAdapter
+
+CATALOG = {
+    'element': 'shoji:catalog',
+    'index': {
+        '1/': {'name': 'one ☃', 'size': 12345, 'subvars': {'a': [1, 2.5]}},
+        'http://api.test/api/other/2/': {'name': 'two', 'size': None},
+        '3/': None,
+    },
+    'views': {'columns': 'http://api.test/api/ds/columns/'},
+    'self': 'http://api.test/api/ds/',
+}
+
+
+def chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+class TestJSONStreamReader(TestCase):
+
+    def read_all(self, reader):
+        """Rebuild the top-level object by streaming its members."""
+        return dict((key, reader.read_value()) for key in reader.iter_object())
+
+    def test_any_chunking(self):
+        data = json.dumps(CATALOG, ensure_ascii=False).encode('utf-8')
+        for size in (1, 2, 3, 7, 100, len(data)):
+            reader = JSONStreamReader(chunked(data, size))
+            assert self.read_all(reader) == CATALOG, size
+
+    def test_numbers_split_across_chunks(self):
+        reader = JSONStreamReader([b'{"n": 12', b'34, "f": 1.', b'5e3}'])
+        assert self.read_all(reader) == {'n': 1234, 'f': 1500.0}
+
+    def test_empty_object(self):
+        assert self.read_all(JSONStreamReader([b' { } '])) == {}
+
+    def test_malformed(self):
+        with self.assertRaises(ValueError):
+            self.read_all(JSONStreamReader([b'{"a": 1 "b": 2}']))
+        with self.assertRaises(ValueError):
+            self.read_all(JSONStreamReader([b'{"a": [1, 2']))
+
+
+class TestStreamingParse(TestCase):
+
+    def setUp(self):
+        self.body = CATALOG
+        self.session = ElementSession(token='abc', stream_threshold=0)
+        self.session.mount('http://api.test/', StubAdapter(self.respond))
+
+    def respond(self, request):
+        return 200, {'Content-Type': 'application/json'}, self.body
+
+    def test_streams_catalog_index(self):
+        r = self.session.get('http://api.test/api/ds/')
+        catalog = r.payload
+
+        assert isinstance(catalog, Catalog)
+        assert isinstance(catalog.index, Index)
+        assert catalog.views.columns == 'http://api.test/api/ds/columns/'
+        tup = catalog.index['1/']
+        assert isinstance(tup, Tuple)
+        assert tup.name == 'one ☃'
+        assert isinstance(tup.subvars, JSONObject)
+        assert tup.entity_url.absolute == 'http://api.test/api/ds/1/'
+        other = catalog.index['http://api.test/api/other/2/']
+        assert other.entity_url.absolute == 'http://api.test/api/other/2/'
+        assert catalog.index['3/'] is None
+        assert r.content == b''
+
+    def test_same_result_as_buffered_parse(self):
+        streamed = self.session.get('http://api.test/api/ds/').payload
+        self.session.stream_threshold = None
+        buffered = self.session.get('http://api.test/api/ds/').payload
+        assert streamed == buffered
+        assert json.loads(streamed.json) == json.loads(buffered.json)
+
+    def test_small_responses_are_buffered(self):
+        self.session.stream_threshold = 10 ** 6
+        r = self.session.get('http://api.test/api/ds/')
+        assert json.loads(r.content.decode('utf-8')) == CATALOG
+
+    def test_other_payloads(self):
+        self.body = {'element': 'shoji:view', 'index': {'a': {'b': 1}}, 'value': [1]}
+        view = self.session.get('http://api.test/api/ds/').payload
+        assert view.value == [1]
+        assert type(view.index.a) is JSONObject
+
+        self.body = [{'a': 1}]
+        assert self.session.get('http://api.test/api/ds/').payload == [{'a': 1}]
+
+        self.body = ''
+        assert self.session.get('http://api.test/api/ds/').payload == {}
@@ -0,0 +1,121 @@
+import json
+from unittest import TestCase
+
+from pycrunch.datasets import Dataset
+from pycrunch.elements import ElementSession, JSONObject, LazyMembers, lazy_class
+from pycrunch.shoji import Catalog, Entity, Index, LazyIndex, Tuple
+from pycrunch.tests.stubs import StubAdapter
+
+DATASETS = 'http://api.test/api/datasets/'
+DS = DATASETS + 'abc/'
+
+
+class TestLazyParsing(TestCase):
+
+    def setUp(self):
+        self.session = ElementSession(token='abc', lazy=True)
+        self.session.mount('http://api.test/', StubAdapter(self.respond))
+
+    def respond(self, request):
+        if request.url == DATASETS:
+            return 200, {}, {
+                'element': 'shoji:catalog',
+                'self': DATASETS,
+                'index': {
+                    'abc/': {'name': 'one', 'owner': {'name': 'me'},
+                             'tags': [{'a': 1}]},
+                    'def/': {'name': 'two'},
+                },
+                'catalogs': {'projects': 'http://api.test/api/projects/'},
+            }
+        return 200, {}, {
+            'element': 'shoji:entity',
+            'self': DS,
+            'body': {'name': 'one', 'table': {'metadata': {'000001': {'type': 'numeric'}}}},
+        }
+
+    def test_catalog_index_is_lazy(self):
+        catalog = self.session.get(DATASETS).payload
+
+        assert isinstance(catalog, Catalog)
+        assert isinstance(catalog, LazyMembers)
+        index = catalog.index
+        assert isinstance(index, LazyIndex)
+        assert isinstance(index, Index)
+        # Tuples are not made until they are read.
+        assert type(dict.__getitem__(index, 'abc/')) is dict
+
+        tup = index['abc/']
+        assert isinstance(tup, Tuple)
+        assert tup is index['abc/']
+        assert tup.entity_url.absolute == DS
+        assert type(dict.__getitem__(tup, 'owner')) is dict
+        assert isinstance(tup.owner, JSONObject)
+        assert tup.owner.name == 'me'
+        assert isinstance(tup['tags'][0], JSONObject)
+        assert type(dict.__getitem__(index, 'def/')) is dict
+
+        assert sorted(t.name for t in index.values()) == ['one', 'two']
+        assert all(isinstance(t, Tuple) for t in dict.values(index))
+        assert catalog.by('name')['two'].entity_url.absolute == DATASETS + 'def/'
+
+    def test_entity_body_is_lazy(self):
+        ds = self.session.get(DS).payload
+
+        assert isinstance(ds, Dataset)
+        assert isinstance(ds.body, Tuple)
+        assert ds.body.entity_url == DS
+        metadata = ds.body.table.metadata
+        assert isinstance(metadata, JSONObject)
+        assert metadata['000001'].type == 'numeric'
+
+    def test_dict_semantics(self):
+        catalog = self.session.get(DATASETS).payload
+        eager = ElementSession(token='abc')
+        eager.mount('http://api.test/', StubAdapter(self.respond))
+        expected = eager.get(DATASETS).payload
+
+        assert catalog == expected
+        assert json.loads(catalog.json) == json.loads(expected.json)
+        assert catalog.get('missing', 5) == 5
+        assert isinstance(catalog.get('catalogs'), JSONObject)
+        assert isinstance(catalog.pop('catalogs'), JSONObject)
+        assert 'catalogs' not in catalog
+        catalog['catalogs'] = {'x': 1}
+        assert type(catalog['catalogs']) is dict
+        assert isinstance(catalog.setdefault('views', {}), dict)
+
+        tup = catalog.index['abc/'].copy()
+        assert isinstance(tup, Tuple)
+        assert isinstance(tup.owner, JSONObject)
+        assert all(isinstance(v, JSONObject) for k, v in tup.items() if k == 'owner')
+
+    def test_refresh_keeps_members_lazy(self):
+        catalog = self.session.get(DATASETS).payload
+        catalog.refresh()
+
+        assert type(dict.__getitem__(catalog, 'catalogs')) is dict
+        assert isinstance(catalog.catalogs, JSONObject)
+        assert catalog.catalogs.projects == 'http://api.test/api/projects/'
+        assert isinstance(catalog.index, LazyIndex)
+        assert catalog.index['abc/'].owner.name == 'me'
+
+    def test_lazy_class(self):
+        cls = lazy_class(Entity)
+        assert cls is lazy_class(Entity)
+        assert issubclass(cls, Entity)
+        assert issubclass(cls.tuple_class, Tuple)
+        assert issubclass(cls.tuple_class, LazyMembers)
+        assert lazy_class(Catalog).index_class is LazyIndex
+
+    def test_streamed_catalog_is_lazy(self):
+        session = ElementSession(token='abc', lazy=True, stream_threshold=0)
+        session.mount('http://api.test/', StubAdapter(self.respond))
+        catalog = session.get(DATASETS).payload
+
+        assert isinstance(catalog, LazyMembers)
+        tup = catalog.index['abc/']
+        assert isinstance(tup, LazyMembers)
+        assert type(dict.__getitem__(tup, 'owner')) is dict
+        assert tup.owner.name == 'me'
+        assert tup.entity_url.absolute == DS
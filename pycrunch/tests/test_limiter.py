@@ -0,0 +1,133 @@
+import threading
+import time
+from unittest import TestCase
+
+from pycrunch.elements import ElementSession
+from pycrunch.lemonpy import ClientError, ConcurrencyLimiter
+from pycrunch.metrics import MetricsRegistry
+from pycrunch.tests.stubs import StubAdapter
+
+URL = 'http://api.test/api/'
+
+
+class TestConcurrencyLimiter(TestCase):
+
+    def test_healthy_responses_increase_the_limit(self):
+        limiter = ConcurrencyLimiter(initial=2, max_limit=3)
+        for i in range(10):
+            limiter.release(limiter.acquire(), 200, 0.01)
+        assert limiter.limit == 3
+        assert limiter.in_flight == 0
+
+    def test_throttling_decreases_the_limit_once_per_burst(self):
+        limiter = ConcurrencyLimiter(initial=8)
+        started = []
+        threads = [
+            threading.Thread(target=lambda: started.append(limiter.acquire()))
+            for i in range(3)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        for s in started:
+            limiter.release(s, 429, 0.01)
+        assert limiter.limit == 4
+        assert limiter.throttled == 3
+
+        # A request sent after the decrease may decrease it again.
+        limiter.release(limiter.acquire(), 503, 0.01)
+        assert limiter.limit == 2
+        limiter.release(limiter.acquire(), 503, 0.01)
+        limiter.release(limiter.acquire(), 503, 0.01)
+        assert limiter.limit == 1
+
+    def test_latency_spikes_decrease_the_limit(self):
+        limiter = ConcurrencyLimiter(initial=4)
+        for i in range(5):
+            limiter.release(limiter.acquire(), 200, 0.1)
+        limit = limiter.limit
+        limiter.release(limiter.acquire(), 200, 1.0)
+        assert limiter.limit == limit / 2
+        assert limiter.spikes == 1
+
+        limiter = ConcurrencyLimiter(initial=4, latency_target=0.5)
+        limiter.release(limiter.acquire(), 200, 0.6)
+        assert limiter.limit == 2
+
+    def test_errors_without_a_response_leave_the_limit(self):
+        limiter = ConcurrencyLimiter(initial=4)
+        limiter.release(limiter.acquire())
+        assert limiter.limit == 4
+        assert limiter.in_flight == 0
+
+    def test_nested_acquires_do_not_wait(self):
+        limiter = ConcurrencyLimiter(initial=1)
+        outer = limiter.acquire()
+        assert limiter.acquire() is None
+        limiter.release(None)
+        assert limiter.in_flight == 1
+        limiter.release(outer, 200, 0.01)
+        assert limiter.in_flight == 0
+
+
+class TestSessionLimiter(TestCase):
+
+    def setUp(self):
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+        self.status = 200
+        self.logged_in = None
+        self.limiter = ConcurrencyLimiter(initial=2, max_limit=2)
+        self.metrics = MetricsRegistry()
+        self.session = ElementSession(
+            email='me@example.com', password='secret', domain='api.test',
+            thread_safe=True, limiter=self.limiter,
+            metrics=self.metrics)
+        self.session.mount('http://api.test/', StubAdapter(self.respond))
+
+    def respond(self, request):
+        if request.url == URL + 'login/':
+            self.logged_in = True
+            return 204, {'Set-Cookie': 'token=valid; Path=/'}, b''
+        if self.logged_in is False:
+            return 401, {}, {'urls': {'login_url': URL + 'login/'}}
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(0.02)
+        with self.lock:
+            self.active -= 1
+        if self.status != 200:
+            return self.status, {}, {'message': 'Slow down'}
+        return 200, {}, {'element': 'shoji:view', 'value': 1}
+
+    def test_requests_in_flight_are_limited(self):
+        threads = [
+            threading.Thread(target=self.session.get, args=(URL,))
+            for i in range(8)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert self.max_active == 2
+        assert self.metrics.gauges == {
+            'concurrency_limit': 2, 'requests_in_flight': 0}
+
+    def test_throttled_responses_reduce_the_limit(self):
+        self.status = 429
+        with self.assertRaises(ClientError):
+            self.session.get(URL)
+        assert self.limiter.limit == 1
+        assert self.metrics.gauges['concurrency_limit'] == 1
+
+    def test_login_replays_do_not_deadlock(self):
+        self.limiter.limit = 1
+        self.logged_in = False
+        r = self.session.get(URL)
+        assert r.payload.value == 1
+        assert self.logged_in
+        assert self.limiter.in_flight == 0
@@ -0,0 +1,96 @@
+import threading
+import time
+from unittest import TestCase
+
+from pycrunch.elements import ElementSession
+from pycrunch.lemonpy import ClientError
+from pycrunch.tests.stubs import StubAdapter
+
+API = 'http://api.test/api/'
+LOGIN = API + 'login/'
+
+
+class TestSingleFlightLogin(TestCase):
+
+    threads = 8
+
+    def setUp(self):
+        self.lock = threading.Lock()
+        self.token = 'valid1'
+        self.logins = 0
+        self.max_age = 3600
+        # Threads which are yet to get a 401; see respond.
+        self.unfailed = 0
+        self.all_failed = threading.Event()
+        self.all_failed.set()
+        self.session = ElementSession(
+            email='me@example.com', password='secret', token='expired',
+            domain='api.test', thread_safe=True, pool_maxsize=self.threads)
+        self.adapter = StubAdapter(self.respond)
+        self.session.mount('http://api.test/', self.adapter)
+
+    def respond(self, request):
+        if request.url == LOGIN:
+            with self.lock:
+                self.logins += 1
+                self.token = 'valid%d' % (self.logins + 1)
+            return 204, {'Set-Cookie': 'token=%s; Max-Age=%d; Path=/' % (
+                self.token, self.max_age)}, b''
+
+        cookie = request.headers.get('Cookie', '')
+        if 'token=%s' % self.token not in cookie:
+            if not self.all_failed.is_set():
+                # Make every thread fail before any of them logs in.
+                with self.lock:
+                    self.unfailed -= 1
+                    if self.unfailed == 0:
+                        self.all_failed.set()
+                self.all_failed.wait(5)
+            return 401, {}, {'urls': {'login_url': LOGIN}}
+        return 200, {}, {'element': 'shoji:view', 'value': cookie}
+
+    def test_concurrent_401s_log_in_once(self):
+        self.unfailed = self.threads
+        self.all_failed.clear()
+        results = []
+
+        def get():
+            r = self.session.get(API + 'datasets/')
+            results.append((r.status_code, [h.status_code for h in r.history]))
+
+        threads = [threading.Thread(target=get) for i in range(self.threads)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert self.logins == 1
+        assert results == [(200, [401, 204])] * self.threads
+
+    def test_expiring_login_is_refreshed_before_sending(self):
+        self.max_age = 30
+        self.session.get(API)
+        assert self.logins == 1
+        handler = self.session.hooks['response']
+        assert 0 < handler.login_refresh_at - time.time() <= 15
+
+        handler.login_refresh_at = time.time()
+
+        r = self.session.get(API)
+        assert self.logins == 2
+        assert r.history == []
+        assert 'token=valid3' in r.payload.value
+
+    def test_failed_replay_is_not_repeated(self):
+        self.session.hooks['response'].login_cookies = {}
+
+        def respond(request):
+            if request.url == LOGIN:
+                self.logins += 1
+                return 204, {}, b''
+            return 401, {}, {'urls': {'login_url': LOGIN}}
+
+        self.adapter.responder = respond
+        with self.assertRaises(ClientError):
+            self.session.get(API)
+        assert self.logins == 1
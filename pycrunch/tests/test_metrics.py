@@ -0,0 +1,72 @@
+import json
+from unittest import TestCase
+
+from pycrunch.elements import ElementSession
+from pycrunch.lemonpy import ClientError
+from pycrunch.metrics import Histogram, MetricsRegistry, url_template
+from pycrunch.tests.stubs import StubAdapter
+
+DS_URL = 'http://api.test/api/datasets/1a2b3c4d/'
+
+
+class TestMetricsRegistry(TestCase):
+
+    def setUp(self):
+        self.registry = MetricsRegistry()
+        self.exported = []
+        self.registry.add_exporter(self.exported.append)
+        self.session = ElementSession(token='abc', metrics=self.registry)
+        self.session.mount('http://api.test/', StubAdapter(self.respond))
+
+    def respond(self, request):
+        if request.url.endswith('/missing/'):
+            return 404, {}, {'message': 'Not found'}
+        return 200, {}, {'element': 'shoji:entity', 'self': request.url, 'body': {}}
+
+    def test_records_requests(self):
+        self.session.get(DS_URL)
+        self.session.get('http://api.test/api/datasets/9f8e7d6c/')
+        self.session.patch(DS_URL, data=json.dumps({'body': {'name': 'x'}}))
+        with self.assertRaises(ClientError):
+            self.session.get(DS_URL + 'missing/')
+
+        assert len(self.exported) == 4
+        rec = self.exported[0]
+        assert rec.method == 'GET'
+        assert rec.url == DS_URL
+        assert rec.template == '/api/datasets/{id}/'
+        assert rec.status == 200
+        assert rec.bytes_sent == 0
+        assert rec.bytes_received > 0
+        assert 0 <= rec.parse_time <= rec.latency
+        assert rec.ttfb <= rec.latency
+        assert self.exported[2].bytes_sent == len('{"body": {"name": "x"}}')
+        assert self.exported[3].status == 404
+
+        summary = self.registry.summary()
+        assert summary[('GET', '/api/datasets/{id}/')]['count'] == 2
+        assert summary[('PATCH', '/api/datasets/{id}/')]['count'] == 1
+        assert summary[('GET', '/api/datasets/{id}/missing/')]['statuses'] == {404: 1}
+
+    def test_failing_exporter_does_not_break_requests(self):
+        def broken(record):
+            raise ValueError()
+        self.registry.add_exporter(broken)
+        self.session.get(DS_URL)
+        assert len(self.registry.records) == 1
+
+    def test_url_template(self):
+        assert url_template('http://h/api/datasets/123/batches/0/') == \
+            '/api/datasets/{id}/batches/{id}/'
+        assert url_template('http://h/api/users/') == '/api/users/'
+
+    def test_histogram(self):
+        h = Histogram()
+        for v in [0.001, 0.002, 0.003, 0.1, 1.5]:
+            h.observe(v)
+        assert h.count == 5
+        assert h.min == 0.001
+        assert h.max == 1.5
+        assert h.quantile(0.5) == 0.004
+        assert h.quantile(1) == 1.5
+        assert Histogram().quantile(0.5) is None
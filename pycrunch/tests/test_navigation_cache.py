@@ -0,0 +1,107 @@
+from unittest import TestCase
+
+import mock
+
+from pycrunch.elements import ElementSession, NavigationCache
+from pycrunch.tests.stubs import StubAdapter
+
+DS = 'http://api.test/api/datasets/abc/'
+
+
+def respond(request):
+    url = request.url.split('?')[0]
+    if request.method != 'GET':
+        return 204, {}, b''
+    if url == DS:
+        return 200, {}, {
+            'element': 'shoji:entity', 'self': DS, 'body': {'name': 'ds'},
+            'catalogs': {'variables': DS + 'variables/'},
+            'fragments': {'table': DS + 'table/'},
+        }
+    if url == DS + 'variables/':
+        return 200, {}, {
+            'element': 'shoji:catalog', 'self': url,
+            'index': {'1/': {'alias': 'one', 'name': 'One'}},
+        }
+    if url == DS + 'variables/1/':
+        return 200, {}, {'element': 'shoji:entity', 'self': url, 'body': {'name': 'One'}}
+    if url == DS + 'table/':
+        return 200, {}, {'element': 'crunch:table', 'self': url, 'data': {}}
+    return 404, {}, {'message': 'Not found'}
+
+
+class TestNavigationCache(TestCase):
+
+    def setUp(self):
+        self.cache = NavigationCache(ttl=60)
+        self.session = ElementSession(token='abc', navigation_cache=self.cache)
+        self.adapter = StubAdapter(respond)
+        self.session.mount('http://api.test/', self.adapter)
+        self.ds = self.session.get(DS).payload
+
+    def gets(self, url):
+        return [r.url for r in self.adapter.requests if r.method == 'GET' and r.url == url]
+
+    def test_links_are_fetched_once(self):
+        variables = self.ds.variables
+        assert self.ds.variables is variables
+        assert self.ds.follow('variables') is variables
+        assert len(self.gets(DS + 'variables/')) == 1
+        assert self.cache.stats() == {'entries': 1, 'hits': 2, 'misses': 1}
+
+        # Links with a query string are always fetched.
+        self.ds.follow('variables', 'limit=1')
+        assert len(self.adapter.requests) == 3
+
+    def test_entries_expire(self):
+        with mock.patch('pycrunch.elements.time.time', return_value=1000.0):
+            self.ds.variables
+        with mock.patch('pycrunch.elements.time.time', return_value=1059.0):
+            self.ds.variables
+        assert len(self.gets(DS + 'variables/')) == 1
+        with mock.patch('pycrunch.elements.time.time', return_value=1061.0):
+            self.ds.variables
+        assert len(self.gets(DS + 'variables/')) == 2
+
+    def test_catalog_writes_evict_the_catalog(self):
+        self.ds.variables.edit('1/', name='Uno')
+        self.ds.table
+        self.ds.variables
+        assert len(self.gets(DS + 'variables/')) == 2
+        # Unrelated links stay cached.
+        self.ds.table
+        assert len(self.gets(DS + 'table/')) == 1
+
+    def test_entity_writes_evict_their_catalog(self):
+        variables = self.ds.variables
+        var = self.session.get(DS + 'variables/1/').payload
+        var.edit(name='Uno')
+        assert self.ds.variables is not variables
+        assert len(self.gets(DS + 'variables/')) == 2
+
+    def test_invalidate(self):
+        self.ds.variables
+        self.ds.table
+        self.cache.invalidate(DS + 'table/')
+        assert len(self.cache) == 1
+        self.cache.invalidate()
+        assert len(self.cache) == 0
+
+    def test_invalidate_spares_unrelated_ancestors(self):
+        for url in ('http://api.test/api/', 'http://api.test/api/datasets/', DS,
+                    DS + 'variables/', DS + 'variables/?limit=1',
+                    DS + 'variables/1/', DS + 'variables/1/summary/',
+                    DS + 'variables/2/'):
+            self.cache.store(url, url)
+        self.cache.invalidate(DS + 'variables/1/')
+        assert list(self.cache._entries) == [
+            'http://api.test/api/', 'http://api.test/api/datasets/', DS,
+            DS + 'variables/2/']
+
+    def test_max_entries(self):
+        self.cache.max_entries = 1
+        self.ds.variables
+        self.ds.table
+        self.ds.table
+        self.ds.variables
+        assert len(self.adapter.requests) == 4
@@ -0,0 +1,115 @@
+from unittest import TestCase
+
+import pycrunch
+from pycrunch.elements import ElementSession
+from pycrunch.lemonpy import ClientError
+from pycrunch.shoji import Catalog
+from pycrunch.tests.stubs import StubAdapter, StubServer
+
+ROOT = 'http://api.test/api/'
+
+
+def respond(request):
+    if hasattr(request, 'url'):
+        base, path = ROOT[:-len('/api/')], request.url[len(ROOT) - len('/api/'):]
+    else:
+        base, path = 'http://' + request.headers['Host'], request.path
+    if path == '/api/':
+        return 200, {}, {
+            'element': 'shoji:catalog', 'self': base + path, 'index': {},
+            'catalogs': {'datasets': base + '/api/datasets/',
+                         'missing': base + '/api/missing/'},
+            'urls': {'user_url': base + '/api/users/1/'},
+        }
+    if path in ('/api/datasets/', '/api/users/1/'):
+        element = 'shoji:catalog' if 'datasets' in path else 'shoji:entity'
+        return 200, {}, {'element': element, 'self': base + path, 'index': {}}
+    return 404, {}, {'message': 'Not found'}
+
+
+class TestPrefetch(TestCase):
+
+    def setUp(self):
+        self.session = ElementSession(token='abc', thread_safe=True)
+        self.adapter = StubAdapter(respond)
+        self.session.mount('http://api.test/', self.adapter)
+        self.root = self.session.get(ROOT).payload
+
+    def paths(self):
+        return [r.url for r in self.adapter.requests[1:]]
+
+    def test_prefetched_links_are_fetched_once(self):
+        self.root.prefetch(['datasets', 'user_url'])
+        datasets = self.root.datasets
+        user = self.root.follow('user_url')
+
+        assert isinstance(datasets, Catalog)
+        assert user.self == ROOT + 'users/1/'
+        assert sorted(self.paths()) == [ROOT + 'datasets/', ROOT + 'users/1/']
+
+        # Each prefetch is consumed by its first read.
+        self.root.datasets
+        assert len(self.paths()) == 3
+
+    def test_prefetch_errors_are_raised_on_read(self):
+        self.root.prefetch(['missing'])
+        with self.assertRaises(ClientError):
+            self.root.missing
+
+    def test_unknown_links_are_rejected(self):
+        with self.assertRaises(AttributeError):
+            self.root.prefetch(['nonesuch'])
+
+    def test_refresh_discards_prefetches(self):
+        self.root.prefetch(['datasets'])
+        # Let the prefetch finish, so the count below is the same every run.
+        self.root._prefetches['datasets'].result()
+        self.root.refresh()
+        self.root.datasets
+        assert self.paths().count(ROOT + 'datasets/') == 2
+
+
+class TestConnect(TestCase):
+
+    def setUp(self):
+        self.server = StubServer(respond).start()
+        self.saved_session = pycrunch.session
+        pycrunch.session = None
+
+    def tearDown(self):
+        pycrunch.session = self.saved_session
+        self.server.stop()
+
+    def test_warm_up_fills_the_pool(self):
+        session = ElementSession(token='abc', pool_maxsize=4)
+        url = self.server.url('/api/')
+
+        assert session.warm_up(url, 3) == 3
+        pool = session.get_adapter(url).poolmanager.connection_from_url(url)
+        assert pool.num_connections == 3
+
+        # Connections beyond pool_maxsize are not opened.
+        assert session.warm_up(url, 10) == 4
+
+        session.get(url)
+        assert pool.num_connections == 4
+
+    def test_warm_up_failures_are_not_raised(self):
+        session = ElementSession(token='abc')
+        self.server.stop()
+        assert session.warm_up(self.server.url('/api/'), 2) == 0
+        self.server = StubServer(respond).start()
+
+    def test_connect_warms_up_and_prefetches(self):
+        site = pycrunch.connect_with_token(
+            'abc', self.server.url('/api/'), warm_connections=2,
+            prefetch=['datasets']
+        )
+
+        assert site.session.thread_safe
+        assert pycrunch.session is site
+        future = site._prefetches['datasets']
+        assert isinstance(site.datasets, Catalog)
+        assert future.done()
+        paths = [r.path for r in self.server.requests]
+        assert paths == ['/api/', '/api/datasets/']
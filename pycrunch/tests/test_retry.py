@@ -0,0 +1,115 @@
+import json
+from unittest import TestCase
+
+import mock
+import requests
+
+from pycrunch.elements import ElementSession
+from pycrunch.lemonpy import (
+    CircuitBreaker, CircuitOpenError, ClientError, RetryPolicy, ServerError,
+    parse_retry_after)
+from pycrunch.tests.stubs import StubAdapter
+
+URL = 'http://api.test/api/'
+
+
+class TestRetryPolicy(TestCase):
+
+    def setUp(self):
+        self.statuses = []
+        self.retry_after = '7'
+        self.policy = RetryPolicy(max_retries=3, breaker_threshold=5,
+                                  breaker_timeout=60)
+        self.session = ElementSession(token='abc', retry_policy=self.policy)
+        self.adapter = StubAdapter(self.respond)
+        self.session.mount('http://api.test/', self.adapter)
+        patcher = mock.patch('pycrunch.lemonpy.time.sleep')
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def respond(self, request):
+        status = self.statuses.pop(0) if self.statuses else 200
+        if isinstance(status, Exception):
+            raise status
+        headers = {}
+        if status == 429:
+            headers['Retry-After'] = self.retry_after
+        return status, headers, {'element': 'shoji:view', 'value': status}
+
+    def test_retries_transient_errors(self):
+        self.statuses = [503, requests.exceptions.ConnectionError('reset'), 429]
+        r = self.session.get(URL)
+
+        assert r.payload.value == 200
+        assert len(self.adapter.requests) == 4
+        assert self.policy.retries == 3
+        assert [e['reason'] for e in self.policy.events] == [
+            503, 'ConnectionError', 429]
+        # The Retry-After header is honored.
+        assert self.sleep.call_args_list[-1] == mock.call(7.0)
+        for call in self.sleep.call_args_list[:2]:
+            assert 0 <= call[0][0] <= 30
+
+    def test_retry_after_is_capped(self):
+        self.retry_after = '86400'
+        self.statuses = [429]
+        self.session.get(URL)
+        assert self.sleep.call_args_list == [mock.call(30)]
+
+    def test_gives_up_after_max_retries(self):
+        self.statuses = [503] * 4
+        with self.assertRaises(ServerError):
+            self.session.get(URL)
+        assert len(self.adapter.requests) == 4
+
+    def test_non_idempotent_methods_are_not_retried(self):
+        self.statuses = [503]
+        with self.assertRaises(ServerError):
+            self.session.post(URL, data=json.dumps({}))
+        assert len(self.adapter.requests) == 1
+
+        # ...unless the server asked us to come back later.
+        self.statuses = [429]
+        r = self.session.post(URL, data=json.dumps({}))
+        assert r.payload.value == 200
+
+    def test_client_errors_are_not_retried(self):
+        self.statuses = [404]
+        with self.assertRaises(ClientError):
+            self.session.get(URL)
+        assert len(self.adapter.requests) == 1
+        assert self.policy.retries == 0
+
+    def test_circuit_breaker(self):
+        self.policy.breaker_threshold = 3
+        self.statuses = [503] * 3
+        with self.assertRaises(ServerError):
+            self.session.get(URL)
+        # The third failure opened the circuit, so the last retry was skipped.
+        assert len(self.adapter.requests) == 3
+        with self.assertRaises(CircuitOpenError):
+            self.session.get(URL)
+        assert len(self.adapter.requests) == 3
+        assert self.policy.stats()['open_circuits'] == ['api.test']
+
+        breaker = self.policy.breaker(URL)
+        breaker.opened_at -= 60
+        assert self.session.get(URL).payload.value == 200
+        assert breaker.state == CircuitBreaker.CLOSED
+        assert [e['new'] for e in self.policy.events if e['event'] == 'breaker'] == [
+            'open', 'half-open', 'closed']
+
+    def test_half_open_failure_reopens(self):
+        breaker = CircuitBreaker('api.test', threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        breaker.before_request()
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+
+    def test_parse_retry_after(self):
+        assert parse_retry_after('3') == 3
+        assert parse_retry_after(None) is None
+        assert parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT') == 0
+        assert parse_retry_after('bogus') is None
@@ -6,10 +6,16 @@ from unittest import TestCase
 
 import sys
 
-from pycrunch.elements import ElementSession
+from pycrunch.datasets import Dataset
+from pycrunch.elements import (
+    ElementSession, _url_classifiers, is_dataset, make_element, url_class,
+    url_patterns)
+from pycrunch.importing import Batch, Source
+from pycrunch.variables import Subvariable, Variable
 from requests import Response
 
 from pycrunch.progress import DefaultProgressTracking, SimpleTextBarProgressTracking
+from pycrunch.lemonpy import ClientError
 from pycrunch.shoji import Catalog, TaskProgressTimeoutError, TaskError, Tuple, Entity
 
 
@@ -28,7 +34,7 @@ class TestShojiCreation(TestCase):
 
         sess.post.assert_called_once_with(
             'http://host.com/catalog',
-            json.dumps({"somedata": 1, "body": {}, "element": "shoji:entity"}, indent=4),
+            '{"somedata":1,"body":{},"element":"shoji:entity"}',
             headers={'Content-Type': 'application/json'}
         )
 
@@ -192,4 +198,154 @@ class TestShojiCreation(TestCase):
             'headers': {
                 'Content-Type': 'application/json'
             }
-        }
\ No newline at end of file
+        }
+
+
+class TestFetchEntities(TestCase):
+
+    def _catalog(self, sess):
+        return Catalog(sess, **{
+            'self': 'http://host.com/catalog/',
+            'index': {
+                '1/': {'name': 'one'},
+                '2/': {'name': 'two'},
+                '3/': {'name': 'three'},
+            }
+        })
+
+    def _get(self, url, *args, **kwargs):
+        if url.endswith('/2/'):
+            raise ClientError('Not found')
+        r = Response()
+        r.payload = {'self': url}
+        return r
+
+    def test_fetch_entities(self):
+        sess = mock.MagicMock()
+        sess.get.side_effect = self._get
+        c = self._catalog(sess)
+
+        errors = c.fetch_entities(max_workers=3)
+
+        assert list(errors.keys()) == ['2/']
+        assert isinstance(errors['2/'], ClientError)
+        assert c.index['1/']._entity == {'self': 'http://host.com/catalog/1/'}
+        assert c.index['3/']._entity == {'self': 'http://host.com/catalog/3/'}
+        assert c.index['2/']._entity is None
+        assert sess.get.call_count == 3
+
+    def test_fetch_entities_skips_fetched(self):
+        sess = mock.MagicMock()
+        sess.get.side_effect = self._get
+        c = self._catalog(sess)
+        c.index['1/']._entity = 'cached'
+
+        c.index.fetch_entities()
+        assert sess.get.call_count == 2
+        assert c.index['1/'].entity == 'cached'
+
+        c.index.fetch_entities(refresh=True)
+        assert sess.get.call_count == 5
+        assert c.index['1/'].entity == {'self': 'http://host.com/catalog/1/'}
+
+
+class TestURLClasses(TestCase):
+
+    def parse(self, url, lazy=False):
+        return make_element(object(), {"element": "shoji:entity", "self": url}, lazy)
+
+    def test_resource_classes(self):
+        api = "https://app.crunch.io/api/"
+        for path, cls in [
+            ("datasets/abc/", Dataset),
+            ("datasets/abc/?nosummary=1", Dataset),
+            ("datasets/abc/variables/0001/", Variable),
+            ("datasets/abc/variables/0001/subvariables/0002/", Subvariable),
+            ("datasets/abc/batches/3/", Batch),
+            ("sources/9f1/", Source),
+            ("datasets/abc/variables/", Entity),
+            ("projects/abc/datasets/abc/", Entity),
+            ("users/abc/", Entity),
+        ]:
+            entity = self.parse(api + path)
+            assert type(entity) is cls, path
+            assert isinstance(self.parse(api + path, lazy=True), cls)
+
+    def test_no_self(self):
+        assert type(self.parse(None)) is Entity
+        assert type(make_element(object(), {"element": "shoji:entity"})) is Entity
+
+    def test_is_dataset(self):
+        assert is_dataset({"element": "shoji:entity",
+                           "self": "https://app.crunch.io/api/datasets/abc/"})
+        assert not is_dataset({"element": "shoji:entity",
+                               "self": "https://app.crunch.io/api/sources/abc/"})
+
+    def test_register_url_pattern(self):
+        class Order(Entity):
+            url_pattern = r"datasets/[^/]+/orders/[^/]+/"
+
+        try:
+            entity = self.parse("https://app.crunch.io/api/datasets/abc/orders/1/")
+            assert type(entity) is Order
+            assert url_class("shoji:entity", "http://h/api/datasets/1/") is Dataset
+        finally:
+            url_patterns["shoji:entity"].remove((Order.url_pattern, Order))
+            _url_classifiers.pop("shoji:entity", None)
+
+
+class TestSecondaryIndexes(TestCase):
+
+    def setUp(self):
+        self.session = mock.MagicMock()
+        self.catalog = Catalog(self.session, **{
+            'self': 'http://host.com/api/datasets/abc/variables/',
+            'index': {
+                '1/': {'alias': 'one', 'name': 'Same'},
+                '2/': {'alias': 'two', 'name': 'Same'},
+                '3/': {'name': 'Other'},
+            },
+        })
+
+    def test_by_is_memoized(self):
+        by_alias = self.catalog.by('alias')
+        assert sorted(by_alias) == ['one', 'two']
+        assert by_alias['one'] is self.catalog.index['1/']
+        assert self.catalog.by('alias') is by_alias
+        assert self.catalog.by('name') is not by_alias
+
+    def test_by_all(self):
+        by_name = self.catalog.by_all('name')
+        assert sorted(by_name) == ['Other', 'Same']
+        assert sorted(by_name['Same'], key=lambda t: t.alias) == [
+            self.catalog.index['1/'], self.catalog.index['2/']]
+        assert by_name['Other'] == [self.catalog.index['3/']]
+        assert self.catalog.by_all('name') is by_name
+
+    def test_index_changes_rebuild(self):
+        by_alias = self.catalog.by('alias')
+        self.catalog.index['4/'] = Tuple(self.session, '4/', alias='four')
+        assert 'four' in self.catalog.by('alias')
+
+        self.catalog['index'] = self.catalog.index_class(
+            self.session, self.catalog.self, **{'5/': {'alias': 'five'}})
+        assert list(self.catalog.by('alias')) == ['five']
+        assert by_alias is not self.catalog.by('alias')
+
+    def test_writes_invalidate(self):
+        for write in (
+            lambda: self.catalog.edit('1/', alias='uno'),
+            lambda: self.catalog.drop('2/'),
+            lambda: self.catalog.add('5/', {'alias': 'five'}),
+        ):
+            by_alias = self.catalog.by('alias')
+            write()
+            assert self.catalog.by('alias') is not by_alias
+
+    def test_refresh_invalidates(self):
+        by_alias = self.catalog.by('alias')
+        self.session.get.return_value.payload = Catalog(self.session, **{
+            'self': self.catalog.self, 'index': {'1/': {'alias': 'uno'}}})
+        self.catalog.refresh()
+        assert list(self.catalog.by('alias')) == ['uno']
+        assert by_alias is not self.catalog.by('alias')
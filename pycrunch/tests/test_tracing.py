@@ -0,0 +1,142 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import pytest
+
+from pycrunch import tracing
+from pycrunch.elements import ElementSession
+from pycrunch.lemonpy import ClientError
+from pycrunch.tests.stubs import StubAdapter
+
+URL = 'http://api.test/api/datasets/'
+
+
+def respond(request):
+    if request.url == URL:
+        return 200, {}, {'element': 'shoji:catalog', 'self': URL, 'index': {}}
+    return 404, {}, {'message': 'Not found'}
+
+
+class TestTracer(TestCase):
+
+    def setUp(self):
+        self.tracer = tracing.Tracer()
+        self.spans = []
+        self.tracer.add_exporter(self.spans.append)
+
+    def test_spans_are_nested(self):
+        with self.tracer.span('outer', {'a': 1}) as outer:
+            with self.tracer.span('inner') as inner:
+                assert self.tracer.current_span() is inner
+            assert self.tracer.current_span() is outer
+        assert self.tracer.current_span() is None
+
+        assert self.spans == [inner, outer]
+        assert inner.parent_id == outer.span_id
+        assert inner.trace_id == outer.trace_id
+        assert outer.parent_id is None
+        assert outer.attributes == {'a': 1}
+        assert outer.start <= inner.start <= inner.end <= outer.end
+
+    def test_errors_are_recorded(self):
+        with self.assertRaises(ValueError):
+            with self.tracer.span('failing'):
+                raise ValueError('bad')
+        assert self.spans[0].error == 'ValueError: bad'
+
+    def test_disabled_without_exporters(self):
+        self.tracer.remove_exporter(self.spans.append)
+        assert self.tracer.span('x') is tracing.NULL_SPAN
+        assert not self.tracer.enabled
+
+    def test_json_lines_exporter(self):
+        out = io.StringIO()
+        self.tracer.add_exporter(tracing.JSONLinesExporter(out))
+        with self.tracer.span('outer'):
+            with self.tracer.span('inner', {'n': 2}):
+                pass
+
+        lines = [json.loads(line) for line in out.getvalue().splitlines()]
+        assert [line['name'] for line in lines] == ['inner', 'outer']
+        assert lines[0]['parent_id'] == lines[1]['span_id']
+        assert lines[0]['attributes'] == {'n': 2}
+        assert lines[1]['duration'] >= 0
+
+    def test_json_lines_exporter_path(self):
+        path = os.path.join(tempfile.mkdtemp(), 'trace.jsonl')
+        exporter = tracing.JSONLinesExporter(path)
+        self.tracer.add_exporter(exporter)
+        with self.tracer.span('outer'):
+            pass
+        exporter.close()
+
+        with io.open(path, encoding='utf-8') as f:
+            lines = [json.loads(line) for line in f]
+        shutil.rmtree(os.path.dirname(path))
+        assert [line['name'] for line in lines] == ['outer']
+
+
+class TestSessionSpans(TestCase):
+
+    def setUp(self):
+        self.spans = []
+        tracing.tracer.add_exporter(self.spans.append)
+        self.session = ElementSession(token='abc')
+        self.session.mount('http://api.test/', StubAdapter(respond))
+
+    def tearDown(self):
+        tracing.tracer.remove_exporter(self.spans.append)
+
+    def test_requests_are_child_spans(self):
+        @tracing.traced('list datasets')
+        def list_datasets(session):
+            return session.get(URL).payload
+
+        list_datasets(self.session)
+
+        parse, http, root = self.spans
+        assert root.name == 'list datasets'
+        assert http.name == 'HTTP GET'
+        assert http.parent_id == root.span_id
+        assert http.attributes == {
+            'http.method': 'GET', 'http.url': URL, 'http.status_code': 200}
+        assert parse.parent_id == http.span_id
+        assert parse.attributes['content_type'] == 'application/json'
+
+    def test_failed_requests_record_errors(self):
+        with self.assertRaises(ClientError):
+            self.session.get(URL + 'missing/')
+        assert self.spans[-1].error.startswith('ClientError')
+
+
+class TestOpenTelemetryExporter(TestCase):
+
+    def test_spans_are_forwarded(self):
+        try:
+            from opentelemetry.sdk.trace import TracerProvider
+            from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+            from opentelemetry.sdk.trace.export.in_memory_span_exporter import \
+                InMemorySpanExporter
+        except ImportError:
+            pytest.skip("opentelemetry-sdk is not installed")
+
+        memory = InMemorySpanExporter()
+        provider = TracerProvider()
+        provider.add_span_processor(SimpleSpanProcessor(memory))
+        tracer = tracing.Tracer()
+        tracer.add_exporter(tracing.OpenTelemetryExporter(provider.get_tracer('test')))
+
+        with tracer.span('outer', {'url': 'http://x/', 'obj': object()}):
+            with self.assertRaises(KeyError):
+                with tracer.span('inner'):
+                    raise KeyError('k')
+
+        inner, outer = memory.get_finished_spans()
+        assert inner.parent.span_id == outer.context.span_id
+        assert not inner.status.is_ok
+        assert outer.attributes['url'] == 'http://x/'
+        assert outer.attributes['obj'].startswith('<object')
@@ -0,0 +1,152 @@
+import gzip
+import io
+import json
+from unittest import TestCase
+
+import pytest
+import requests
+
+from pycrunch.elements import ElementSession
+from pycrunch.lemonpy import ClientError, ServerError
+from pycrunch.shoji import Catalog
+from pycrunch.tests.stubs import StubServer
+from pycrunch.transports import TRANSPORTS, make_transport
+
+
+def gzipped(data):
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode='wb') as f:
+        f.write(data)
+    return buf.getvalue()
+
+
+class TransportContract(object):
+    """The ResponseHandler contract tests, which every transport must pass."""
+
+    transport = None
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = StubServer(cls.respond).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    @staticmethod
+    def respond(request):
+        path = request.path.split('?')[0]
+        if path == '/api/datasets/':
+            return 200, {}, {
+                'element': 'shoji:catalog', 'self': request.path,
+                'index': {'1/': {'name': 'one'}, '2/': {'name': 'two'}},
+            }
+        if path == '/api/echo/':
+            return 200, {}, {
+                'element': 'shoji:view', 'value': {
+                    'method': request.method,
+                    'body': request.body.decode('utf-8'),
+                    'user-agent': request.headers.get('User-Agent'),
+                    'cookie': request.headers.get('Cookie'),
+                }
+            }
+        if path == '/api/gzip/':
+            body = gzipped(json.dumps({'element': 'shoji:view', 'value': 'x' * 1000}).encode('utf-8'))
+            return 200, {'Content-Type': 'application/json',
+                         'Content-Encoding': 'gzip'}, body
+        if path == '/api/login/':
+            return 204, {'Set-Cookie': 'token=abc123; Path=/'}, b''
+        if path == '/api/empty/':
+            return 204, {}, b''
+        if path == '/api/missing/':
+            return 404, {}, {'message': 'Not found'}
+        return 500, {}, {'message': 'Oops'}
+
+    def setUp(self):
+        try:
+            self.session = ElementSession(transport=self.transport)
+        except ImportError as exc:
+            pytest.skip(str(exc))
+        self.session.trust_env = False
+
+    def tearDown(self):
+        self.session.close()
+
+    def url(self, path):
+        return self.server.url(path)
+
+    def test_mounted(self):
+        assert self.session.get_adapter(self.url('/')).name == self.transport
+
+    def test_warm_up(self):
+        assert self.session.warm_up(self.url('/api/datasets/'), 2) >= 1
+        r = self.session.get(self.url('/api/datasets/'))
+        assert r.payload.index['1/'].name == 'one'
+
+    def test_get_parses_elements(self):
+        r = self.session.get(self.url('/api/datasets/'), params={'limit': 5})
+        assert r.status_code == 200
+        assert isinstance(r.payload, Catalog)
+        assert sorted(r.payload.index) == ['1/', '2/']
+        assert r.payload.self.endswith('/api/datasets/?limit=5')
+        assert r.headers['content-type'] == 'application/json'
+
+    def test_post_body_and_headers(self):
+        r = self.session.post(self.url('/api/echo/'), data=json.dumps({'a': 1}))
+        value = r.payload.value
+        assert value['method'] == 'POST'
+        assert json.loads(value['body']) == {'a': 1}
+        assert value['user-agent'].startswith('pycrunch/')
+
+    def test_gzip_responses_are_decoded(self):
+        r = self.session.get(self.url('/api/gzip/'))
+        assert r.payload.value == 'x' * 1000
+
+    def test_streamed_parse(self):
+        self.session.stream_threshold = 0
+        r = self.session.get(self.url('/api/datasets/'))
+        assert isinstance(r.payload, Catalog)
+        assert r.payload.index['2/'].name == 'two'
+
+    def test_no_content(self):
+        r = self.session.get(self.url('/api/empty/'))
+        assert r.status_code == 204
+        assert r.payload is None
+
+    def test_error_statuses(self):
+        with self.assertRaises(ClientError) as exc:
+            self.session.get(self.url('/api/missing/'))
+        assert exc.exception.status_code == 404
+        with self.assertRaises(ServerError):
+            self.session.get(self.url('/api/fail/'))
+
+    def test_cookies_are_stored(self):
+        self.session.post(self.url('/api/login/'), data='{}')
+        assert self.session.cookies.get('token') == 'abc123'
+        r = self.session.get(self.url('/api/echo/'))
+        assert 'token=abc123' in r.payload.value['cookie']
+
+    def test_connection_errors(self):
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            self.session.get('http://127.0.0.1:1/api/')
+
+
+class TestRequestsTransport(TransportContract, TestCase):
+    transport = 'requests'
+
+
+class TestUrllib3Transport(TransportContract, TestCase):
+    transport = 'urllib3'
+
+
+class TestHTTPXTransport(TransportContract, TestCase):
+    transport = 'httpx'
+
+
+def test_make_transport():
+    assert set(TRANSPORTS) == set(['requests', 'urllib3', 'httpx'])
+    adapter = make_transport(pool_maxsize=4)
+    assert isinstance(adapter, requests.adapters.HTTPAdapter)
+    assert adapter._pool_maxsize == 4
+    with pytest.raises(ValueError):
+        make_transport('carrier-pigeon')
@@ -0,0 +1,82 @@
+import mock
+from unittest import TestCase
+
+from pycrunch.elements import ElementSession
+from pycrunch.lemonpy import URL, URLTable, intern_url
+from pycrunch.shoji import Catalog, Entity
+from pycrunch.tests.stubs import StubAdapter
+
+DATASETS = 'http://api.test/api/datasets/'
+
+
+class TestURL(TestCase):
+
+    def test_absolute_is_cached_until_base_changes(self):
+        url = URL('abc/', DATASETS)
+        assert url.absolute == DATASETS + 'abc/'
+        assert url.absolute is url.absolute
+        assert url.parts[1] == ('', 'api', 'datasets', 'abc', '')
+
+        url.base = 'http://api.test/api/projects/'
+        assert url.absolute == 'http://api.test/api/projects/abc/'
+        assert url.parts[1] == ('', 'api', 'projects', 'abc', '')
+
+    def test_relative_to(self):
+        url = URL('abc/variables/?limit=5', DATASETS)
+        assert url.relative_to(DATASETS) == 'abc/variables/?limit=5'
+        assert url.relative_to(URL(DATASETS, '')) == 'abc/variables/?limit=5'
+        assert url.relative_to(DATASETS + 'abc/') == 'variables/?limit=5'
+        assert url.relative_to('http://api.test/api/projects/1/') == (
+            '../../datasets/abc/variables/?limit=5')
+        assert url.relative_to('https://api.test/api/') == url.absolute
+
+
+class TestURLTable(TestCase):
+
+    def respond(self, request):
+        return 200, {}, {
+            'element': 'shoji:catalog', 'self': DATASETS,
+            'index': {'abc/': {'name': 'one'}, 'def/': {'name': 'two'}},
+        }
+
+    def test_index_urls_are_interned_per_session(self):
+        session = ElementSession(token='abc')
+        session.mount('http://api.test/', StubAdapter(self.respond))
+        first = session.get(DATASETS).payload
+        second = session.get(DATASETS).payload
+
+        assert first is not second
+        assert first.index['abc/'].entity_url is second.index['abc/'].entity_url
+        assert second.index['def/'].entity_url.absolute == DATASETS + 'def/'
+
+        other = ElementSession(token='abc')
+        other.mount('http://api.test/', StubAdapter(self.respond))
+        third = other.get(DATASETS).payload
+        assert third.index['abc/'].entity_url is not first.index['abc/'].entity_url
+
+    def test_table_is_bounded(self):
+        table = URLTable(max_urls=2)
+        url = table.get('abc/', DATASETS)
+        assert table.get('abc/', DATASETS) is url
+        table.get('def/', DATASETS)
+        # abc/ was used more recently than def/, so def/ is dropped.
+        table.get('abc/', DATASETS)
+        table.get('ghi/', DATASETS)
+        assert len(table) == 2
+        assert table.get('abc/', DATASETS) is url
+        assert list(table.urls) == [('ghi/', DATASETS), ('abc/', DATASETS)]
+
+    def test_catalogs_can_be_built(self):
+        # Python 2 cannot weakly reference URL's (which are str's).
+        session = ElementSession(token='abc')
+        catalog = Catalog(session, self=DATASETS, index={'abc/': {'name': 'one'}})
+        assert catalog.index['abc/'].entity_url.absolute == DATASETS + 'abc/'
+        entity = Entity(session, self=DATASETS + 'abc/', body={'name': 'one'})
+        assert entity.self.absolute == DATASETS + 'abc/'
+
+    def test_sessions_without_a_table(self):
+        session = mock.MagicMock()
+        url = intern_url(session, 'abc/', DATASETS)
+        assert url.absolute == DATASETS + 'abc/'
+        catalog = Catalog(session, self=DATASETS, index={'abc/': {}})
+        assert catalog.index['abc/'].entity_url.absolute == DATASETS + 'abc/'
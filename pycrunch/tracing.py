@@ -0,0 +1,285 @@
+"""Tracing spans for pycrunch operations.
+
+The high-level operations of pycrunch (creating entities, waiting for
+progress, importing, exporting, fetching cubes and dataframes) each open
+a span, and every HTTP request made within one becomes a child span of
+it, as does the parsing of each response. Spans are only recorded once
+an exporter has been added to the tracer, so tracing costs next to
+nothing until then:
+
+    >> from pycrunch import tracing
+    >> tracing.tracer.add_exporter(tracing.JSONLinesExporter("trace.jsonl"))
+    >> importer.append_csv_string(ds, csv_file)
+
+Each line of trace.jsonl is then one finished span, with its trace_id,
+span_id and parent_id, start and end times and attributes, from which
+a flame chart of the job can be drawn. The OpenTelemetryExporter
+instead forwards each span to OpenTelemetry (which must be installed),
+as a child of any OpenTelemetry span active where the operation began.
+
+The current span is kept per thread; requests made on other threads
+(for example by Document.prefetch) begin new traces.
+
+Use the traced decorator, or tracer.span as a context manager, to add
+spans for your own operations:
+
+    >> @tracing.traced("build report")
+    .. def build_report(ds):
+    ..     ...
+"""
+
+import functools
+import io
+import logging
+import os
+import threading
+import time
+from binascii import hexlify
+
+import six
+
+from pycrunch import jsonlib
+
+log = logging.getLogger(__name__)
+
+
+def new_id(nbytes):
+    return hexlify(os.urandom(nbytes)).decode("ascii")
+
+
+class Span(object):
+    """A timed operation, with attributes, within a trace.
+
+    Spans are made by Tracer.span, and begin when made. Use them as context
+    managers; on exit the span is finished, recording any exception raised
+    within it as its 'error', and passed to each exporter of its tracer.
+    """
+
+    def __init__(self, tracer, name, parent=None, attributes=None):
+        self.tracer = tracer
+        self.name = name
+        self.span_id = new_id(8)
+        if parent is None:
+            self.trace_id = new_id(16)
+            self.parent_id = None
+        else:
+            self.trace_id = parent.trace_id
+            self.parent_id = parent.span_id
+        self.attributes = dict(attributes or {})
+        self.thread = threading.current_thread().name
+        self.error = None
+        self.start = time.time()
+        self.end = None
+
+    @property
+    def duration(self):
+        if self.end is None:
+            return None
+        return self.end - self.start
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def __enter__(self):
+        self.tracer._push(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.error = "%s: %s" % (exc_type.__name__, exc)
+        self.tracer._pop(self)
+        self.finish()
+
+    def finish(self):
+        """End this span (if it has not been ended) and export it."""
+        if self.end is None:
+            self.end = time.time()
+            self.tracer._export(self)
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "end": self.end,
+            "duration": self.duration,
+            "thread": self.thread,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class NullSpan(object):
+    """The span returned while tracing is disabled; it records nothing."""
+
+    def set_attribute(self, key, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+    def finish(self):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class Tracer(object):
+    """Makes Spans, tracking the current span of each thread.
+
+    Each exporter added with add_exporter is called with every finished
+    Span. An exporter may also have a span_started(span) method, which is
+    called as each Span begins. While there are no exporters, span()
+    returns NULL_SPAN.
+    """
+
+    def __init__(self):
+        self.exporters = []
+        self._local = threading.local()
+
+    def add_exporter(self, exporter):
+        self.exporters.append(exporter)
+
+    def remove_exporter(self, exporter):
+        self.exporters.remove(exporter)
+
+    @property
+    def enabled(self):
+        return bool(self.exporters)
+
+    def current_span(self):
+        """Return the innermost open Span of the current thread, or None."""
+        stack = getattr(self._local, "stack", None)
+        return stack[-1] if stack else None
+
+    def span(self, name, attributes=None):
+        """Return a new Span, a child of the current one, for use in a with block."""
+        if not self.exporters:
+            return NULL_SPAN
+        span = Span(self, name, self.current_span(), attributes)
+        for exporter in self.exporters:
+            started = getattr(exporter, "span_started", None)
+            if started is not None:
+                try:
+                    started(span)
+                except Exception:
+                    log.exception("Trace exporter %r failed", exporter)
+        return span
+
+    def _push(self, span):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(span)
+
+    def _pop(self, span):
+        stack = getattr(self._local, "stack", None)
+        if stack and stack[-1] is span:
+            stack.pop()
+
+    def _export(self, span):
+        for exporter in self.exporters:
+            try:
+                exporter(span)
+            except Exception:
+                log.exception("Trace exporter %r failed", exporter)
+
+
+tracer = Tracer()
+"""The Tracer of all pycrunch spans."""
+
+
+def traced(name=None):
+    """Decorate a function to run it within a span of the given name.
+
+    The name defaults to the qualified name of the function.
+    """
+    def decorator(func):
+        span_name = name or "%s.%s" % (
+            func.__module__, getattr(func, "__qualname__", func.__name__))
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracer.span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class JSONLinesExporter(object):
+    """Writes each finished Span as a line of JSON to a file.
+
+    The 'target' may be a path, which is opened for appending, or an
+    open text file, such as one from io.open. Lines are written and
+    flushed under a lock, so one exporter may be shared by every thread.
+    """
+
+    def __init__(self, target):
+        if isinstance(target, six.string_types):
+            self.file = io.open(target, "a", encoding="utf-8")
+            self.owned = True
+        else:
+            self.file = target
+            self.owned = False
+        self.lock = threading.Lock()
+
+    def __call__(self, span):
+        # The JSON is ASCII; text files on Python 2 take only unicode.
+        line = six.text_type(jsonlib.dumps(span.as_dict())) + u"\n"
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+
+    def close(self):
+        if self.owned:
+            self.file.close()
+
+
+class OpenTelemetryExporter(object):
+    """Forwards Spans to OpenTelemetry, with the same timing and parentage.
+
+    Spans are sent to the given OpenTelemetry tracer, or by default to
+    the one named "pycrunch" of the global tracer provider. Attributes
+    whose values OpenTelemetry cannot hold are sent as strings.
+    """
+
+    def __init__(self, otel_tracer=None):
+        from opentelemetry import trace
+
+        self.trace = trace
+        self.otel_tracer = otel_tracer or trace.get_tracer("pycrunch")
+        self.lock = threading.Lock()
+        self._spans = {}
+
+    def span_started(self, span):
+        with self.lock:
+            parent = self._spans.get(span.parent_id)
+        context = None
+        if parent is not None:
+            context = self.trace.set_span_in_context(parent)
+        otel_span = self.otel_tracer.start_span(
+            span.name, context=context, start_time=int(span.start * 1e9))
+        with self.lock:
+            self._spans[span.span_id] = otel_span
+
+    def __call__(self, span):
+        with self.lock:
+            otel_span = self._spans.pop(span.span_id, None)
+        if otel_span is None:
+            return
+        for key, value in six.iteritems(span.attributes):
+            if value is None:
+                continue
+            if not isinstance(value, (bool, int, float) + six.string_types):
+                value = str(value)
+            otel_span.set_attribute(key, value)
+        if span.error is not None:
+            from opentelemetry.trace import Status, StatusCode
+            otel_span.set_status(Status(StatusCode.ERROR, span.error))
+        otel_span.end(end_time=int(span.end * 1e9))
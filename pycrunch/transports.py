@@ -0,0 +1,312 @@
+"""HTTP transports for lemonpy sessions.
+
+A lemonpy.Session sends its requests through requests' transport adapter
+interface, so the library which actually speaks HTTP may be swapped out
+without changing anything above it: response hooks, cookies, retries,
+caching and so on all work the same. Pass the name of one of the
+TRANSPORTS below (or a function which returns an adapter) as the
+'transport' of the session:
+
+    >> site = pycrunch.connect(user, pw, transport="urllib3")
+
+"requests" (the default)
+    requests' own HTTPAdapter.
+
+"urllib3"
+    An HTTPAdapter which sends plain requests (those without proxies or
+    client certificates) directly to the urllib3 connection pool of their
+    host, skipping much of the per-request work of HTTPAdapter.send.
+
+"httpx"
+    An adapter which sends requests with an httpx.Client, multiplexing
+    concurrent requests to each host over a single HTTP/2 connection where
+    the server supports it. Requires httpx (with its "http2" extra) and
+    Python 3.6+. The client verifies certificates and uses any proxies
+    configured in the environment; per-request 'verify', 'cert' and
+    'proxies' arguments are ignored.
+
+Each transport also has a warm_up(url, connections) method, which opens
+connections to the host of the given URL (completing any TLS handshake)
+before they are needed; see lemonpy.Session.warm_up.
+"""
+
+import socket
+from concurrent.futures import ThreadPoolExecutor
+
+import six
+
+from requests import exceptions
+from requests.adapters import BaseAdapter, HTTPAdapter, TimeoutSauce
+from requests.cookies import extract_cookies_to_jar
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers, select_proxy
+
+try:
+    from requests.packages.urllib3 import exceptions as urllib3_exceptions
+except ImportError:  # pragma: no cover
+    from urllib3 import exceptions as urllib3_exceptions
+
+
+class PoolWarmUp(object):
+    """A mixin for HTTPAdapters which fills their connection pools ahead of time."""
+
+    def warm_up(self, url, connections=1, verify=True):
+        """Connect up to 'connections' connections in the pool for url.
+
+        No more than the pool_maxsize of the adapter are opened, and any
+        already connected count towards the total. Return the number of
+        connections which are connected; those which fail to connect are
+        returned to the pool unconnected, to be retried when used.
+        """
+        pool = self.poolmanager.connection_from_url(url)
+        if url.startswith("https"):
+            self.cert_verify(pool, url, verify, None)
+
+        conns = []
+        try:
+            for i in range(min(connections, self._pool_maxsize)):
+                conns.append(pool._get_conn())
+        except urllib3_exceptions.EmptyPoolError:
+            pass  # pool_block=True and every connection is in use.
+
+        def connect(conn):
+            if conn.sock is not None:
+                return True
+            try:
+                conn.connect()
+                return True
+            except (urllib3_exceptions.HTTPError, socket.error):
+                conn.close()
+                return False
+
+        try:
+            with ThreadPoolExecutor(max_workers=max(len(conns), 1)) as executor:
+                return sum(executor.map(connect, conns))
+        finally:
+            for conn in conns:
+                pool._put_conn(conn)
+
+
+class RequestsTransport(PoolWarmUp, HTTPAdapter):
+    """The default transport: requests' HTTPAdapter."""
+
+    name = "requests"
+
+
+class Urllib3Transport(PoolWarmUp, HTTPAdapter):
+    """An HTTPAdapter which sends plain requests straight to urllib3.
+
+    Requests which need a proxy or a client certificate, or which have
+    a streamed (chunked) body, are sent by HTTPAdapter.send as usual.
+    """
+
+    name = "urllib3"
+
+    def send(self, request, stream=False, timeout=None, verify=True,
+             cert=None, proxies=None):
+        body = request.body
+        if (
+            cert is not None or
+            (proxies and select_proxy(request.url, proxies)) or
+            not (body is None or isinstance(body, (bytes, six.text_type)))
+        ):
+            return super(Urllib3Transport, self).send(
+                request, stream, timeout, verify, cert, proxies)
+
+        if isinstance(timeout, tuple):
+            connect, read = timeout
+            timeout = TimeoutSauce(connect=connect, read=read)
+        elif not isinstance(timeout, TimeoutSauce):
+            timeout = TimeoutSauce(connect=timeout, read=timeout)
+
+        try:
+            conn = self.poolmanager.connection_from_url(request.url)
+            if request.url.startswith("https"):
+                self.cert_verify(conn, request.url, verify, cert)
+            resp = conn.urlopen(
+                method=request.method,
+                url=request.path_url,
+                body=body,
+                headers=request.headers,
+                redirect=False,
+                assert_same_host=False,
+                preload_content=False,
+                decode_content=False,
+                retries=self.max_retries,
+                timeout=timeout,
+            )
+        except (urllib3_exceptions.ProtocolError, socket.error) as err:
+            raise exceptions.ConnectionError(err, request=request)
+        except urllib3_exceptions.MaxRetryError as e:
+            reason = e.reason
+            if (isinstance(reason, urllib3_exceptions.ConnectTimeoutError) and
+                    not isinstance(reason, urllib3_exceptions.NewConnectionError)):
+                raise exceptions.ConnectTimeout(e, request=request)
+            if isinstance(reason, urllib3_exceptions.ResponseError):
+                raise exceptions.RetryError(e, request=request)
+            if isinstance(reason, urllib3_exceptions.SSLError):
+                raise exceptions.SSLError(e, request=request)
+            raise exceptions.ConnectionError(e, request=request)
+        except urllib3_exceptions.ClosedPoolError as e:
+            raise exceptions.ConnectionError(e, request=request)
+        except urllib3_exceptions.SSLError as e:
+            raise exceptions.SSLError(e, request=request)
+        except urllib3_exceptions.ReadTimeoutError as e:
+            raise exceptions.ReadTimeout(e, request=request)
+
+        return self.build_response(request, resp)
+
+
+class _HTTPXMessage(object):
+    """The response headers, as read by http.cookiejar (via requests)."""
+
+    def __init__(self, headers):
+        self.headers = headers
+
+    def get_all(self, name, default=None):
+        return self.headers.get_list(name) or default
+
+    getheaders = get_all  # Python 2 spelling
+
+
+class _HTTPXRaw(object):
+    """A file-like Response.raw over the decoded body of an httpx response."""
+
+    def __init__(self, response):
+        self.response = response
+        self._original_response = self
+        self.msg = _HTTPXMessage(response.headers)
+        self._chunks = response.iter_bytes()
+        self._buffer = b""
+
+    def read(self, amt=None, decode_content=None):
+        if amt is None:
+            data = self._buffer + b"".join(self._chunks)
+            self._buffer = b""
+            return data
+        while len(self._buffer) < amt:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        data, self._buffer = self._buffer[:amt], self._buffer[amt:]
+        return data
+
+    def close(self):
+        self.response.close()
+
+    def release_conn(self):
+        self.response.close()
+
+
+class HTTPXTransport(BaseAdapter):
+    """A transport adapter which sends requests with an httpx.Client."""
+
+    name = "httpx"
+
+    def __init__(self, pool_connections=10, pool_maxsize=10, pool_block=False,
+                 http2=True):
+        import httpx
+
+        super(HTTPXTransport, self).__init__()
+        self.httpx = httpx
+        self.http2 = http2
+        self.pool_maxsize = pool_maxsize
+        self.client = httpx.Client(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=None if not pool_block else pool_maxsize,
+                max_keepalive_connections=pool_maxsize,
+            ),
+        )
+
+    def _timeout(self, timeout):
+        if isinstance(timeout, tuple):
+            connect, read = timeout
+            return self.httpx.Timeout(read, connect=connect)
+        return self.httpx.Timeout(timeout)
+
+    def send(self, request, stream=False, timeout=None, verify=True,
+             cert=None, proxies=None):
+        httpx = self.httpx
+        req = self.client.build_request(
+            request.method, request.url,
+            headers=list(request.headers.items()),
+            content=request.body,
+            timeout=self._timeout(timeout),
+        )
+        try:
+            resp = self.client.send(req, stream=True)
+        except httpx.ConnectTimeout as e:
+            raise exceptions.ConnectTimeout(e, request=request)
+        except httpx.ReadTimeout as e:
+            raise exceptions.ReadTimeout(e, request=request)
+        except (httpx.TransportError, socket.error) as e:
+            raise exceptions.ConnectionError(e, request=request)
+
+        return self.build_response(request, resp)
+
+    def warm_up(self, url, connections=1, verify=True):
+        """Open connections to the host of url with concurrent HEAD requests.
+
+        httpx opens connections only to send requests, so this sends one
+        HEAD of the url per connection (just one over HTTP/2, where all
+        requests share a single connection). Return the number of requests
+        which succeeded.
+        """
+        count = 1 if self.http2 else min(connections, self.pool_maxsize)
+
+        def head(i):
+            try:
+                self.client.head(url).close()
+                return True
+            except (self.httpx.TransportError, socket.error):
+                return False
+
+        with ThreadPoolExecutor(max_workers=max(count, 1)) as executor:
+            return sum(executor.map(head, range(count)))
+
+    def build_response(self, req, resp):
+        """Return a requests.Response for the given httpx.Response."""
+        from requests.models import Response
+
+        response = Response()
+        response.status_code = resp.status_code
+        response.headers = CaseInsensitiveDict(resp.headers.multi_items())
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.raw = _HTTPXRaw(resp)
+        response.reason = resp.reason_phrase
+        response.url = req.url
+        response.request = req
+        response.connection = self
+        extract_cookies_to_jar(response.cookies, req, response.raw)
+        return response
+
+    def close(self):
+        self.client.close()
+
+
+TRANSPORTS = {
+    "requests": RequestsTransport,
+    "urllib3": Urllib3Transport,
+    "httpx": HTTPXTransport,
+}
+
+
+def make_transport(transport=None, **pool_kwargs):
+    """Return a new transport adapter.
+
+    The 'transport' may be the name of one of TRANSPORTS, or None for
+    the default, or a function (such as an adapter class) which will be
+    called with the given pool_kwargs: pool_connections, pool_maxsize and
+    pool_block.
+    """
+    if transport is None:
+        transport = "requests"
+    if isinstance(transport, six.string_types):
+        try:
+            transport = TRANSPORTS[transport]
+        except KeyError:
+            raise ValueError("Unknown transport %r; choose one of %s" %
+                             (transport, ", ".join(sorted(TRANSPORTS))))
+    return transport(**pool_kwargs)
@@ -44,7 +44,7 @@ You can also set initial filters or a weight, and alter or revoke permissions.
 See https://crunchio.atlassian.net/wiki/display/API/permissions for more info.
 """
 
-import json
+from pycrunch import jsonlib
 
 
 def invite(account, email, send_invite=None, url_base=None, id_method=None,
@@ -68,5 +68,5 @@ def invite(account, email, send_invite=None, url_base=None, id_method=None,
         body['account_permissions'] = account_permissions
 
     return account.users.post(
-        data=json.dumps({"element": "shoji:entity", "body": body})
+        data=jsonlib.dumps({"element": "shoji:entity", "body": body})
     ).headers['Location']
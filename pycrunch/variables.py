@@ -1,6 +1,6 @@
 import re
 
-from pycrunch import elements
+from pycrunch import elements, shoji
 
 VARIABLE_URL_REGEX = re.compile(
     r"^(http|https):\/\/(.*)\/api\/datasets\/([\w\d]+)\/variables\/([\w\d]+)"
@@ -30,3 +30,15 @@ def validate_variable_url(url):
     Checks if a given url matches the variable url regex or not.
     """
     return VARIABLE_URL_REGEX.match(url)
+
+
+class Variable(shoji.Entity):
+    """The shoji:entity of a dataset variable."""
+
+    url_pattern = r"datasets/[^/]+/variables/[^/]+/"
+
+
+class Subvariable(Variable):
+    """The shoji:entity of a subvariable of an array variable."""
+
+    url_pattern = r"datasets/[^/]+/variables/[^/]+/subvariables/[^/]+/"
@@ -42,6 +42,7 @@ setup_params = dict(
     author_email='dev@crunch.io',
     license='LGPL',
     install_requires=[
+        'futures; python_version < "3"',
         'requests>=2.3.0',
         'six',
     ],
@@ -61,7 +62,14 @@ setup_params = dict(
         'pycrunch': ['*.json', '*.csv']
     },
     extras_require={
-        'pandas': ['pandas']
+        'pandas': ['pandas'],
+        'async': ['aiohttp'],
+        'httpx': ['httpx[http2]; python_version >= "3.6"'],
+        'opentelemetry': ['opentelemetry-api; python_version >= "3.6"'],
+        'fastjson': [
+            'orjson; python_version >= "3.6"',
+            'ujson; python_version < "3.6"',
+        ],
     },
     zip_safe=True,
     entry_points={},